@@ -0,0 +1,130 @@
+"""Archival of terminal login challenges to compressed, append-only files.
+
+:func:`archive_login_challenges` walks approved/denied challenges older than
+``after_days`` in ``(created_at, id)`` keyset order. For each batch, in one
+short transaction, it:
+
+1. deletes the batch and gets the rows back (``DELETE ... RETURNING``),
+2. appends them as JSON lines to ``login_challenges-YYYYMMDD.jsonl.gz`` (one
+   file per ``created_at`` UTC day, one gzip member per batch), and
+3. fsyncs the files and commits.
+
+If writing fails, the delete rolls back, so nothing is lost. If the commit
+fails after the write, the rows stay in Postgres and are archived again on
+the next run. The archive is therefore at-least-once: deduplicate on ``id``
+when loading it.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from time import monotonic
+from uuid import UUID
+
+from app.config import Settings
+from app.repositories import login_challenges
+
+logger = logging.getLogger(__name__)
+
+_CURSOR_START = (datetime(1, 1, 1, tzinfo=timezone.utc), UUID(int=0))
+
+
+@dataclass(frozen=True)
+class ArchiveConfig:
+    directory: str = "archive"
+    # Must stay below LOGIN_CHALLENGE_RETENTION_DAYS, or partitions are dropped unarchived.
+    after_days: int = 7
+    batch_size: int = 1000
+    # Pause between batches to cap the I/O the job takes from the hot path.
+    pause: float = 0.0
+    max_batches: int | None = None
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ArchiveConfig":
+        return cls(
+            directory=settings.archive_dir,
+            after_days=settings.archive_after_days,
+            batch_size=settings.archive_batch_size,
+        )
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _append(directory: Path, rows: list[dict]) -> int:
+    by_day: dict[str, list[dict]] = {}
+    for row in rows:
+        day = row["created_at"].astimezone(timezone.utc).strftime("%Y%m%d")
+        by_day.setdefault(day, []).append(row)
+    written = 0
+    for day, day_rows in by_day.items():
+        payload = "".join(json.dumps(row, default=_encode) + "\n" for row in day_rows).encode("utf-8")
+        compressed = gzip.compress(payload)
+        with open(directory / f"login_challenges-{day}.jsonl.gz", "ab") as handle:
+            handle.write(compressed)
+            handle.flush()
+            os.fsync(handle.fileno())
+        written += len(compressed)
+    return written
+
+
+async def archive_login_challenges(pool, config: ArchiveConfig, now: datetime | None = None) -> dict:
+    """Move terminal challenges older than ``config.after_days`` to archive files.
+
+    Returns run statistics: rows, batches, compressed bytes, seconds and rows/s.
+    """
+    now = now or datetime.now(timezone.utc)
+    before = now - timedelta(days=config.after_days)
+    directory = Path(config.directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    cursor_created_at, cursor_id = _CURSOR_START
+    rows_total = 0
+    bytes_total = 0
+    batches = 0
+    started = monotonic()
+    async with pool.acquire() as conn:
+        while config.max_batches is None or batches < config.max_batches:
+            async with conn.transaction():
+                rows = await login_challenges.archive_batch(
+                    conn, before, cursor_created_at, cursor_id, config.batch_size
+                )
+                if not rows:
+                    break
+                # Blocking file I/O stays off the event loop; the transaction
+                # only commits once the batch is durable on disk.
+                bytes_total += await asyncio.to_thread(_append, directory, rows)
+            batches += 1
+            rows_total += len(rows)
+            cursor_created_at, cursor_id = rows[-1]["created_at"], rows[-1]["id"]
+            if len(rows) < config.batch_size:
+                break
+            if config.pause:
+                await asyncio.sleep(config.pause)
+
+    elapsed = monotonic() - started
+    summary = {
+        "rows": rows_total,
+        "batches": batches,
+        "bytes": bytes_total,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_total / elapsed, 1) if elapsed > 0 else 0.0,
+        "before": before.isoformat(),
+    }
+    logger.info(
+        "archive login_challenges rows=%s batches=%s bytes=%s seconds=%s rows_per_second=%s",
+        summary["rows"],
+        summary["batches"],
+        summary["bytes"],
+        summary["seconds"],
+        summary["rows_per_second"],
+    )
+    return summary
@@ -0,0 +1,87 @@
+"""Bounded in-process caches for hot, rarely changing lookups.
+
+:class:`TTLCache` is an LRU with an optional per-entry time to live. It is
+meant for one event loop: no locking, and every operation is O(1).
+
+Read-through callers must not let a slow read put back a value that an
+invalidation has already removed:
+
+1. Take :attr:`TTLCache.generation` before reading the source.
+2. Pass it to :meth:`TTLCache.put`.
+
+The put is dropped if any invalidation ran in between.
+"""
+
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable, Optional
+
+# Returned by get() for absent or expired keys, so None can be cached.
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, max_size: int, ttl: Optional[float] = None) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._stale_puts = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self._misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at and expires_at <= monotonic():
+            del self._data[key]
+            self._misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        if self.max_size <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            self._stale_puts += 1
+            return
+        expires_at = monotonic() + self.ttl if self.ttl else 0.0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self._evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self.generation += 1
+        self._invalidations += 1
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._invalidations += 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+            "stale_puts": self._stale_puts,
+        }
@@ -9,10 +9,76 @@ from dotenv import load_dotenv
 class Settings:
     app_env: str
     log_level: str
-    database_url: str
+    storage_backend: str
+    database_url: Optional[str]
+    sqlite_path: str
+    sqlite_read_connections: int
+    sqlite_write_batch_size: int
+    database_read_url: Optional[str]
+    database_listen_url: Optional[str]
     redis_url: Optional[str]
+    challenge_store: str
+    redis_login_challenge_retention: float
+    redis_max_connections: int
     master_key: str
     recovery_pepper: str
+    db_pool_min_size: int
+    db_pool_max_size: int
+    db_pool_max_queries: int
+    db_pool_max_lifetime: float
+    db_pool_max_idle: float
+    db_pool_acquire_timeout: Optional[float]
+    db_statement_cache_size: int
+    db_pool_mode: str
+    db_pgbouncer_prepared_statements: bool
+    db_replica_max_lag: float
+    db_read_your_writes_window: float
+    partition_premake_days: int
+    device_challenge_retention_days: int
+    login_challenge_retention_days: int
+    partition_maintenance_interval: float
+    reaper_interval: float
+    reaper_batch_size: int
+    reaper_max_batches: int
+    archive_dir: str
+    archive_after_days: int
+    archive_batch_size: int
+    rp_cache_size: int
+    rp_cache_ttl: float
+    key_cache_size: int
+    key_cache_ttl: float
+    totp_cache_size: int
+    totp_cache_ttl: float
+    email_filter_fp_rate: float
+    email_negative_cache_size: int
+    email_negative_cache_ttl: float
+
+
+def _int_env(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise RuntimeError(f"{name} must be an integer")
+
+
+def _float_env(name: str, default: Optional[float]) -> Optional[float]:
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        raise RuntimeError(f"{name} must be a number")
+
+
+def _bool_env(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
 
 
 def load_settings() -> Settings:
@@ -22,22 +88,101 @@ def load_settings() -> Settings:
     app_env = os.getenv("APP_ENV", "development")
     log_level = os.getenv("LOG_LEVEL", "INFO")
     database_url = os.getenv("DATABASE_URL")
+    database_read_url = os.getenv("DATABASE_READ_URL") or None
+    # LISTEN needs a session; set this when DATABASE_URL is a transaction-mode bouncer.
+    database_listen_url = os.getenv("DATABASE_LISTEN_URL") or database_url
     redis_url = os.getenv("REDIS_URL")
     master_key = os.getenv("MASTER_KEY")
     recovery_pepper = os.getenv("RECOVERY_PEPPER")
 
-    if not database_url:
+    # "memory" keeps everything in process, for profiling without a database;
+    # "sqlite" is a single-file database for single-node deployments.
+    storage_backend = os.getenv("STORAGE_BACKEND", "postgres").strip().lower()
+    if storage_backend not in ("postgres", "memory", "sqlite"):
+        raise RuntimeError("STORAGE_BACKEND must be 'postgres', 'memory' or 'sqlite'")
+
+    if storage_backend == "postgres" and not database_url:
         raise RuntimeError("DATABASE_URL is not set")
+
+    # "redis" moves device and login challenges off Postgres.
+    challenge_store = os.getenv("CHALLENGE_STORE", "postgres").strip().lower()
+    if challenge_store not in ("postgres", "redis"):
+        raise RuntimeError("CHALLENGE_STORE must be 'postgres' or 'redis'")
+    if challenge_store == "redis" and storage_backend != "postgres":
+        raise RuntimeError("CHALLENGE_STORE=redis requires STORAGE_BACKEND=postgres")
+    if challenge_store == "redis" and not redis_url:
+        raise RuntimeError("REDIS_URL is not set")
     if not master_key:
         raise RuntimeError("MASTER_KEY is not set")
     if not recovery_pepper:
         raise RuntimeError("RECOVERY_PEPPER is not set")
 
+    # Pool sizing: workers * DB_POOL_MAX_SIZE must stay below Postgres max_connections.
+    db_pool_min_size = _int_env("DB_POOL_MIN_SIZE", 1)
+    db_pool_max_size = _int_env("DB_POOL_MAX_SIZE", 5)
+    if db_pool_min_size < 0 or db_pool_max_size < 1 or db_pool_min_size > db_pool_max_size:
+        raise RuntimeError("DB_POOL_MIN_SIZE/DB_POOL_MAX_SIZE are inconsistent")
+    acquire_timeout = _float_env("DB_POOL_ACQUIRE_TIMEOUT", 5.0)
+    # "direct" talks to Postgres (or a session-mode bouncer); "pgbouncer" is
+    # for PgBouncer in transaction-pooling mode.
+    db_pool_mode = os.getenv("DB_POOL_MODE", "direct").strip().lower()
+    if db_pool_mode not in ("direct", "pgbouncer"):
+        raise RuntimeError("DB_POOL_MODE must be 'direct' or 'pgbouncer'")
+
+    login_challenge_retention_days = _int_env("LOGIN_CHALLENGE_RETENTION_DAYS", 30)
+    archive_after_days = _int_env("ARCHIVE_AFTER_DAYS", 7)
+    # Partitions past retention are dropped whether archived or not.
+    if archive_after_days >= login_challenge_retention_days:
+        raise RuntimeError("ARCHIVE_AFTER_DAYS must be less than LOGIN_CHALLENGE_RETENTION_DAYS")
+
+    email_filter_fp_rate = _float_env("EMAIL_FILTER_FP_RATE", 0.01)
+    if not 0 < email_filter_fp_rate < 1:
+        raise RuntimeError("EMAIL_FILTER_FP_RATE must be between 0 and 1")
+
     return Settings(
         app_env=app_env,
         log_level=log_level,
+        storage_backend=storage_backend,
         database_url=database_url,
+        sqlite_path=os.getenv("SQLITE_PATH", "zt_totp.sqlite3"),
+        sqlite_read_connections=_int_env("SQLITE_READ_CONNECTIONS", 4),
+        sqlite_write_batch_size=_int_env("SQLITE_WRITE_BATCH_SIZE", 128),
+        database_read_url=database_read_url,
+        database_listen_url=database_listen_url,
         redis_url=redis_url,
+        challenge_store=challenge_store,
+        redis_login_challenge_retention=_float_env("REDIS_LOGIN_CHALLENGE_RETENTION", 3600.0),
+        redis_max_connections=_int_env("REDIS_MAX_CONNECTIONS", 20),
         master_key=master_key,
         recovery_pepper=recovery_pepper,
+        db_pool_min_size=db_pool_min_size,
+        db_pool_max_size=db_pool_max_size,
+        db_pool_max_queries=_int_env("DB_POOL_MAX_QUERIES", 50000),
+        db_pool_max_lifetime=_float_env("DB_POOL_MAX_LIFETIME", 3600.0),
+        db_pool_max_idle=_float_env("DB_POOL_MAX_IDLE", 300.0),
+        db_pool_acquire_timeout=acquire_timeout if acquire_timeout and acquire_timeout > 0 else None,
+        db_statement_cache_size=_int_env("DB_STATEMENT_CACHE_SIZE", 100),
+        db_pool_mode=db_pool_mode,
+        db_pgbouncer_prepared_statements=_bool_env("DB_PGBOUNCER_PREPARED_STATEMENTS", False),
+        db_replica_max_lag=_float_env("DB_REPLICA_MAX_LAG", 1.0),
+        db_read_your_writes_window=_float_env("DB_READ_YOUR_WRITES_WINDOW", 5.0),
+        partition_premake_days=_int_env("PARTITION_PREMAKE_DAYS", 7),
+        device_challenge_retention_days=_int_env("DEVICE_CHALLENGE_RETENTION_DAYS", 1),
+        login_challenge_retention_days=login_challenge_retention_days,
+        partition_maintenance_interval=_float_env("PARTITION_MAINTENANCE_INTERVAL", 3600.0),
+        reaper_interval=_float_env("REAPER_INTERVAL", 15.0),
+        reaper_batch_size=_int_env("REAPER_BATCH_SIZE", 500),
+        reaper_max_batches=_int_env("REAPER_MAX_BATCHES", 20),
+        archive_dir=os.getenv("ARCHIVE_DIR", "archive"),
+        archive_after_days=archive_after_days,
+        archive_batch_size=_int_env("ARCHIVE_BATCH_SIZE", 1000),
+        rp_cache_size=_int_env("RP_CACHE_SIZE", 1024),
+        rp_cache_ttl=_float_env("RP_CACHE_TTL", 300.0),
+        key_cache_size=_int_env("KEY_CACHE_SIZE", 10000),
+        key_cache_ttl=_float_env("KEY_CACHE_TTL", 600.0),
+        totp_cache_size=_int_env("TOTP_CACHE_SIZE", 10000),
+        totp_cache_ttl=_float_env("TOTP_CACHE_TTL", 120.0),
+        email_filter_fp_rate=email_filter_fp_rate,
+        email_negative_cache_size=_int_env("EMAIL_NEGATIVE_CACHE_SIZE", 100000),
+        email_negative_cache_ttl=_float_env("EMAIL_NEGATIVE_CACHE_TTL", 30.0),
     )
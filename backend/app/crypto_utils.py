@@ -1,5 +1,6 @@
 import base64
 import hashlib
+from functools import lru_cache
 
 from cryptography.exceptions import InvalidSignature
 from cryptography.fernet import Fernet
@@ -8,6 +9,8 @@ from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
 
 
+# Fernet objects are immutable; building one decodes the key and sets up both ciphers.
+@lru_cache(maxsize=8)
 def fernet_from_key(key: str) -> Fernet:
     raw = key.encode("utf-8")
     return Fernet(raw)
@@ -37,46 +40,72 @@ def build_device_proof_message(
     return payload.encode("utf-8")
 
 
-def verify_ed25519_signature(
-    public_key_b64: str,
-    message: bytes,
-    signature_b64: str,
-) -> bool:
+def load_ed25519_public_key(public_key_b64: str) -> Ed25519PublicKey | None:
+    """Parse a raw (32-byte) or DER-encoded Ed25519 key; None if it is not one."""
     try:
         public_key_bytes = base64.b64decode(public_key_b64)
+        if len(public_key_bytes) == 32:
+            return Ed25519PublicKey.from_public_bytes(public_key_bytes)
+        key = serialization.load_der_public_key(public_key_bytes)
+    except (ValueError, TypeError):
+        return None
+    return key if isinstance(key, Ed25519PublicKey) else None
+
+
+def load_p256_public_key(public_key_b64: str) -> ec.EllipticCurvePublicKey | None:
+    """Parse a DER-encoded EC public key; None if it is not one."""
+    try:
+        key = serialization.load_der_public_key(base64.b64decode(public_key_b64))
+    except (ValueError, TypeError):
+        return None
+    return key if isinstance(key, ec.EllipticCurvePublicKey) else None
+
+
+def load_device_public_key(key_type: str, public_key_b64: str):
+    """Parse a stored device key into a key object, or None if it cannot verify anything."""
+    if key_type == "ed25519":
+        return load_ed25519_public_key(public_key_b64)
+    if key_type == "p256":
+        return load_p256_public_key(public_key_b64)
+    return None
+
+
+def verify_with_public_key(key, message: bytes, signature_b64: str) -> bool:
+    """Verify with a key object from :func:`load_device_public_key`."""
+    try:
         signature_bytes = base64.b64decode(signature_b64)
     except (ValueError, TypeError):
         return False
 
     try:
-        if len(public_key_bytes) == 32:
-            key = Ed25519PublicKey.from_public_bytes(public_key_bytes)
+        if isinstance(key, Ed25519PublicKey):
+            key.verify(signature_bytes, message)
+        elif isinstance(key, ec.EllipticCurvePublicKey):
+            key.verify(signature_bytes, message, ec.ECDSA(hashes.SHA256()))
         else:
-            key = serialization.load_der_public_key(public_key_bytes)
-            if not isinstance(key, Ed25519PublicKey):
-                return False
-        key.verify(signature_bytes, message)
+            return False
         return True
     except (InvalidSignature, ValueError):
         return False
 
 
-def verify_p256_signature(
+def verify_ed25519_signature(
     public_key_b64: str,
     message: bytes,
     signature_b64: str,
 ) -> bool:
-    try:
-        public_key_bytes = base64.b64decode(public_key_b64)
-        signature_bytes = base64.b64decode(signature_b64)
-    except (ValueError, TypeError):
+    key = load_ed25519_public_key(public_key_b64)
+    if key is None:
         return False
+    return verify_with_public_key(key, message, signature_b64)
 
-    try:
-        key = serialization.load_der_public_key(public_key_bytes)
-        if not isinstance(key, ec.EllipticCurvePublicKey):
-            return False
-        key.verify(signature_bytes, message, ec.ECDSA(hashes.SHA256()))
-        return True
-    except (InvalidSignature, ValueError):
+
+def verify_p256_signature(
+    public_key_b64: str,
+    message: bytes,
+    signature_b64: str,
+) -> bool:
+    key = load_p256_public_key(public_key_b64)
+    if key is None:
         return False
+    return verify_with_public_key(key, message, signature_b64)
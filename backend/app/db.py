@@ -1,34 +1,420 @@
-from typing import Optional
+import asyncio
+import logging
+import random
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from time import monotonic
+from typing import AsyncIterator, Optional
 
 import asyncpg
 
-_pool: Optional[asyncpg.Pool] = None
+from app import statements
+from app.config import Settings
+from app.metrics import Histogram
+from app.storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    min_size: int = 1
+    max_size: int = 5
+    # Replace a connection after this many queries (asyncpg-native lifetime bound).
+    max_queries: int = 50000
+    # Retire a connection on its first release after it has been open this
+    # many seconds, less up to ``lifetime_jitter`` of it; 0 disables.
+    max_lifetime: float = 3600.0
+    lifetime_jitter: float = 0.1
+    # Close connections idle for longer than this many seconds.
+    max_idle: float = 300.0
+    acquire_timeout: Optional[float] = 5.0
+    statement_cache_size: int = 100
+    # "pgbouncer" is for PgBouncer in transaction-pooling mode: a client
+    # connection may land on a different server connection per transaction.
+    mode: str = "direct"
+    # PgBouncer >= 1.21 with max_prepared_statements > 0 tracks protocol-level
+    # prepared statements itself, so named statements stay usable behind it.
+    pgbouncer_prepared_statements: bool = False
+    # Reads fall back to the primary while the replica is further behind than this.
+    replica_max_lag: float = 1.0
+    replica_check_interval: float = 2.0
+    # Reads keyed on something this worker just wrote stay on the primary this long.
+    read_your_writes_window: float = 5.0
+
+    @property
+    def named_statements(self) -> bool:
+        return self.mode != "pgbouncer" or self.pgbouncer_prepared_statements
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "PoolConfig":
+        return cls(
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            max_queries=settings.db_pool_max_queries,
+            max_lifetime=settings.db_pool_max_lifetime,
+            max_idle=settings.db_pool_max_idle,
+            acquire_timeout=settings.db_pool_acquire_timeout,
+            statement_cache_size=settings.db_statement_cache_size,
+            mode=settings.db_pool_mode,
+            pgbouncer_prepared_statements=settings.db_pgbouncer_prepared_statements,
+            replica_max_lag=settings.db_replica_max_lag,
+            read_your_writes_window=settings.db_read_your_writes_window,
+        )
+
+
+class PlainConnection(asyncpg.Connection):
+    """Connection without the registry's prepared statements.
+
+    Unlike ``asyncpg.Connection`` it can carry a ``retire_at`` deadline.
+    """
+
+
+class InstrumentedPool:
+    """asyncpg pool wrapper that records acquire waits and recycles aged connections.
+
+    Repositories only use the query helpers below, so every acquire made on
+    their behalf goes through :meth:`acquire` and is measured. Each connection
+    gets its own jittered ``retire_at`` when it opens and is closed on the
+    first release after it, so connections opened together are replaced one
+    at a time rather than all at once.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, config: PoolConfig) -> None:
+        self._pool = pool
+        self._config = config
+        self._acquire_wait_ms = Histogram()
+        self._waiting = 0
+        self._timeouts = 0
+        self._recycles = 0
+        self.router: Optional["ReplicaRouter"] = None
+
+    def route_read(self, key: Optional[str] = None) -> "InstrumentedPool":
+        """Pick the pool a read-only statement should run on."""
+        if self.router is None:
+            return self
+        return self.router.choose(self, key)
+
+    async def _retire_if_aged(self, conn: asyncpg.Connection) -> None:
+        retire_at = getattr(conn, "retire_at", None)
+        if retire_at is None or monotonic() < retire_at:
+            return
+        self._recycles += 1
+        # Closing hands the slot back to the pool, which reconnects (and runs
+        # ``init`` again) on a later acquire; the release below is then a no-op.
+        try:
+            await conn.close(timeout=self._config.acquire_timeout)
+        except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as exc:
+            # close() aborts the connection when it fails, so it is gone either way.
+            logger.warning("closing aged connection failed error=%s", exc)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        started = monotonic()
+        self._waiting += 1
+        try:
+            conn = await self._pool.acquire(timeout=self._config.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise
+        finally:
+            self._waiting -= 1
+            self._acquire_wait_ms.observe((monotonic() - started) * 1000)
+        try:
+            yield conn
+        finally:
+            await self._retire_if_aged(conn)
+            await self._pool.release(conn)
+
+    async def execute(self, query: str, *args) -> str:
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args)
+
+    async def executemany(self, query: str, args) -> None:
+        async with self.acquire() as conn:
+            await conn.executemany(query, args)
+
+    async def fetch(self, query: str, *args) -> list:
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args) -> Optional[asyncpg.Record]:
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args)
+
+    async def fetchval(self, query: str, *args):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args)
+
+    async def close(self) -> None:
+        await self._pool.close()
+
+    def stats(self) -> dict:
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "mode": self._config.mode,
+            "named_statements": self._config.named_statements,
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "waiting": self._waiting,
+            "acquire_timeouts": self._timeouts,
+            "lifetime_recycles": self._recycles,
+            "acquire_wait_ms": self._acquire_wait_ms.snapshot(),
+        }
+
+
+# A caught-up standby has replayed everything it received; only then is
+# "now - last replay" meaningless, so report zero lag for it.
+_REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class ReplicaRouter:
+    """Routes reads to the replica while it is healthy and fresh enough.
+
+    Lag is sampled in the background at most every ``replica_check_interval``
+    seconds. Keys noted via :meth:`note_write` pin reads to the primary for
+    ``read_your_writes_window`` seconds; pins are per worker, so cross-worker
+    freshness is bounded by ``replica_max_lag``.
+    """
+
+    _MAX_PINS = 10000
+
+    def __init__(self, replica: InstrumentedPool, config: PoolConfig) -> None:
+        self.replica = replica
+        self._config = config
+        self._lag: Optional[float] = None
+        self._checked_at = 0.0
+        self._check_task: Optional[asyncio.Task] = None
+        self._pins: dict[str, float] = {}
+        self._replica_reads = 0
+        self._primary_reads = 0
+        self._pinned_reads = 0
+        self._check_failures = 0
+
+    def healthy(self) -> bool:
+        return self._lag is not None and self._lag <= self._config.replica_max_lag
+
+    def note_write(self, keys) -> None:
+        until = monotonic() + self._config.read_your_writes_window
+        if len(self._pins) >= self._MAX_PINS:
+            now = monotonic()
+            self._pins = {key: expiry for key, expiry in self._pins.items() if expiry > now}
+        for key in keys:
+            self._pins[key] = until
+
+    def _pinned(self, key: Optional[str]) -> bool:
+        if key is None:
+            return False
+        until = self._pins.get(key)
+        if until is None:
+            return False
+        if until <= monotonic():
+            del self._pins[key]
+            return False
+        return True
+
+    def choose(self, primary: InstrumentedPool, key: Optional[str]) -> InstrumentedPool:
+        self._schedule_check()
+        if self._pinned(key):
+            self._pinned_reads += 1
+            return primary
+        if not self.healthy():
+            self._primary_reads += 1
+            return primary
+        self._replica_reads += 1
+        return self.replica
+
+    def _schedule_check(self) -> None:
+        if self._check_task is not None and not self._check_task.done():
+            return
+        if monotonic() - self._checked_at < self._config.replica_check_interval:
+            return
+        self._check_task = asyncio.get_running_loop().create_task(self.check_lag())
+
+    async def check_lag(self) -> None:
+        self._checked_at = monotonic()
+        try:
+            lag = await self.replica.fetchval(_REPLICA_LAG_SQL)
+            self._lag = float(lag)
+        except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as exc:
+            # An unreachable replica is treated as infinitely behind.
+            self._lag = None
+            self._check_failures += 1
+            logger.warning("replica lag check failed error=%s", exc)
+
+    def stats(self) -> dict:
+        return {
+            "lag_seconds": self._lag,
+            "healthy": self.healthy(),
+            "replica_reads": self._replica_reads,
+            "primary_fallback_reads": self._primary_reads,
+            "pinned_reads": self._pinned_reads,
+            "pinned_keys": len(self._pins),
+            "lag_check_failures": self._check_failures,
+            "pool": self.replica.stats(),
+        }
+
+
+_pool: Optional[InstrumentedPool] = None
+_backend: Optional[StorageBackend] = None
 _dsn: Optional[str] = None
+_read_dsn: Optional[str] = None
+_config: PoolConfig = PoolConfig()
 
 
-def initialize(dsn: str) -> None:
-    global _dsn
+def initialize(
+    dsn: str,
+    config: Optional[PoolConfig] = None,
+    read_dsn: Optional[str] = None,
+) -> None:
+    global _dsn, _read_dsn, _config
     # Explicit init prevents hidden env lookups in lower layers.
     _dsn = dsn
+    _read_dsn = read_dsn
+    _config = config or PoolConfig()
+
+
+def use_storage(backend: Optional[StorageBackend]) -> None:
+    """Serve every repository call from ``backend`` instead of Postgres; None restores Postgres."""
+    global _backend
+    _backend = backend
+
+
+def storage_backend() -> Optional[StorageBackend]:
+    return _backend
+
+
+def _with_deadline(init):
+    """Wrap a pool ``init`` callback so each new connection gets a ``retire_at``."""
+    lifetime = _config.max_lifetime
+    if not lifetime:
+        return init
+
+    async def setup(conn: asyncpg.Connection) -> None:
+        # Jitter spreads the reconnects of connections opened at the same time.
+        conn.retire_at = monotonic() + lifetime * (1 - random.random() * _config.lifetime_jitter)
+        if init is not None:
+            await init(conn)
 
+    return setup
 
-async def connect() -> asyncpg.Pool:
+
+async def _create_pool(dsn: str, init) -> InstrumentedPool:
+    if _config.named_statements:
+        connection_class = statements.StatementConnection
+        statement_cache_size = _config.statement_cache_size
+    else:
+        # Named statements would be prepared on one server connection and
+        # executed on another. Plain connections make the registry fall back
+        # to unnamed statements, and a zero cache stops asyncpg naming its own.
+        connection_class = PlainConnection
+        statement_cache_size = 0
+        init = None
+    raw_pool = await asyncpg.create_pool(
+        dsn=dsn,
+        min_size=_config.min_size,
+        max_size=_config.max_size,
+        max_queries=_config.max_queries,
+        max_inactive_connection_lifetime=_config.max_idle,
+        statement_cache_size=statement_cache_size,
+        connection_class=connection_class,
+        init=_with_deadline(init),
+    )
+    return InstrumentedPool(raw_pool, _config)
+
+
+async def connect() -> InstrumentedPool:
     global _pool
+    if _backend is not None:
+        return _backend
     if _dsn is None:
         raise RuntimeError("Database DSN not initialized")
     if _pool is None:
-        _pool = await asyncpg.create_pool(dsn=_dsn, min_size=1, max_size=5)
+        pool = await _create_pool(_dsn, statements.prepare_connection)
+        if _read_dsn:
+            replica = await _create_pool(_read_dsn, statements.prepare_read_connection)
+            pool.router = ReplicaRouter(replica, _config)
+            await pool.router.check_lag()
+        _pool = pool
     return _pool
 
 
 async def close() -> None:
     global _pool
+    if _backend is not None:
+        await _backend.close()
     if _pool is not None:
+        if _pool.router is not None:
+            await _pool.router.replica.close()
         await _pool.close()
         _pool = None
 
 
+def note_write(*keys: str) -> None:
+    """Pin reads keyed on ``keys`` to the primary right after writing them."""
+    if _pool is not None and _pool.router is not None:
+        _pool.router.note_write(keys)
+
+
+@asynccontextmanager
+async def unit_of_work(
+    transaction: bool = False,
+    readonly: bool = False,
+    sticky: Optional[str] = None,
+) -> AsyncIterator[asyncpg.Connection]:
+    """Hold one pooled connection for the duration of a request.
+
+    Repository functions accept the yielded connection in place of the pool,
+    so a handler pays for a single acquire/release no matter how many queries
+    it runs. With ``transaction=True`` the queries also commit or roll back
+    together. ``readonly=True`` lets a handler that never writes run on the
+    replica; ``sticky`` is the read-your-writes key that keeps it on the
+    primary right after a related write.
+
+    On a storage backend the backend itself is yielded. Each statement is
+    atomic there, but ``transaction=True`` does not roll earlier statements
+    back.
+    """
+    if transaction and readonly:
+        raise ValueError("read-only units of work cannot open a transaction")
+    if _backend is not None:
+        yield _backend
+        return
+    pool = await connect()
+    if readonly:
+        pool = pool.route_read(sticky)
+    async with pool.acquire() as conn:
+        if not transaction:
+            yield conn
+            return
+        async with conn.transaction():
+            yield conn
+
+
 async def ping() -> None:
+    if _backend is not None:
+        return
     pool = await connect()
     async with pool.acquire() as conn:
         await conn.execute("SELECT 1")
+
+
+def pool_stats() -> dict:
+    if _backend is not None:
+        return _backend.stats()
+    if _pool is None:
+        return {"status": "not_connected"}
+    stats = _pool.stats()
+    if _pool.router is not None:
+        stats["replica"] = _pool.router.stats()
+    return stats
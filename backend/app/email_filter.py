@@ -0,0 +1,255 @@
+"""Per-worker filter that turns away unknown emails without a database query.
+
+``/login``, ``/login-form/submit`` and ``/login/recover`` start with a lookup
+by email. Under credential stuffing most of those emails do not exist, and
+each still costs a query and a pool connection. Two structures answer
+"certainly no such user" first:
+
+- A Bloom filter holding every user's email. It is rebuilt from ``users``
+  once the invalidation listener connects (and again on every reconnect).
+  Inserts are added as they happen: locally by the request that created the
+  user, and on every worker by the ``users`` trigger in
+  ``db/migrations/012_user_insert_invalidation.sql``. A bulk insert such as
+  the seeder's ``COPY`` sends one event for the whole statement, and that
+  event triggers a rebuild.
+- A short-TTL cache of emails the database has just reported missing. It
+  catches what the filter lets through: its false positives, and users that
+  were deleted.
+
+A Bloom filter has no false negatives only while it has seen every insert.
+So, like the other caches, it is used only while the listener is connected
+and a rebuild has finished. Otherwise every lookup goes to the database.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional
+
+from app import db, invalidation
+from app.cache import MISSING, TTLCache
+from app.config import Settings
+from app.repositories import users
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Bloom filter over strings, sized for ``capacity`` items at ``fp_rate``."""
+
+    def __init__(self, capacity: int, fp_rate: float) -> None:
+        self.capacity = max(capacity, 1)
+        self.fp_rate = fp_rate
+        self.bits = max(64, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+        # Per-filter salt, so nobody can precompute emails that collide.
+        self._salt = os.urandom(16)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16, salt=self._salt).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.bits
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def expected_fp_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._array)
+
+
+@dataclass(frozen=True)
+class EmailFilterConfig:
+    fp_rate: float = 0.01
+    # Room for growth before the filter is rebuilt larger.
+    headroom: float = 2.0
+    min_capacity: int = 10000
+    page_size: int = 10000
+    negative_size: int = 100000
+    negative_ttl: float = 30.0
+    retry_delay: float = 5.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "EmailFilterConfig":
+        return cls(
+            fp_rate=settings.email_filter_fp_rate,
+            negative_size=settings.email_negative_cache_size,
+            negative_ttl=settings.email_negative_cache_ttl,
+        )
+
+
+_config = EmailFilterConfig()
+_filter: Optional[BloomFilter] = None
+# The filter being built; inserts heard meanwhile go into both.
+_building: Optional[BloomFilter] = None
+_rebuild_task: Optional[asyncio.Task] = None
+_negative = TTLCache(_config.negative_size, _config.negative_ttl)
+_counters = {
+    "rejected": 0,
+    "false_positives": 0,
+    "bypassed": 0,
+    "rebuilds": 0,
+    "rebuild_errors": 0,
+}
+_last_rebuild_ms = 0.0
+
+
+def configure(config: EmailFilterConfig) -> None:
+    global _config, _negative
+    _config = config
+    _negative = TTLCache(config.negative_size, config.negative_ttl)
+
+
+def _serving() -> bool:
+    return _filter is not None and invalidation.listening()
+
+
+def excluded(email: str) -> bool:
+    """True when there is certainly no user with this email."""
+    if not _serving():
+        _counters["bypassed"] += 1
+        return False
+    if email not in _filter or _negative.get(email) is not MISSING:
+        _counters["rejected"] += 1
+        return True
+    return False
+
+
+def generation() -> int:
+    """Take before the lookup whose miss is passed to :func:`note_missing`."""
+    return _negative.generation
+
+
+def note_missing(email: str, generation: int) -> None:
+    """The database has no user with ``email``; remember that for a short while."""
+    if not _serving():
+        return
+    _counters["false_positives"] += 1
+    _negative.put(email, True, generation)
+
+
+def add(email: str) -> None:
+    """Record a new user's email."""
+    _negative.pop(email)
+    for bloom in (_filter, _building):
+        if bloom is not None:
+            bloom.add(email)
+    if _filter is not None and _building is None and _filter.count > _filter.capacity:
+        # Still correct, but the false-positive rate climbs; resize.
+        _schedule_rebuild(keep_serving=True)
+
+
+def on_invalidate(event: Optional[dict]) -> None:
+    """``invalidation`` subscriber for the users table."""
+    if event is not None and event.get("key"):
+        add(event["key"])
+        return
+    # A reconnect (inserts may have been missed) or a bulk insert.
+    _negative.clear()
+    _schedule_rebuild(keep_serving=False)
+
+
+def _schedule_rebuild(keep_serving: bool) -> None:
+    global _filter, _rebuild_task
+    if not keep_serving:
+        _filter = None
+    if _rebuild_task is not None and not _rebuild_task.done():
+        _rebuild_task.cancel()
+    _rebuild_task = asyncio.get_running_loop().create_task(_rebuild())
+
+
+async def _rebuild() -> None:
+    global _filter, _building, _last_rebuild_ms
+    while True:
+        started = monotonic()
+        bloom = None
+        try:
+            pool = await db.connect()
+            estimate = await users.estimate_count(pool)
+            current = _filter.count if _filter is not None else 0
+            capacity = int(max(estimate, current, _config.min_capacity) * _config.headroom)
+            bloom = _building = BloomFilter(capacity, _config.fp_rate)
+            after = ""
+            while True:
+                emails = await users.list_emails_after(pool, after, _config.page_size)
+                for email in emails:
+                    bloom.add(email)
+                if len(emails) < _config.page_size:
+                    break
+                after = emails[-1]
+        except Exception:
+            # Lookups bypass the filter meanwhile; retry rather than give up.
+            _counters["rebuild_errors"] += 1
+            logger.exception("email filter rebuild failed")
+            await asyncio.sleep(_config.retry_delay)
+            continue
+        finally:
+            # A cancelled rebuild must not drop the one that replaced it.
+            if _building is bloom:
+                _building = None
+        _filter = bloom
+        _counters["rebuilds"] += 1
+        _last_rebuild_ms = (monotonic() - started) * 1000
+        logger.info(
+            "email filter rebuilt emails=%s bits=%s duration_ms=%.0f",
+            bloom.count,
+            bloom.bits,
+            _last_rebuild_ms,
+        )
+        if bloom.count <= bloom.capacity:
+            return
+        # The planner estimate was stale; size again from the real count.
+
+
+async def stop() -> None:
+    global _rebuild_task
+    if _rebuild_task is None:
+        return
+    _rebuild_task.cancel()
+    try:
+        await _rebuild_task
+    except asyncio.CancelledError:
+        pass
+    _rebuild_task = None
+
+
+def stats() -> dict:
+    # Of the lookups for unknown emails, the share that still reached the
+    # database: Bloom false positives not yet in the negative cache.
+    unknown = _counters["rejected"] + _counters["false_positives"]
+    filter_stats = {"ready": _filter is not None, "building": _building is not None}
+    if _filter is not None:
+        filter_stats.update(
+            {
+                "emails": _filter.count,
+                "capacity": _filter.capacity,
+                "bits": _filter.bits,
+                "hashes": _filter.hashes,
+                "memory_bytes": _filter.memory_bytes,
+                "target_fp_rate": _filter.fp_rate,
+                "expected_fp_rate": round(_filter.expected_fp_rate(), 6),
+            }
+        )
+    return {
+        **filter_stats,
+        **_counters,
+        "observed_fp_rate": round(_counters["false_positives"] / unknown, 6) if unknown else 0.0,
+        "last_rebuild_ms": round(_last_rebuild_ms, 1),
+        "negative_cache": _negative.stats(),
+    }
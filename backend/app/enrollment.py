@@ -1,17 +1,8 @@
 from pydantic import BaseModel, EmailStr, Field
 
-from app import db
-from app.models import (
-    DeviceCreate,
-    DeviceKeyCreate,
-    DeviceKeyOut,
-    DeviceOut,
-    RelyingPartyCreate,
-    RelyingPartyOut,
-    UserCreate,
-    UserOut,
-)
-from app.repositories import device_keys, devices, relying_parties, users
+from app import db, email_filter
+from app.models import DeviceKeyOut, DeviceOut, RelyingPartyOut, UserOut
+from app.repositories import enrollments
 
 
 class EnrollmentRequest(BaseModel):
@@ -33,36 +24,24 @@ class EnrollmentResponse(BaseModel):
 
 async def enroll(payload: EnrollmentRequest) -> EnrollmentResponse:
     pool = await db.connect()
-
-    # This is a placeholder flow to exercise the data model end-to-end.
-    user = await users.get_by_email(pool, payload.email)
-    if user is None:
-        user = await users.create(pool, UserCreate(email=payload.email))
-
-    device = await devices.create(
+    user, device, rp, device_key = await enrollments.enroll(
         pool,
-        DeviceCreate(
-            user_id=user.id,
-            device_label=payload.device_label,
-            platform=payload.platform,
-        ),
+        email=payload.email,
+        device_label=payload.device_label,
+        platform=payload.platform,
+        rp_id=payload.rp_id,
+        rp_display_name=payload.rp_display_name,
+        key_type=payload.key_type,
+        public_key=payload.public_key,
     )
-    rp = await relying_parties.get_by_rp_id(pool, payload.rp_id)
-    if rp is None:
-        rp = await relying_parties.create(
-            pool,
-            RelyingPartyCreate(rp_id=payload.rp_id, display_name=payload.rp_display_name),
-        )
-    device_key = await device_keys.create(
-        pool,
-        DeviceKeyCreate(
-            device_id=device.id,
-            rp_id=rp.id,
-            key_type=payload.key_type,
-            public_key=payload.public_key,
-        ),
+    email_filter.add(user.email)
+    db.note_write(
+        f"email:{user.email}",
+        f"user:{user.id}",
+        f"device:{device.id}",
+        f"rp:{rp.rp_id}",
+        f"rp:{rp.id}",
     )
-
     return EnrollmentResponse(
         user=user,
         device=device,
@@ -0,0 +1,155 @@
+"""Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+``db/migrations/010_invalidation_triggers.sql`` installs triggers that call
+``pg_notify('zt_invalidate', ...)`` when a row of a cached table is
+inserted, deleted or actually changed. The payload is JSON:
+``{"table", "op", "id", "key", "old_key"}``, where ``key`` is the table's
+lookup column (``rp_id`` for relying parties). Notifications are sent on
+commit, so every worker hears about every committed change, including
+changes made outside the app.
+
+Each worker keeps one dedicated connection LISTENing. LISTEN needs a
+session, so with PgBouncer in transaction mode point ``DATABASE_LISTEN_URL``
+at Postgres or at a session-mode pool. Subscribers get every event for
+their table. They get ``None`` whenever the connection is (re)established,
+because anything cached while it was down may have missed an event. Caches
+should only serve entries while :func:`listening` is true.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "zt_invalidate"
+
+_subscribers: Dict[str, List[Callable[[Optional[dict]], None]]] = {}
+
+
+def subscribe(table: str, callback: Callable[[Optional[dict]], None]) -> None:
+    """Call ``callback(event)`` for each change to ``table``; ``None`` means flush everything."""
+    _subscribers.setdefault(table, []).append(callback)
+
+
+def _publish(table: Optional[str], event: Optional[dict]) -> None:
+    if table is None:
+        targets = [callback for callbacks in _subscribers.values() for callback in callbacks]
+    else:
+        targets = _subscribers.get(table, [])
+    for callback in targets:
+        try:
+            callback(event)
+        except Exception:
+            logger.exception("invalidation subscriber failed table=%s", table)
+
+
+class Listener:
+    def __init__(self, dsn: str, reconnect_delay: float = 1.0) -> None:
+        self._dsn = dsn
+        self._reconnect_delay = reconnect_delay
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[asyncpg.Connection] = None
+        self._lost: Optional[asyncio.Event] = None
+        self._events = 0
+        self._bad_payloads = 0
+        self._connects = 0
+        self._errors = 0
+
+    @property
+    def listening(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except Exception:
+                # Caches stop serving while disconnected, so keep reconnecting
+                # whatever the failure; only cancellation ends the loop.
+                self._errors += 1
+                logger.exception("invalidation listener failed")
+            finally:
+                conn, self._conn = self._conn, None
+                if conn is not None and not conn.is_closed():
+                    try:
+                        await conn.close()
+                    except Exception:
+                        # A broken connection may not close cleanly.
+                        conn.terminate()
+            await asyncio.sleep(self._reconnect_delay)
+
+    async def _listen(self) -> None:
+        self._lost = asyncio.Event()
+        conn = await asyncpg.connect(self._dsn)
+        conn.add_termination_listener(lambda _conn: self._lost.set())
+        await conn.add_listener(CHANNEL, self._on_notify)
+        self._conn = conn
+        self._connects += 1
+        # Events sent while nobody was listening are gone.
+        _publish(None, None)
+        logger.info("invalidation listener connected channel=%s", CHANNEL)
+        await self._lost.wait()
+        logger.warning("invalidation listener lost its connection")
+
+    def _on_notify(self, _conn, _pid: int, _channel: str, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+            table = event["table"]
+        except (ValueError, KeyError, TypeError):
+            self._bad_payloads += 1
+            logger.warning("invalidation payload ignored payload=%s", payload)
+            return
+        self._events += 1
+        _publish(table, event)
+
+    def stats(self) -> dict:
+        return {
+            "listening": self.listening,
+            "connects": self._connects,
+            "events": self._events,
+            "bad_payloads": self._bad_payloads,
+            "errors": self._errors,
+        }
+
+
+_listener: Optional[Listener] = None
+
+
+def start(dsn: str) -> None:
+    global _listener
+    if _listener is None:
+        _listener = Listener(dsn)
+    _listener.start()
+
+
+async def stop() -> None:
+    if _listener is not None:
+        await _listener.stop()
+
+
+def listening() -> bool:
+    return _listener is not None and _listener.listening
+
+
+def stats() -> dict:
+    if _listener is None:
+        return {"status": "not_started"}
+    return _listener.stats()
@@ -0,0 +1,125 @@
+"""Per-worker LRU of device keys, held as ready-to-verify key objects.
+
+Entries are keyed by ``(device_id, rp uuid)`` and hold the stored key
+together with its parsed ``cryptography`` object, so a proof check on a
+cached device does neither the database read nor the base64/DER parsing.
+
+- Rotation through this worker drops its entry at once.
+- Every worker drops entries on the invalidation event that
+  ``db/migrations/011_device_key_invalidation.sql`` sends for each changed
+  or deleted key.
+- As with :mod:`app.rp_cache`, cached rows are only served while the
+  invalidation listener is connected.
+
+Callers that already have the key row from their own query, such as
+``/login/approve``, can still skip the parsing with :func:`verifier_for`. It
+only reuses a cached object when the stored key text is identical, so it
+needs no invalidation to be correct.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Optional
+from uuid import UUID
+
+from app import invalidation, rp_cache
+from app.cache import MISSING, TTLCache
+from app.config import Settings
+from app.crypto_utils import load_device_public_key
+from app.repositories import device_keys
+
+
+@dataclass(frozen=True)
+class KeyCacheConfig:
+    max_size: int = 10000
+    ttl: float = 600.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "KeyCacheConfig":
+        return cls(max_size=settings.key_cache_size, ttl=settings.key_cache_ttl)
+
+
+@dataclass(frozen=True)
+class DeviceKey:
+    id: UUID
+    device_id: UUID
+    rp_id: UUID
+    key_type: str
+    public_key: str
+    # Parsed key object; None when the stored key cannot verify anything.
+    verifier: Any
+
+
+_cache = TTLCache(KeyCacheConfig.max_size, KeyCacheConfig.ttl)
+_parses = 0
+_bypassed = 0
+
+
+def configure(config: KeyCacheConfig) -> None:
+    global _cache
+    _cache = TTLCache(config.max_size, config.ttl)
+
+
+def _parse(key_type: str, public_key: str):
+    global _parses
+    _parses += 1
+    return load_device_public_key(key_type, public_key)
+
+
+def verifier_for(device_id: UUID, rp_uuid: UUID, key_type: str, public_key: str):
+    """Parsed key for a row the caller already fetched, reusing the cached parse if it is the same key."""
+    cached = _cache.get((device_id, rp_uuid))
+    if cached is not MISSING and cached.key_type == key_type and cached.public_key == public_key:
+        return cached.verifier
+    return _parse(key_type, public_key)
+
+
+async def get(pool, device_id: UUID, rp_id: str) -> Optional[DeviceKey]:
+    """The device's key for the RP with public id ``rp_id``, or None if it has none."""
+    global _bypassed
+    if not invalidation.listening():
+        _bypassed += 1
+        row = await device_keys.get_by_device_and_rp_id(pool, device_id, rp_id)
+        if row is None:
+            return None
+        verifier = verifier_for(row.device_id, row.rp_id, row.key_type, row.public_key)
+        return DeviceKey(row.id, row.device_id, row.rp_id, row.key_type, row.public_key, verifier)
+
+    rp = await rp_cache.get_by_rp_id(pool, rp_id)
+    if rp is None:
+        return None
+    cached = _cache.get((device_id, rp.id))
+    if cached is not MISSING:
+        return cached
+    generation = _cache.generation
+    row = await device_keys.get_by_device_and_rp(pool, device_id, rp.id)
+    if row is None:
+        return None
+    entry = DeviceKey(
+        row.id, row.device_id, row.rp_id, row.key_type, row.public_key, _parse(row.key_type, row.public_key)
+    )
+    _cache.put((device_id, rp.id), entry, generation)
+    return entry
+
+
+def invalidate(device_id: UUID, rp_uuid: UUID) -> None:
+    _cache.pop((device_id, rp_uuid))
+
+
+def on_invalidate(event: Optional[dict]) -> None:
+    """``invalidation`` subscriber for the device_keys table."""
+    if event is None:
+        _cache.clear()
+        return
+    rp_uuid = (event.get("extra") or {}).get("rp_id")
+    if event.get("key") and rp_uuid:
+        invalidate(UUID(event["key"]), UUID(rp_uuid))
+    else:
+        _cache.clear()
+
+
+def stats() -> dict:
+    return {
+        **_cache.stats(),
+        "key_parses": _parses,
+        "bypassed": _bypassed,
+    }
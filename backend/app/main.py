@@ -3,7 +3,8 @@ import logging
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 
-from app import db
+from app import db, email_filter, invalidation, key_cache, partitions, reaper, rp_cache, statements, totp_cache
+from app.storage import MemoryBackend, RedisChallengeConfig, RedisChallengeStore, SqliteBackend, SqliteConfig
 from app.config import load_settings
 from app.errors import validation_exception_handler
 from app.logging_config import configure_logging
@@ -15,20 +16,60 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="ZT-TOTP Backend", version="0.1.0")
 app.state.settings = settings
+app.state.challenge_store = None
 app.include_router(router)
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 
 
 @app.on_event("startup")
 async def startup() -> None:
+    # Validated against the ciphertext each request reads, so safe on every backend.
+    totp_cache.configure(totp_cache.TotpCacheConfig.from_settings(settings))
+    if settings.storage_backend == "memory":
+        db.use_storage(MemoryBackend())
+        logger.info("startup complete env=%s storage=memory", settings.app_env)
+        return
+    if settings.storage_backend == "sqlite":
+        # The backend sweeps expired challenges itself; no partitions or reaper.
+        backend = SqliteBackend(SqliteConfig.from_settings(settings))
+        await backend.open()
+        db.use_storage(backend)
+        logger.info("startup complete env=%s storage=sqlite", settings.app_env)
+        return
     # Connect early so startup fails fast if the DB is unavailable.
-    db.initialize(settings.database_url)
+    db.initialize(
+        settings.database_url,
+        db.PoolConfig.from_settings(settings),
+        read_dsn=settings.database_read_url,
+    )
     await db.ping()
+    if settings.challenge_store == "redis":
+        store = RedisChallengeStore(RedisChallengeConfig.from_settings(settings))
+        await store.open()
+        statements.route(store)
+        app.state.challenge_store = store
+    # Inserts fail outright once the premade partitions run out, so top them up on every boot.
+    policy = partitions.PartitionPolicy.from_settings(settings)
+    await partitions.maintain(await db.connect(), policy)
+    reaper.start(reaper.ReaperConfig.from_settings(settings), policy)
+    rp_cache.configure(rp_cache.RpCacheConfig.from_settings(settings))
+    key_cache.configure(key_cache.KeyCacheConfig.from_settings(settings))
+    email_filter.configure(email_filter.EmailFilterConfig.from_settings(settings))
+    invalidation.subscribe("relying_parties", rp_cache.on_invalidate)
+    invalidation.subscribe("device_keys", key_cache.on_invalidate)
+    # Rebuilt from users each time the listener connects.
+    invalidation.subscribe("users", email_filter.on_invalidate)
+    invalidation.start(settings.database_listen_url)
     logger.info("startup complete env=%s", settings.app_env)
 
 
 @app.on_event("shutdown")
 async def shutdown() -> None:
+    await invalidation.stop()
+    await email_filter.stop()
+    await reaper.stop()
+    if app.state.challenge_store is not None:
+        await app.state.challenge_store.close()
     await db.close()
     logger.info("shutdown complete")
 
@@ -39,10 +80,28 @@ async def health() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics() -> dict:
+    return {
+        "db_pool": db.pool_stats(),
+        "statements": statements.stats(),
+        "reaper": reaper.stats(),
+        "challenge_store": app.state.challenge_store.stats() if app.state.challenge_store else {"backend": "postgres"},
+        "invalidation": invalidation.stats(),
+        "caches": {
+            "relying_parties": rp_cache.stats(),
+            "device_keys": key_cache.stats(),
+            "totp": totp_cache.stats(),
+            "emails": email_filter.stats(),
+        },
+    }
+
+
 @app.get("/")
 async def root() -> dict:
     return {
         "service": "ZT-TOTP Backend",
         "docs": "/docs",
         "health": "/health",
+        "metrics": "/metrics",
     }
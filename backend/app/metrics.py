@@ -0,0 +1,34 @@
+from bisect import bisect_left
+from typing import Sequence
+
+# Millisecond buckets sized for pool waits and single-statement latency.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Histogram:
+    """Fixed-bucket histogram; cheap enough to update on every request."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS) -> None:
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._total += value
+        if value > self._max:
+            self._max = value
+
+    def snapshot(self) -> dict:
+        buckets = {f"le_{bound:g}": count for bound, count in zip(self._bounds, self._counts)}
+        buckets["inf"] = self._counts[-1]
+        return {
+            "count": self._count,
+            "sum": round(self._total, 3),
+            "mean": round(self._total / self._count, 3) if self._count else 0.0,
+            "max": round(self._max, 3),
+            "buckets": buckets,
+        }
@@ -0,0 +1,101 @@
+"""Apply ``db/migrations/*.sql`` without psql.
+
+Each statement is sent on its own. A multi-statement query string runs as one
+implicit transaction, and ``CREATE INDEX CONCURRENTLY`` (migrations 006 and
+008) refuses to run inside a transaction. The splitter understands comments,
+quoted strings and identifiers, and ``$tag$`` bodies, which covers the DO
+blocks in 007 and 008.
+
+Applied files are recorded in ``schema_migrations`` and skipped next time.
+Not every file can simply be re-run: after 007, the CONCURRENTLY statements
+in 006 fail against the now-partitioned tables. A database bootstrapped with
+psql has no records, so backfill ``schema_migrations`` before pointing this
+at it.
+"""
+
+import logging
+import re
+from pathlib import Path
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[1] / "db" / "migrations"
+
+_DOLLAR_TAG = re.compile(r"\$[A-Za-z_][A-Za-z0-9_]*\$|\$\$")
+
+
+def split_statements(sql: str) -> list[str]:
+    statements = []
+    current = []
+    i = 0
+    length = len(sql)
+    while i < length:
+        char = sql[i]
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = length if end == -1 else end + 1
+            continue
+        if sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = length if end == -1 else end + 2
+            continue
+        if char in ("'", '"'):
+            end = i + 1
+            while end < length:
+                if sql[end] == char:
+                    # A doubled quote is an escaped quote, not the end.
+                    if end + 1 < length and sql[end + 1] == char:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i : end + 1])
+            i = end + 1
+            continue
+        if char == "$":
+            match = _DOLLAR_TAG.match(sql, i)
+            if match:
+                tag = match.group(0)
+                end = sql.find(tag, match.end())
+                end = length if end == -1 else end + len(tag)
+                current.append(sql[i:end])
+                i = end
+                continue
+        if char == ";":
+            statement = "".join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+            i += 1
+            continue
+        current.append(char)
+        i += 1
+    statement = "".join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+async def apply(conn: asyncpg.Connection, directory: Path = MIGRATIONS_DIR) -> list[str]:
+    """Run pending migration files in name order; returns the file names applied."""
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+    done = {row["name"] for row in await conn.fetch("SELECT name FROM schema_migrations")}
+    applied = []
+    for path in sorted(directory.glob("*.sql")):
+        if path.name in done:
+            continue
+        for statement in split_statements(path.read_text(encoding="utf-8")):
+            await conn.execute(statement)
+        await conn.execute("INSERT INTO schema_migrations (name) VALUES ($1)", path.name)
+        applied.append(path.name)
+        logger.info("migration applied file=%s", path.name)
+    return applied
@@ -0,0 +1,147 @@
+"""Daily range partitions for the challenge tables.
+
+``db/migrations/007_partition_challenges.sql`` partitions ``device_challenges``
+and ``login_challenges`` by ``created_at``. :func:`maintain` keeps them
+rolling: it creates one partition per UTC day ``premake_days`` ahead and
+detaches and drops partitions whose whole range is older than the table's
+retention, so expiring old rows never deletes them one by one.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+
+from app.config import Settings
+
+logger = logging.getLogger(__name__)
+
+# Serialises maintenance across workers; pg_try_advisory_xact_lock key.
+_LOCK_KEY = 7_240_001
+
+_IS_PARTITIONED_SQL = "SELECT relkind = 'p' FROM pg_class WHERE oid = $1::text::regclass"
+
+# Upper bound of every partition of a table, parsed out of its bound spec.
+_PARTITIONS_SQL = """
+SELECT c.relname,
+       (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']+)''\\)'))[1]::timestamptz AS upper_bound
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = $1::text::regclass
+ORDER BY upper_bound
+"""
+
+
+@dataclass(frozen=True)
+class PartitionPolicy:
+    premake_days: int = 7
+    device_challenge_retention_days: int = 1
+    login_challenge_retention_days: int = 30
+    # DDL on a parent queues behind long queries on it; give up and retry next run instead.
+    lock_timeout: float = 2.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "PartitionPolicy":
+        return cls(
+            premake_days=settings.partition_premake_days,
+            device_challenge_retention_days=settings.device_challenge_retention_days,
+            login_challenge_retention_days=settings.login_challenge_retention_days,
+        )
+
+    def retention_days(self, table: str) -> int:
+        if table == "device_challenges":
+            return self.device_challenge_retention_days
+        return self.login_challenge_retention_days
+
+
+PARTITIONED_TABLES = ("device_challenges", "login_challenges")
+
+
+def partition_name(table: str, day: datetime) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def _day_start(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def maintain(pool, policy: PartitionPolicy, now: datetime | None = None) -> dict:
+    """Create upcoming partitions and drop expired ones for every partitioned table.
+
+    Returns ``{table: {"created": [...], "dropped": [...], "skipped": bool}}``;
+    ``skipped`` means the table is not partitioned yet or another worker
+    held the maintenance lock.
+    """
+    now = now or datetime.now(timezone.utc)
+    summary = {}
+    for table in PARTITIONED_TABLES:
+        async with pool.acquire() as conn:
+            summary[table] = await _maintain_table(conn, table, policy, now)
+    return summary
+
+
+async def _maintain_table(conn, table: str, policy: PartitionPolicy, now: datetime) -> dict:
+    result = {"created": [], "dropped": [], "skipped": False}
+    if not await conn.fetchval(_IS_PARTITIONED_SQL, table):
+        # Migration 007 not applied yet; nothing to maintain.
+        result["skipped"] = True
+        return result
+    # One short transaction per table, so locks on one parent are never held
+    # while waiting on the other.
+    async with conn.transaction():
+        if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1, hashtext($2))", _LOCK_KEY, table):
+            result["skipped"] = True
+            return result
+        await conn.execute(f"SET LOCAL lock_timeout = '{int(policy.lock_timeout * 1000)}ms'")
+
+        partitions = await conn.fetch(_PARTITIONS_SQL, table)
+        covered_until = max((row["upper_bound"] for row in partitions), default=None)
+        day = _day_start(now)
+        if covered_until is not None and covered_until > day:
+            day = covered_until
+        horizon = _day_start(now) + timedelta(days=policy.premake_days + 1)
+        while day < horizon:
+            name = partition_name(table, day)
+            if await _ddl(
+                conn,
+                table,
+                f'CREATE TABLE "{name}" PARTITION OF {table} '
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')",
+            ):
+                result["created"].append(name)
+            day += timedelta(days=1)
+
+        cutoff = now - timedelta(days=policy.retention_days(table))
+        for row in partitions:
+            if row["upper_bound"] is None or row["upper_bound"] > cutoff:
+                continue
+            name = row["relname"]
+            if await _ddl(
+                conn,
+                table,
+                f'ALTER TABLE {table} DETACH PARTITION "{name}"',
+                f'DROP TABLE "{name}"',
+            ):
+                result["dropped"].append(name)
+
+    if result["created"] or result["dropped"]:
+        logger.info(
+            "partition maintenance table=%s created=%s dropped=%s",
+            table,
+            ",".join(result["created"]) or "-",
+            ",".join(result["dropped"]) or "-",
+        )
+    return result
+
+
+async def _ddl(conn, table: str, *sql: str) -> bool:
+    # Savepoint per step: a lock timeout skips this step, not the run.
+    try:
+        async with conn.transaction():
+            for statement in sql:
+                await conn.execute(statement)
+        return True
+    except asyncpg.LockNotAvailableError:
+        logger.warning("partition maintenance lock timeout table=%s sql=%s", table, sql[0])
+        return False
@@ -0,0 +1,143 @@
+"""Background expiry of challenges, off the request path.
+
+Every ``interval`` seconds one worker (whichever wins an advisory lock)
+flips expired pending login challenges to ``denied/expired`` in batches of
+``batch_size``, at most ``max_batches`` per tick, and every
+``partition_interval`` seconds it runs partition maintenance, which is what
+drops expired device challenges. Each batch is its own short transaction.
+
+Requests never rely on the reaper for correctness: every read and
+transition of a challenge checks ``expires_at`` itself.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional
+
+from app import db, partitions
+from app.config import Settings
+from app.metrics import Histogram
+from app.repositories import login_challenges
+
+logger = logging.getLogger(__name__)
+
+# pg_try_advisory_xact_lock key; only the worker holding it expires rows.
+_LOCK_KEY = 7_240_002
+
+
+@dataclass(frozen=True)
+class ReaperConfig:
+    interval: float = 15.0
+    batch_size: int = 500
+    max_batches: int = 20
+    partition_interval: float = 3600.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ReaperConfig":
+        return cls(
+            interval=settings.reaper_interval,
+            batch_size=settings.reaper_batch_size,
+            max_batches=settings.reaper_max_batches,
+            partition_interval=settings.partition_maintenance_interval,
+        )
+
+
+class Reaper:
+    def __init__(self, config: ReaperConfig, policy: partitions.PartitionPolicy) -> None:
+        self._config = config
+        self._policy = policy
+        self._task: Optional[asyncio.Task] = None
+        self._partitions_at = monotonic()
+        self._tick_ms = Histogram()
+        self._ticks = 0
+        self._busy_ticks = 0
+        self._expired = 0
+        self._errors = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._config.interval)
+            started = monotonic()
+            try:
+                await self.tick()
+            except Exception:
+                # Whatever went wrong, the next tick retries; a missed tick
+                # only delays cleanup. Cancellation still stops the loop.
+                self._errors += 1
+                logger.exception("reaper tick failed")
+            finally:
+                self._tick_ms.observe((monotonic() - started) * 1000)
+
+    async def tick(self) -> int:
+        """Run one round; returns how many login challenges were expired."""
+        self._ticks += 1
+        pool = await db.connect()
+        expired = 0
+        async with pool.acquire() as conn:
+            for _ in range(self._config.max_batches):
+                async with conn.transaction():
+                    if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", _LOCK_KEY):
+                        # Another worker is reaping this round.
+                        break
+                    count = await login_challenges.expire_batch(conn, self._config.batch_size)
+                expired += count
+                if count < self._config.batch_size:
+                    break
+            else:
+                logger.info("reaper hit max_batches expired=%s", expired)
+        if expired:
+            self._busy_ticks += 1
+            self._expired += expired
+            logger.info("reaper expired login_challenges=%s", expired)
+
+        if monotonic() - self._partitions_at >= self._config.partition_interval:
+            self._partitions_at = monotonic()
+            await partitions.maintain(pool, self._policy)
+        return expired
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "ticks": self._ticks,
+            "ticks_with_work": self._busy_ticks,
+            "expired_login_challenges": self._expired,
+            "errors": self._errors,
+            "tick_ms": self._tick_ms.snapshot(),
+        }
+
+
+_reaper: Optional[Reaper] = None
+
+
+def start(config: ReaperConfig, policy: partitions.PartitionPolicy) -> None:
+    global _reaper
+    if _reaper is None:
+        _reaper = Reaper(config, policy)
+    _reaper.start()
+
+
+async def stop() -> None:
+    if _reaper is not None:
+        await _reaper.stop()
+
+
+def stats() -> dict:
+    if _reaper is None:
+        return {"status": "not_started"}
+    return _reaper.stats()
@@ -2,6 +2,7 @@ from app.repositories import (
     challenges,
     device_keys,
     devices,
+    enrollments,
     login_challenges,
     relying_parties,
     totp,
@@ -1,8 +1,31 @@
 from datetime import datetime, timezone
-from uuid import UUID, uuid4
+from uuid import UUID
 
 import asyncpg
 
+from app import statements
+from app.ids import uuid7
+
+
+_INSERT_CHALLENGE = statements.register(
+    "challenges.insert_challenge",
+    """
+    INSERT INTO device_challenges (id, device_id, rp_id, nonce, expires_at)
+    VALUES ($1, $2, $3, $4, $5)
+    RETURNING id, device_id, rp_id, nonce, expires_at, created_at
+    """,
+)
+# Claiming deletes the nonce in the same statement that checks it, so two
+# concurrent verifies can never both succeed with one nonce.
+_CLAIM = statements.register(
+    "challenges.claim",
+    """
+    DELETE FROM device_challenges
+    WHERE device_id = $1 AND rp_id = $2 AND nonce = $3 AND expires_at > NOW()
+    RETURNING id, device_id, rp_id, nonce, expires_at, created_at
+    """,
+)
+
 
 def _row_to_challenge(row: asyncpg.Record) -> dict:
     return {
@@ -22,13 +45,9 @@ async def insert_challenge(
     nonce: str,
     expires_at: datetime,
 ) -> dict:
-    challenge_id = uuid4()
-    row = await pool.fetchrow(
-        """
-        INSERT INTO device_challenges (id, device_id, rp_id, nonce, expires_at)
-        VALUES ($1, $2, $3, $4, $5)
-        RETURNING id, device_id, rp_id, nonce, expires_at, created_at
-        """,
+    challenge_id = uuid7()
+    row = await _INSERT_CHALLENGE.fetchrow(
+        pool,
         challenge_id,
         device_id,
         rp_id,
@@ -38,43 +57,14 @@ async def insert_challenge(
     return _row_to_challenge(row)
 
 
-async def get_valid_challenge(
+async def claim(
     pool: asyncpg.Pool,
     device_id: UUID,
     rp_id: str,
     nonce: str,
 ) -> dict | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, device_id, rp_id, nonce, expires_at, created_at
-        FROM device_challenges
-        WHERE device_id = $1 AND rp_id = $2 AND nonce = $3 AND expires_at > NOW()
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-        device_id,
-        rp_id,
-        nonce,
-    )
+    """Consume an unexpired nonce; None if it is unknown, expired or already used."""
+    row = await _CLAIM.fetchrow(pool, device_id, rp_id, nonce)
     if row is None:
         return None
     return _row_to_challenge(row)
-
-
-async def consume_challenge(pool: asyncpg.Pool, challenge_id: UUID) -> None:
-    await pool.execute(
-        """
-        DELETE FROM device_challenges
-        WHERE id = $1
-        """,
-        challenge_id,
-    )
-
-
-async def prune_expired(pool: asyncpg.Pool) -> None:
-    await pool.execute(
-        """
-        DELETE FROM device_challenges
-        WHERE expires_at < NOW()
-        """,
-    )
@@ -1,10 +1,75 @@
-from uuid import UUID, uuid4
+from uuid import UUID
 
 import asyncpg
 
+from app import statements
+from app.ids import uuid7
 from app.models import DeviceKeyCreate, DeviceKeyOut
 
 
+_CREATE = statements.register(
+    "device_keys.create",
+    """
+    INSERT INTO device_keys (id, device_id, rp_id, key_type, public_key)
+    VALUES ($1, $2, $3, $4, $5)
+    RETURNING id, device_id, rp_id, key_type, public_key, created_at
+    """,
+)
+_GET_BY_ID = statements.register(
+    "device_keys.get_by_id",
+    """
+    SELECT id, device_id, rp_id, key_type, public_key, created_at
+    FROM device_keys
+    WHERE id = $1
+    """,
+    readonly=True,
+)
+_GET_BY_DEVICE_AND_RP = statements.register(
+    "device_keys.get_by_device_and_rp",
+    """
+    SELECT id, device_id, rp_id, key_type, public_key, created_at
+    FROM device_keys
+    WHERE device_id = $1 AND rp_id = $2
+    """,
+    readonly=True,
+    sticky="device",
+)
+_GET_BY_DEVICE_AND_RP_ID = statements.register(
+    "device_keys.get_by_device_and_rp_id",
+    """
+    SELECT k.id, k.device_id, k.rp_id, k.key_type, k.public_key, k.created_at
+    FROM device_keys k
+    JOIN relying_parties rp ON rp.id = k.rp_id
+    WHERE k.device_id = $1 AND rp.rp_id = $2
+    LIMIT 1
+    """,
+    readonly=True,
+    sticky="device",
+)
+# Rotation in one round trip; the (device_id, rp_id) unique constraint makes
+# concurrent rotations of the same key serialise instead of duplicating it.
+_UPSERT = statements.register(
+    "device_keys.upsert",
+    """
+    INSERT INTO device_keys (id, device_id, rp_id, key_type, public_key)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (device_id, rp_id)
+    DO UPDATE SET key_type = EXCLUDED.key_type, public_key = EXCLUDED.public_key
+    RETURNING id, device_id, rp_id, key_type, public_key, created_at
+    """,
+)
+_UPSERT_MANY = statements.register(
+    "device_keys.upsert_many",
+    """
+    INSERT INTO device_keys (id, device_id, rp_id, key_type, public_key)
+    SELECT * FROM unnest($1::uuid[], $2::uuid[], $3::uuid[], $4::text[], $5::text[])
+    ON CONFLICT (device_id, rp_id)
+    DO UPDATE SET key_type = EXCLUDED.key_type, public_key = EXCLUDED.public_key
+    RETURNING id, device_id, rp_id, key_type, public_key, created_at
+    """,
+)
+
+
 def _row_to_device_key(row: asyncpg.Record) -> DeviceKeyOut:
     return DeviceKeyOut(
         id=row["id"],
@@ -17,13 +82,9 @@ def _row_to_device_key(row: asyncpg.Record) -> DeviceKeyOut:
 
 
 async def create(pool: asyncpg.Pool, payload: DeviceKeyCreate) -> DeviceKeyOut:
-    key_id = uuid4()
-    row = await pool.fetchrow(
-        """
-        INSERT INTO device_keys (id, device_id, rp_id, key_type, public_key)
-        VALUES ($1, $2, $3, $4, $5)
-        RETURNING id, device_id, rp_id, key_type, public_key, created_at
-        """,
+    key_id = uuid7()
+    row = await _CREATE.fetchrow(
+        pool,
         key_id,
         payload.device_id,
         payload.rp_id,
@@ -34,14 +95,7 @@ async def create(pool: asyncpg.Pool, payload: DeviceKeyCreate) -> DeviceKeyOut:
 
 
 async def get_by_id(pool: asyncpg.Pool, key_id: UUID) -> DeviceKeyOut | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, device_id, rp_id, key_type, public_key, created_at
-        FROM device_keys
-        WHERE id = $1
-        """,
-        key_id,
-    )
+    row = await _GET_BY_ID.fetchrow(pool, key_id)
     if row is None:
         return None
     return _row_to_device_key(row)
@@ -52,15 +106,19 @@ async def get_by_device_and_rp(
     device_id: UUID,
     rp_id: UUID,
 ) -> DeviceKeyOut | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, device_id, rp_id, key_type, public_key, created_at
-        FROM device_keys
-        WHERE device_id = $1 AND rp_id = $2
-        """,
-        device_id,
-        rp_id,
-    )
+    row = await _GET_BY_DEVICE_AND_RP.fetchrow(pool, device_id, rp_id)
+    if row is None:
+        return None
+    return _row_to_device_key(row)
+
+
+async def get_by_device_and_rp_id(
+    pool: asyncpg.Pool,
+    device_id: UUID,
+    rp_id: str,
+) -> DeviceKeyOut | None:
+    """Like get_by_device_and_rp, but resolves the RP by its public rp_id."""
+    row = await _GET_BY_DEVICE_AND_RP_ID.fetchrow(pool, device_id, rp_id)
     if row is None:
         return None
     return _row_to_device_key(row)
@@ -73,26 +131,29 @@ async def upsert_by_device_and_rp(
     key_type: str,
     public_key: str,
 ) -> DeviceKeyOut:
-    existing = await get_by_device_and_rp(pool, device_id, rp_id)
-    if existing is None:
-        return await create(
-            pool,
-            DeviceKeyCreate(
-                device_id=device_id,
-                rp_id=rp_id,
-                key_type=key_type,
-                public_key=public_key,
-            ),
-        )
-    row = await pool.fetchrow(
-        """
-        UPDATE device_keys
-        SET key_type = $1, public_key = $2
-        WHERE id = $3
-        RETURNING id, device_id, rp_id, key_type, public_key, created_at
-        """,
-        key_type,
-        public_key,
-        existing.id,
-    )
+    row = await _UPSERT.fetchrow(pool, uuid7(), device_id, rp_id, key_type, public_key)
     return _row_to_device_key(row)
+
+
+async def upsert_many(
+    pool: asyncpg.Pool,
+    keys: list[tuple[UUID, UUID, str, str]],
+) -> list[DeviceKeyOut]:
+    """Rotate many keys in one statement.
+
+    ``keys`` holds ``(device_id, rp_id, key_type, public_key)`` tuples. A
+    repeated ``(device_id, rp_id)`` keeps its last entry, since ON CONFLICT may
+    not touch the same row twice in one statement.
+    """
+    latest = {(device_id, rp_id): (key_type, public_key) for device_id, rp_id, key_type, public_key in keys}
+    if not latest:
+        return []
+    rows = await _UPSERT_MANY.fetch(
+        pool,
+        [uuid7() for _ in latest],
+        [device_id for device_id, _ in latest],
+        [rp_id for _, rp_id in latest],
+        [key_type for key_type, _ in latest.values()],
+        [public_key for _, public_key in latest.values()],
+    )
+    return [_row_to_device_key(row) for row in rows]
@@ -1,10 +1,44 @@
-from uuid import UUID, uuid4
+from uuid import UUID
 
 import asyncpg
 
+from app import statements
+from app.ids import uuid7
 from app.models import DeviceCreate, DeviceOut
 
 
+_CREATE = statements.register(
+    "devices.create",
+    """
+    INSERT INTO devices (id, user_id, device_label, platform)
+    VALUES ($1, $2, $3, $4)
+    RETURNING id, user_id, device_label, platform, created_at
+    """,
+)
+_GET_BY_ID = statements.register(
+    "devices.get_by_id",
+    """
+    SELECT id, user_id, device_label, platform, created_at
+    FROM devices
+    WHERE id = $1
+    """,
+    readonly=True,
+    sticky="device",
+)
+_GET_LATEST_FOR_USER = statements.register(
+    "devices.get_latest_for_user",
+    """
+    SELECT id, user_id, device_label, platform, created_at
+    FROM devices
+    WHERE user_id = $1
+    ORDER BY created_at DESC
+    LIMIT 1
+    """,
+    readonly=True,
+    sticky="user",
+)
+
+
 def _row_to_device(row: asyncpg.Record) -> DeviceOut:
     return DeviceOut(
         id=row["id"],
@@ -16,13 +50,9 @@ def _row_to_device(row: asyncpg.Record) -> DeviceOut:
 
 
 async def create(pool: asyncpg.Pool, payload: DeviceCreate) -> DeviceOut:
-    device_id = uuid4()
-    row = await pool.fetchrow(
-        """
-        INSERT INTO devices (id, user_id, device_label, platform)
-        VALUES ($1, $2, $3, $4)
-        RETURNING id, user_id, device_label, platform, created_at
-        """,
+    device_id = uuid7()
+    row = await _CREATE.fetchrow(
+        pool,
         device_id,
         payload.user_id,
         payload.device_label,
@@ -32,30 +62,14 @@ async def create(pool: asyncpg.Pool, payload: DeviceCreate) -> DeviceOut:
 
 
 async def get_by_id(pool: asyncpg.Pool, device_id: UUID) -> DeviceOut | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, user_id, device_label, platform, created_at
-        FROM devices
-        WHERE id = $1
-        """,
-        device_id,
-    )
+    row = await _GET_BY_ID.fetchrow(pool, device_id)
     if row is None:
         return None
     return _row_to_device(row)
 
 
 async def get_latest_for_user(pool: asyncpg.Pool, user_id: UUID) -> DeviceOut | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, user_id, device_label, platform, created_at
-        FROM devices
-        WHERE user_id = $1
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-        user_id,
-    )
+    row = await _GET_LATEST_FOR_USER.fetchrow(pool, user_id)
     if row is None:
         return None
     return _row_to_device(row)
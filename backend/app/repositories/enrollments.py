@@ -0,0 +1,111 @@
+import asyncpg
+
+from app import statements
+from app.ids import uuid7
+from app.models import DeviceKeyOut, DeviceOut, RelyingPartyOut, UserOut
+
+# One statement, hence one round trip and one implicit transaction. An
+# existing user or RP is left untouched (DO NOTHING) and read back instead, so
+# re-enrolling writes no new row version and takes no row lock on it. If a
+# concurrent enroll inserts the same email or rp_id after this statement's
+# snapshot, DO NOTHING skips it but the fallback SELECT cannot see it yet. The
+# device and key then are not inserted, the statement returns no row and
+# enroll() runs it again.
+_ENROLL = statements.register(
+    "enrollments.enroll",
+    """
+    WITH new_u AS (
+        INSERT INTO users (id, email)
+        VALUES ($1, $2)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id, email, created_at
+    ), u AS (
+        SELECT id, email, created_at FROM new_u
+        UNION ALL
+        SELECT id, email, created_at FROM users
+        WHERE email = $2 AND NOT EXISTS (SELECT 1 FROM new_u)
+    ), new_rp AS (
+        INSERT INTO relying_parties (id, rp_id, display_name)
+        VALUES ($3, $4, $5)
+        ON CONFLICT (rp_id) DO NOTHING
+        RETURNING id, rp_id, display_name, created_at
+    ), rp AS (
+        SELECT id, rp_id, display_name, created_at FROM new_rp
+        UNION ALL
+        SELECT id, rp_id, display_name, created_at FROM relying_parties
+        WHERE rp_id = $4 AND NOT EXISTS (SELECT 1 FROM new_rp)
+    ), d AS (
+        INSERT INTO devices (id, user_id, device_label, platform)
+        SELECT $6, u.id, $7, $8 FROM u, rp
+        RETURNING id, user_id, device_label, platform, created_at
+    ), k AS (
+        INSERT INTO device_keys (id, device_id, rp_id, key_type, public_key)
+        SELECT $9, d.id, rp.id, $10, $11 FROM d, rp
+        RETURNING id, device_id, rp_id, key_type, public_key, created_at
+    )
+    SELECT u.id AS user_id, u.email, u.created_at AS user_created_at,
+           d.id AS device_id, d.device_label, d.platform, d.created_at AS device_created_at,
+           rp.id AS rp_uuid, rp.rp_id, rp.display_name, rp.created_at AS rp_created_at,
+           k.id AS key_id, k.key_type, k.public_key, k.created_at AS key_created_at
+    FROM u, rp, d, k
+    """,
+)
+
+# Losing that race twice in a row takes a third concurrent enroll of the same
+# email or rp_id; past this something else is wrong.
+_ENROLL_ATTEMPTS = 3
+
+
+async def enroll(
+    pool: asyncpg.Pool,
+    email: str,
+    device_label: str,
+    platform: str,
+    rp_id: str,
+    rp_display_name: str,
+    key_type: str,
+    public_key: str,
+) -> tuple[UserOut, DeviceOut, RelyingPartyOut, DeviceKeyOut]:
+    """Create (or reuse) the user and RP, then the device and its key."""
+    args = (
+        uuid7(),
+        email,
+        uuid7(),
+        rp_id,
+        rp_display_name,
+        uuid7(),
+        device_label,
+        platform,
+        uuid7(),
+        key_type,
+        public_key,
+    )
+    for _ in range(_ENROLL_ATTEMPTS):
+        row = await _ENROLL.fetchrow(pool, *args)
+        if row is not None:
+            break
+    else:
+        raise RuntimeError(f"enroll kept racing a concurrent insert email={email} rp_id={rp_id}")
+    user = UserOut(id=row["user_id"], email=row["email"], created_at=row["user_created_at"])
+    device = DeviceOut(
+        id=row["device_id"],
+        user_id=row["user_id"],
+        device_label=row["device_label"],
+        platform=row["platform"],
+        created_at=row["device_created_at"],
+    )
+    rp = RelyingPartyOut(
+        id=row["rp_uuid"],
+        rp_id=row["rp_id"],
+        display_name=row["display_name"],
+        created_at=row["rp_created_at"],
+    )
+    device_key = DeviceKeyOut(
+        id=row["key_id"],
+        device_id=row["device_id"],
+        rp_id=row["rp_uuid"],
+        key_type=row["key_type"],
+        public_key=row["public_key"],
+        created_at=row["key_created_at"],
+    )
+    return user, device, rp, device_key
@@ -1,8 +1,213 @@
-from datetime import datetime
-from uuid import UUID, uuid4
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
 
 import asyncpg
 
+from app import statements
+from app.ids import uuid7, uuid7_time
+
+# How long a new login challenge stays approvable.
+CHALLENGE_TTL = timedelta(seconds=120)
+# created_at comes from the database clock, ids and expires_at from the
+# application clock; bounds derived from either allow this much skew.
+_CLOCK_SKEW = timedelta(minutes=5)
+# How far back mark_approved looks for created_at: a challenge older than
+# this can no longer be approved.
+APPROVAL_WINDOW = CHALLENGE_TTL + _CLOCK_SKEW
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+_INSERT = statements.register(
+    "login_challenges.insert",
+    """
+    INSERT INTO login_challenges (id, user_id, device_id, rp_id, nonce, otp_hash, expires_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+    RETURNING id, user_id, device_id, rp_id, nonce, otp_hash, status, created_at, expires_at, approved_at, denied_reason
+    """,
+)
+# Pending rows past expires_at may not have been reaped yet; report them as
+# expired so callers never depend on the background reaper having run.
+# Lookups by id also bound created_at (see created_at_bounds) so the planner
+# prunes every daily partition but the one holding the row.
+_GET_BY_ID = statements.register(
+    "login_challenges.get_by_id",
+    """
+    SELECT id, user_id, device_id, rp_id, nonce, otp_hash,
+           CASE WHEN status = 'pending' AND expires_at <= NOW() THEN 'denied' ELSE status END AS status,
+           created_at, expires_at, approved_at,
+           CASE WHEN status = 'pending' AND expires_at <= NOW() THEN 'expired' ELSE denied_reason END AS denied_reason
+    FROM login_challenges
+    WHERE id = $1 AND created_at BETWEEN $2 AND $3
+    """,
+)
+_GET_PENDING_FOR_USER = statements.register(
+    "login_challenges.get_pending_for_user",
+    """
+    SELECT id, user_id, device_id, rp_id, nonce, otp_hash, status, created_at, expires_at, approved_at, denied_reason
+    FROM login_challenges
+    WHERE user_id = $1 AND status = 'pending' AND expires_at > NOW()
+    ORDER BY created_at DESC
+    LIMIT 1
+    """,
+)
+# Transitions only ever leave 'pending', so of two concurrent decisions on the
+# same challenge exactly one UPDATE matches a row. A challenge that can still
+# be approved was created within the last TTL ($2), which prunes the rest.
+_MARK_APPROVED = statements.register(
+    "login_challenges.mark_approved",
+    """
+    UPDATE login_challenges
+    SET status = 'approved', approved_at = NOW()
+    WHERE id = $1 AND created_at BETWEEN NOW() - $2::interval AND NOW()
+      AND status = 'pending' AND expires_at > NOW()
+    RETURNING id
+    """,
+)
+_MARK_DENIED = statements.register(
+    "login_challenges.mark_denied",
+    """
+    UPDATE login_challenges
+    SET status = 'denied', denied_reason = $2
+    WHERE id = $1 AND created_at BETWEEN $3 AND $4 AND status = 'pending'
+    RETURNING id
+    """,
+)
+# Bounded so one reaper round never holds many row locks; SKIP LOCKED leaves
+# rows a request is deciding right now to the next round.
+_EXPIRE_BATCH = statements.register(
+    "login_challenges.expire_batch",
+    """
+    WITH batch AS (
+        SELECT id, created_at
+        FROM login_challenges
+        WHERE status = 'pending' AND expires_at <= NOW()
+        ORDER BY expires_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE login_challenges c
+    SET status = 'denied', denied_reason = 'expired'
+    FROM batch
+    WHERE c.id = batch.id AND c.created_at = batch.created_at
+    """,
+)
+# Moves one keyset page of terminal challenges out of the hot table. The
+# plain created_at bound lets the planner prune partitions behind the cursor.
+_ARCHIVE_BATCH = statements.register(
+    "login_challenges.archive_batch",
+    """
+    WITH batch AS (
+        SELECT id, created_at
+        FROM login_challenges
+        WHERE status <> 'pending'
+          AND created_at < $1
+          AND created_at >= $2
+          AND (created_at, id) > ($2, $3)
+        ORDER BY created_at, id
+        LIMIT $4
+        FOR UPDATE SKIP LOCKED
+    )
+    DELETE FROM login_challenges c
+    USING batch
+    WHERE c.id = batch.id AND c.created_at = batch.created_at
+    RETURNING c.id, c.user_id, c.device_id, c.rp_id, c.nonce, c.otp_hash, c.status,
+              c.created_at, c.expires_at, c.approved_at, c.denied_reason
+    """,
+)
+_CLEAR_PENDING_FOR_USER = statements.register(
+    "login_challenges.clear_pending_for_user",
+    """
+    UPDATE login_challenges
+    SET status = 'denied', denied_reason = 'user_cleared'
+    WHERE user_id = $1 AND status = 'pending'
+    """,
+)
+
+# Resolves everything /login needs before crypto in one round trip. Missing
+# links come back as NULL columns so the caller can still report exactly
+# which step failed.
+_RESOLVE_LOGIN_START = statements.register(
+    "login_challenges.resolve_login_start",
+    """
+    SELECT u.id AS user_id,
+           d.id AS device_id,
+           s.rp_id,
+           s.secret_encrypted,
+           rp.id AS rp_uuid,
+           k.id AS device_key_id
+    FROM users u
+    LEFT JOIN LATERAL (
+        SELECT id
+        FROM devices
+        WHERE user_id = u.id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) d ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT rp_id, secret_encrypted
+        FROM totp_secrets
+        WHERE user_id = u.id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) s ON TRUE
+    LEFT JOIN relying_parties rp ON rp.rp_id = s.rp_id
+    LEFT JOIN LATERAL (
+        SELECT id
+        FROM device_keys
+        WHERE device_id = d.id AND rp_id = rp.id
+        LIMIT 1
+    ) k ON TRUE
+    WHERE u.email = $1
+    """,
+    readonly=True,
+    sticky="email",
+)
+
+
+# Everything /login/approve checks, keyed on the RP and device the approver
+# claims; the caller compares them against the challenge row.
+_GET_APPROVAL_CONTEXT = statements.register(
+    "login_challenges.get_approval_context",
+    """
+    SELECT c.id, c.user_id, c.device_id, c.rp_id, c.otp_hash,
+           CASE WHEN c.status = 'pending' AND c.expires_at <= NOW() THEN 'denied' ELSE c.status END AS status,
+           rp.id AS rp_uuid,
+           k.key_type,
+           k.public_key,
+           s.secret_encrypted
+    FROM login_challenges c
+    LEFT JOIN relying_parties rp ON rp.rp_id = $3
+    LEFT JOIN LATERAL (
+        SELECT key_type, public_key
+        FROM device_keys
+        WHERE device_id = $2 AND rp_id = rp.id
+        LIMIT 1
+    ) k ON TRUE
+    LEFT JOIN totp_secrets s ON s.user_id = c.user_id AND s.rp_id = $3
+    WHERE c.id = $1 AND c.created_at BETWEEN $4 AND $5
+    """,
+)
+# The Postgres half of the approval context, for when the challenge itself
+# lives in the Redis challenge store.
+_GET_APPROVAL_KEYS = statements.register(
+    "login_challenges.get_approval_keys",
+    """
+    SELECT rp.id AS rp_uuid,
+           k.key_type,
+           k.public_key,
+           s.secret_encrypted
+    FROM (SELECT $3::text AS rp_id) r
+    LEFT JOIN relying_parties rp ON rp.rp_id = r.rp_id
+    LEFT JOIN LATERAL (
+        SELECT key_type, public_key
+        FROM device_keys
+        WHERE device_id = $2 AND rp_id = rp.id
+        LIMIT 1
+    ) k ON TRUE
+    LEFT JOIN totp_secrets s ON s.user_id = $1 AND s.rp_id = r.rp_id
+    """,
+)
+
 
 def _row_to_challenge(row: asyncpg.Record) -> dict:
     return {
@@ -29,13 +234,9 @@ async def insert(
     otp_hash: str,
     expires_at: datetime,
 ) -> dict:
-    challenge_id = uuid4()
-    row = await pool.fetchrow(
-        """
-        INSERT INTO login_challenges (id, user_id, device_id, rp_id, nonce, otp_hash, expires_at)
-        VALUES ($1, $2, $3, $4, $5, $6, $7)
-        RETURNING id, user_id, device_id, rp_id, nonce, otp_hash, status, created_at, expires_at, approved_at, denied_reason
-        """,
+    challenge_id = uuid7()
+    row = await _INSERT.fetchrow(
+        pool,
         challenge_id,
         user_id,
         device_id,
@@ -47,79 +248,119 @@ async def insert(
     return _row_to_challenge(row)
 
 
+def created_at_bounds(challenge_id: UUID) -> tuple[datetime, datetime]:
+    """The ``created_at`` range a challenge with this id can have been inserted in."""
+    if challenge_id.version != 7:
+        # Ids issued before the switch to uuid7 carry no timestamp.
+        return _EPOCH, datetime.now(timezone.utc) + _CLOCK_SKEW
+    created = datetime.fromtimestamp(uuid7_time(challenge_id), timezone.utc)
+    return created - _CLOCK_SKEW, created + _CLOCK_SKEW
+
+
 async def get_by_id(pool: asyncpg.Pool, challenge_id: UUID) -> dict | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, user_id, device_id, rp_id, nonce, otp_hash, status, created_at, expires_at, approved_at, denied_reason
-        FROM login_challenges
-        WHERE id = $1
-        """,
-        challenge_id,
-    )
+    row = await _GET_BY_ID.fetchrow(pool, challenge_id, *created_at_bounds(challenge_id))
     if row is None:
         return None
     return _row_to_challenge(row)
 
 
 async def get_pending_for_user(pool: asyncpg.Pool, user_id: UUID) -> dict | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, user_id, device_id, rp_id, nonce, otp_hash, status, created_at, expires_at, approved_at, denied_reason
-        FROM login_challenges
-        WHERE user_id = $1 AND status = 'pending' AND expires_at > NOW()
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-        user_id,
-    )
+    row = await _GET_PENDING_FOR_USER.fetchrow(pool, user_id)
     if row is None:
         return None
     return _row_to_challenge(row)
 
 
-async def mark_approved(pool: asyncpg.Pool, challenge_id: UUID) -> None:
-    await pool.execute(
-        """
-        UPDATE login_challenges
-        SET status = 'approved', approved_at = NOW()
-        WHERE id = $1
-        """,
-        challenge_id,
+async def get_approval_context(
+    pool: asyncpg.Pool,
+    challenge_id: UUID,
+    device_id: UUID,
+    rp_id: str,
+) -> dict | None:
+    if statements.routed(_GET_BY_ID):
+        challenge = await get_by_id(pool, challenge_id)
+        if challenge is None:
+            return None
+        keys = await _GET_APPROVAL_KEYS.fetchrow(pool, challenge["user_id"], device_id, rp_id)
+        context = {
+            field: challenge[field] for field in ("id", "user_id", "device_id", "rp_id", "otp_hash", "status")
+        }
+        return {**context, **dict(keys)}
+    row = await _GET_APPROVAL_CONTEXT.fetchrow(
+        pool, challenge_id, device_id, rp_id, *created_at_bounds(challenge_id)
     )
+    if row is None:
+        return None
+    return dict(row)
 
 
-async def mark_denied(pool: asyncpg.Pool, challenge_id: UUID, reason: str) -> None:
-    await pool.execute(
-        """
-        UPDATE login_challenges
-        SET status = 'denied', denied_reason = $2
-        WHERE id = $1
-        """,
-        challenge_id,
-        reason,
-    )
+async def mark_approved(pool: asyncpg.Pool, challenge_id: UUID) -> bool:
+    """Approve a pending challenge; False if it was no longer pending."""
+    return await _MARK_APPROVED.fetchval(pool, challenge_id, APPROVAL_WINDOW) is not None
 
 
-async def prune_expired(pool: asyncpg.Pool) -> None:
-    await pool.execute(
-        """
-        UPDATE login_challenges
-        SET status = 'denied', denied_reason = 'expired'
-        WHERE status = 'pending' AND expires_at < NOW()
-        """,
-    )
+async def mark_denied(pool: asyncpg.Pool, challenge_id: UUID, reason: str) -> bool:
+    """Deny a pending challenge; False if it was no longer pending."""
+    return await _MARK_DENIED.fetchval(pool, challenge_id, reason, *created_at_bounds(challenge_id)) is not None
 
 
-async def clear_pending_for_user(pool: asyncpg.Pool, user_id: UUID) -> int:
-    result = await pool.execute(
-        """
-        UPDATE login_challenges
-        SET status = 'denied', denied_reason = 'user_cleared'
-        WHERE user_id = $1 AND status = 'pending'
-        """,
-        user_id,
-    )
+def _row_count(result: str) -> int:
     try:
         return int(result.split(" ")[-1])
     except (IndexError, ValueError):
         return 0
+
+
+async def expire_batch(pool: asyncpg.Pool, limit: int) -> int:
+    """Mark up to ``limit`` expired pending challenges denied; returns the count."""
+    return _row_count(await _EXPIRE_BATCH.execute(pool, limit))
+
+
+async def archive_batch(
+    pool: asyncpg.Pool,
+    before: datetime,
+    after_created_at: datetime,
+    after_id: UUID,
+    limit: int,
+) -> list[dict]:
+    """Delete and return up to ``limit`` terminal challenges created before ``before``.
+
+    Rows come back ordered by ``(created_at, id)``, starting after the given
+    cursor. Run it inside the transaction that persists them elsewhere.
+    """
+    rows = await _ARCHIVE_BATCH.fetch(pool, before, after_created_at, after_id, limit)
+    return sorted((_row_to_challenge(row) for row in rows), key=lambda c: (c["created_at"], c["id"]))
+
+
+async def clear_pending_for_user(pool: asyncpg.Pool, user_id: UUID) -> int:
+    return _row_count(await _CLEAR_PENDING_FOR_USER.execute(pool, user_id))
+
+
+async def resolve_login_start(pool: asyncpg.Pool, email: str) -> dict:
+    """Look up user, latest device, latest TOTP secret, its RP and the device key.
+
+    ``reason`` is None when every link exists, otherwise the denial reason
+    for the first missing one, matching the order of the per-table lookups.
+    """
+    row = await _RESOLVE_LOGIN_START.fetchrow(pool, email)
+    if row is None:
+        reason = "user_not_found"
+    elif row["device_id"] is None:
+        reason = "device_not_found"
+    elif row["rp_id"] is None:
+        reason = "totp_not_registered"
+    elif row["rp_uuid"] is None:
+        reason = "rp_not_found"
+    elif row["device_key_id"] is None:
+        reason = "device_not_enrolled"
+    else:
+        reason = None
+    if reason is not None:
+        return {"reason": reason}
+    return {
+        "reason": None,
+        "user_id": row["user_id"],
+        "device_id": row["device_id"],
+        "rp_id": row["rp_id"],
+        "secret_encrypted": row["secret_encrypted"],
+    }
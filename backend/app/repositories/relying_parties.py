@@ -1,10 +1,42 @@
-from uuid import UUID, uuid4
+from uuid import UUID
 
 import asyncpg
 
+from app import statements
+from app.ids import uuid7
 from app.models import RelyingPartyCreate, RelyingPartyOut
 
 
+_CREATE = statements.register(
+    "relying_parties.create",
+    """
+    INSERT INTO relying_parties (id, rp_id, display_name)
+    VALUES ($1, $2, $3)
+    RETURNING id, rp_id, display_name, created_at
+    """,
+)
+_GET_BY_ID = statements.register(
+    "relying_parties.get_by_id",
+    """
+    SELECT id, rp_id, display_name, created_at
+    FROM relying_parties
+    WHERE id = $1
+    """,
+    readonly=True,
+    sticky="rp",
+)
+_GET_BY_RP_ID = statements.register(
+    "relying_parties.get_by_rp_id",
+    """
+    SELECT id, rp_id, display_name, created_at
+    FROM relying_parties
+    WHERE rp_id = $1
+    """,
+    readonly=True,
+    sticky="rp",
+)
+
+
 def _row_to_rp(row: asyncpg.Record) -> RelyingPartyOut:
     return RelyingPartyOut(
         id=row["id"],
@@ -15,13 +47,9 @@ def _row_to_rp(row: asyncpg.Record) -> RelyingPartyOut:
 
 
 async def create(pool: asyncpg.Pool, payload: RelyingPartyCreate) -> RelyingPartyOut:
-    rp_uuid = uuid4()
-    row = await pool.fetchrow(
-        """
-        INSERT INTO relying_parties (id, rp_id, display_name)
-        VALUES ($1, $2, $3)
-        RETURNING id, rp_id, display_name, created_at
-        """,
+    rp_uuid = uuid7()
+    row = await _CREATE.fetchrow(
+        pool,
         rp_uuid,
         payload.rp_id,
         payload.display_name,
@@ -30,28 +58,14 @@ async def create(pool: asyncpg.Pool, payload: RelyingPartyCreate) -> RelyingPart
 
 
 async def get_by_id(pool: asyncpg.Pool, rp_uuid: UUID) -> RelyingPartyOut | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, rp_id, display_name, created_at
-        FROM relying_parties
-        WHERE id = $1
-        """,
-        rp_uuid,
-    )
+    row = await _GET_BY_ID.fetchrow(pool, rp_uuid)
     if row is None:
         return None
     return _row_to_rp(row)
 
 
 async def get_by_rp_id(pool: asyncpg.Pool, rp_id: str) -> RelyingPartyOut | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, rp_id, display_name, created_at
-        FROM relying_parties
-        WHERE rp_id = $1
-        """,
-        rp_id,
-    )
+    row = await _GET_BY_RP_ID.fetchrow(pool, rp_id)
     if row is None:
         return None
     return _row_to_rp(row)
@@ -1,7 +1,84 @@
-from uuid import UUID, uuid4
+from uuid import UUID
 
 import asyncpg
 
+from app import statements
+from app.ids import uuid7
+
+
+_INSERT_SECRET = statements.register(
+    "totp.insert_secret",
+    """
+    INSERT INTO totp_secrets (id, user_id, rp_id, secret_encrypted)
+    VALUES ($1, $2, $3, $4)
+    RETURNING id, user_id, rp_id, secret_encrypted, created_at
+    """,
+)
+# Secret and recovery codes in one statement: a single round trip, and a
+# duplicate secret aborts the code inserts with it.
+_REGISTER = statements.register(
+    "totp.register",
+    """
+    WITH s AS (
+        INSERT INTO totp_secrets (id, user_id, rp_id, secret_encrypted)
+        VALUES ($1, $2, $3, $4)
+        RETURNING id, user_id, rp_id, secret_encrypted, created_at
+    ), codes AS (
+        INSERT INTO recovery_codes (id, user_id, code_hash)
+        SELECT c.id, s.user_id, c.code_hash
+        FROM s, unnest($5::uuid[], $6::text[]) AS c(id, code_hash)
+    )
+    SELECT id, user_id, rp_id, secret_encrypted, created_at
+    FROM s
+    """,
+)
+_GET_SECRET = statements.register(
+    "totp.get_secret",
+    """
+    SELECT id, user_id, rp_id, secret_encrypted, created_at
+    FROM totp_secrets
+    WHERE user_id = $1 AND rp_id = $2
+    """,
+    readonly=True,
+    sticky="user",
+)
+_GET_LATEST_SECRET_FOR_USER = statements.register(
+    "totp.get_latest_secret_for_user",
+    """
+    SELECT id, user_id, rp_id, secret_encrypted, created_at
+    FROM totp_secrets
+    WHERE user_id = $1
+    ORDER BY created_at DESC
+    LIMIT 1
+    """,
+    readonly=True,
+    sticky="user",
+)
+_INSERT_RECOVERY_CODE = statements.register(
+    "totp.insert_recovery_code",
+    """
+    INSERT INTO recovery_codes (id, user_id, code_hash)
+    VALUES ($1, $2, $3)
+    """,
+)
+_GET_UNUSED_RECOVERY_CODE = statements.register(
+    "totp.get_unused_recovery_code",
+    """
+    SELECT id, user_id, code_hash, created_at, used_at
+    FROM recovery_codes
+    WHERE user_id = $1 AND code_hash = $2 AND used_at IS NULL
+    LIMIT 1
+    """,
+)
+_CONSUME_RECOVERY_CODE = statements.register(
+    "totp.consume_recovery_code",
+    """
+    UPDATE recovery_codes
+    SET used_at = NOW()
+    WHERE id = $1
+    """,
+)
+
 
 def _row_to_secret(row: asyncpg.Record) -> dict:
     return {
@@ -19,13 +96,9 @@ async def insert_secret(
     rp_id: str,
     secret_encrypted: str,
 ) -> dict:
-    secret_id = uuid4()
-    row = await pool.fetchrow(
-        """
-        INSERT INTO totp_secrets (id, user_id, rp_id, secret_encrypted)
-        VALUES ($1, $2, $3, $4)
-        RETURNING id, user_id, rp_id, secret_encrypted, created_at
-        """,
+    secret_id = uuid7()
+    row = await _INSERT_SECRET.fetchrow(
+        pool,
         secret_id,
         user_id,
         rp_id,
@@ -34,20 +107,32 @@ async def insert_secret(
     return _row_to_secret(row)
 
 
-async def get_secret(
+async def register(
     pool: asyncpg.Pool,
     user_id: UUID,
     rp_id: str,
-) -> dict | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, user_id, rp_id, secret_encrypted, created_at
-        FROM totp_secrets
-        WHERE user_id = $1 AND rp_id = $2
-        """,
+    secret_encrypted: str,
+    code_hashes: list[str],
+) -> dict:
+    """Insert a TOTP secret together with its recovery code hashes."""
+    row = await _REGISTER.fetchrow(
+        pool,
+        uuid7(),
         user_id,
         rp_id,
+        secret_encrypted,
+        [uuid7() for _ in code_hashes],
+        code_hashes,
     )
+    return _row_to_secret(row)
+
+
+async def get_secret(
+    pool: asyncpg.Pool,
+    user_id: UUID,
+    rp_id: str,
+) -> dict | None:
+    row = await _GET_SECRET.fetchrow(pool, user_id, rp_id)
     if row is None:
         return None
     return _row_to_secret(row)
@@ -57,16 +142,7 @@ async def get_latest_secret_for_user(
     pool: asyncpg.Pool,
     user_id: UUID,
 ) -> dict | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, user_id, rp_id, secret_encrypted, created_at
-        FROM totp_secrets
-        WHERE user_id = $1
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-        user_id,
-    )
+    row = await _GET_LATEST_SECRET_FOR_USER.fetchrow(pool, user_id)
     if row is None:
         return None
     return _row_to_secret(row)
@@ -77,12 +153,9 @@ async def insert_recovery_code(
     user_id: UUID,
     code_hash: str,
 ) -> None:
-    code_id = uuid4()
-    await pool.execute(
-        """
-        INSERT INTO recovery_codes (id, user_id, code_hash)
-        VALUES ($1, $2, $3)
-        """,
+    code_id = uuid7()
+    await _INSERT_RECOVERY_CODE.execute(
+        pool,
         code_id,
         user_id,
         code_hash,
@@ -94,27 +167,11 @@ async def get_unused_recovery_code(
     user_id: UUID,
     code_hash: str,
 ) -> dict | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, user_id, code_hash, created_at, used_at
-        FROM recovery_codes
-        WHERE user_id = $1 AND code_hash = $2 AND used_at IS NULL
-        LIMIT 1
-        """,
-        user_id,
-        code_hash,
-    )
+    row = await _GET_UNUSED_RECOVERY_CODE.fetchrow(pool, user_id, code_hash)
     if row is None:
         return None
     return dict(row)
 
 
 async def consume_recovery_code(pool: asyncpg.Pool, code_id: UUID) -> None:
-    await pool.execute(
-        """
-        UPDATE recovery_codes
-        SET used_at = NOW()
-        WHERE id = $1
-        """,
-        code_id,
-    )
+    await _CONSUME_RECOVERY_CODE.execute(pool, code_id)
@@ -1,10 +1,64 @@
-from uuid import UUID, uuid4
+from uuid import UUID
 
 import asyncpg
 
+from app import statements
+from app.ids import uuid7
 from app.models import UserCreate, UserOut
 
 
+_CREATE = statements.register(
+    "users.create",
+    """
+    INSERT INTO users (id, email)
+    VALUES ($1, $2)
+    RETURNING id, email, created_at
+    """,
+)
+_GET_BY_ID = statements.register(
+    "users.get_by_id",
+    """
+    SELECT id, email, created_at
+    FROM users
+    WHERE id = $1
+    """,
+    readonly=True,
+    sticky="user",
+)
+_GET_BY_EMAIL = statements.register(
+    "users.get_by_email",
+    """
+    SELECT id, email, created_at
+    FROM users
+    WHERE email = $1
+    """,
+    readonly=True,
+    sticky="email",
+)
+# Keyset page over the email index, for rebuilding the email filter. Runs on
+# the primary: a lagging replica could miss users whose insert event the
+# filter has already been told about.
+_LIST_EMAILS_AFTER = statements.register(
+    "users.list_emails_after",
+    """
+    SELECT email
+    FROM users
+    WHERE email > $1
+    ORDER BY email
+    LIMIT $2
+    """,
+)
+_ESTIMATE_COUNT = statements.register(
+    "users.estimate_count",
+    """
+    SELECT GREATEST(reltuples, 0)::bigint
+    FROM pg_class
+    WHERE oid = 'users'::regclass
+    """,
+    readonly=True,
+)
+
+
 def _row_to_user(row: asyncpg.Record) -> UserOut:
     return UserOut(
         id=row["id"],
@@ -14,42 +68,30 @@ def _row_to_user(row: asyncpg.Record) -> UserOut:
 
 
 async def create(pool: asyncpg.Pool, payload: UserCreate) -> UserOut:
-    user_id = uuid4()
-    row = await pool.fetchrow(
-        """
-        INSERT INTO users (id, email)
-        VALUES ($1, $2)
-        RETURNING id, email, created_at
-        """,
-        user_id,
-        payload.email,
-    )
+    user_id = uuid7()
+    row = await _CREATE.fetchrow(pool, user_id, payload.email)
     return _row_to_user(row)
 
 
 async def get_by_id(pool: asyncpg.Pool, user_id: UUID) -> UserOut | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, email, created_at
-        FROM users
-        WHERE id = $1
-        """,
-        user_id,
-    )
+    row = await _GET_BY_ID.fetchrow(pool, user_id)
     if row is None:
         return None
     return _row_to_user(row)
 
 
 async def get_by_email(pool: asyncpg.Pool, email: str) -> UserOut | None:
-    row = await pool.fetchrow(
-        """
-        SELECT id, email, created_at
-        FROM users
-        WHERE email = $1
-        """,
-        email,
-    )
+    row = await _GET_BY_EMAIL.fetchrow(pool, email)
     if row is None:
         return None
     return _row_to_user(row)
+
+
+async def list_emails_after(pool: asyncpg.Pool, after: str, limit: int) -> list[str]:
+    rows = await _LIST_EMAILS_AFTER.fetch(pool, after, limit)
+    return [row["email"] for row in rows]
+
+
+async def estimate_count(pool: asyncpg.Pool) -> int:
+    """Planner estimate of the number of users; 0 before the first ANALYZE."""
+    return await _ESTIMATE_COUNT.fetchval(pool) or 0
@@ -1,6 +1,6 @@
 import base64
 import json
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from io import BytesIO
 from uuid import UUID
 
@@ -10,7 +10,7 @@ from asyncpg import UniqueViolationError
 from fastapi import APIRouter, Form, HTTPException, Request, Response
 from fastapi.encoders import jsonable_encoder
 
-from app import db
+from app import db, email_filter, key_cache, rp_cache, totp_cache
 from app.enrollment import EnrollmentRequest, EnrollmentResponse, enroll
 from app.totp_models import (
     RecoveryVerifyRequest,
@@ -25,7 +25,6 @@ from app.totp_service import (
     decrypt_secret,
     register_totp,
     verify_recovery_code,
-    verify_totp,
 )
 from app.crypto_utils import hash_otp
 from app.verification import (
@@ -51,7 +50,6 @@ from app.zt_models import (
 )
 import qrcode
 from app.zt_service import (
-    device_key_exists,
     get_device_key as get_device_key_for_rp,
     issue_challenge,
     verify_device_proof,
@@ -99,44 +97,47 @@ async def submit_feedback(payload: FeedbackRequest, request: Request) -> Feedbac
 
 @router.post("/users", response_model=UserOut)
 async def create_user(payload: UserCreate) -> UserOut:
-    pool = await db.connect()
-    try:
-        return await users.create(pool, payload)
-    except UniqueViolationError:
-        raise HTTPException(status_code=409, detail="email already exists")
+    async with db.unit_of_work() as conn:
+        try:
+            user = await users.create(conn, payload)
+        except UniqueViolationError:
+            raise HTTPException(status_code=409, detail="email already exists")
+        # Other workers hear about it from the users trigger once this commits.
+        email_filter.add(user.email)
+        return user
 
 
 @router.get("/users/{user_id}", response_model=UserOut)
 async def get_user(user_id: UUID) -> UserOut:
-    pool = await db.connect()
-    user = await users.get_by_id(pool, user_id)
-    if user is None:
-        raise HTTPException(status_code=404, detail="user not found")
-    return user
+    async with db.unit_of_work(readonly=True, sticky=f"user:{user_id}") as conn:
+        user = await users.get_by_id(conn, user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="user not found")
+        return user
 
 
 @router.post("/devices", response_model=DeviceOut)
 async def create_device(payload: DeviceCreate) -> DeviceOut:
-    pool = await db.connect()
-    return await devices.create(pool, payload)
+    async with db.unit_of_work() as conn:
+        return await devices.create(conn, payload)
 
 
 @router.get("/devices/{device_id}", response_model=DeviceOut)
 async def get_device(device_id: UUID) -> DeviceOut:
-    pool = await db.connect()
-    device = await devices.get_by_id(pool, device_id)
-    if device is None:
-        raise HTTPException(status_code=404, detail="device not found")
-    return device
+    async with db.unit_of_work(readonly=True, sticky=f"device:{device_id}") as conn:
+        device = await devices.get_by_id(conn, device_id)
+        if device is None:
+            raise HTTPException(status_code=404, detail="device not found")
+        return device
 
 
 @router.post("/relying-parties", response_model=RelyingPartyOut)
 async def create_relying_party(payload: RelyingPartyCreate) -> RelyingPartyOut:
-    pool = await db.connect()
-    try:
-        return await relying_parties.create(pool, payload)
-    except UniqueViolationError:
-        raise HTTPException(status_code=409, detail="rp_id already exists")
+    async with db.unit_of_work() as conn:
+        try:
+            return await relying_parties.create(conn, payload)
+        except UniqueViolationError:
+            raise HTTPException(status_code=409, detail="rp_id already exists")
 
 
 @router.post("/enroll", response_model=EnrollmentResponse)
@@ -149,49 +150,37 @@ async def enroll_device(payload: EnrollmentRequest) -> EnrollmentResponse:
 
 @router.post("/login", response_model=LoginStartResponse)
 async def login(payload: LoginRequest, request: Request) -> LoginStartResponse:
-    pool = await db.connect()
-    await login_challenges.prune_expired(pool)
-
-    user = await users.get_by_email(pool, payload.email)
-    if user is None:
+    if email_filter.excluded(payload.email):
         return LoginStartResponse(status="denied", reason="user_not_found")
-
-    device = await devices.get_latest_for_user(pool, user.id)
-    if device is None:
-        return LoginStartResponse(status="denied", reason="device_not_found")
-
-    secret_row = await totp.get_latest_secret_for_user(pool, user.id)
-    if secret_row is None:
-        return LoginStartResponse(status="denied", reason="totp_not_registered")
-
-    rp_id = secret_row["rp_id"]
-    rp = await relying_parties.get_by_rp_id(pool, rp_id)
-    if rp is None:
-        return LoginStartResponse(status="denied", reason="rp_not_found")
-
-    device_key = await device_keys.get_by_device_and_rp(pool, device.id, rp.id)
-    if device_key is None:
-        return LoginStartResponse(status="denied", reason="device_not_enrolled")
-
-    settings = request.app.state.settings
-    secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
-    if not verify_totp(secret, payload.otp):
-        return LoginStartResponse(status="denied", reason="invalid_otp")
-
-    nonce = generate_nonce()
-    otp_hash = hash_otp(payload.otp, settings.recovery_pepper)
-    expires_at = datetime.now(timezone.utc) + timedelta(seconds=120)
-    challenge = await login_challenges.insert(
-        pool=pool,
-        user_id=user.id,
-        device_id=device.id,
-        rp_id=rp_id,
-        nonce=nonce,
-        otp_hash=otp_hash,
-        expires_at=expires_at,
-    )
-    expires_in = int((challenge["expires_at"] - challenge["created_at"]).total_seconds())
-    return LoginStartResponse(status="pending", login_id=challenge["id"], expires_in=expires_in)
+    async with db.unit_of_work() as conn:
+        generation = email_filter.generation()
+        resolved = await login_challenges.resolve_login_start(conn, payload.email)
+        if resolved["reason"] is not None:
+            if resolved["reason"] == "user_not_found":
+                email_filter.note_missing(payload.email, generation)
+            return LoginStartResponse(status="denied", reason=resolved["reason"])
+
+        settings = request.app.state.settings
+        verifier = totp_cache.verifier_for(
+            resolved["user_id"], resolved["rp_id"], resolved["secret_encrypted"], settings.master_key
+        )
+        if not verifier.verify(payload.otp):
+            return LoginStartResponse(status="denied", reason="invalid_otp")
+
+        nonce = generate_nonce()
+        otp_hash = hash_otp(payload.otp, settings.recovery_pepper)
+        expires_at = datetime.now(timezone.utc) + login_challenges.CHALLENGE_TTL
+        challenge = await login_challenges.insert(
+            pool=conn,
+            user_id=resolved["user_id"],
+            device_id=resolved["device_id"],
+            rp_id=resolved["rp_id"],
+            nonce=nonce,
+            otp_hash=otp_hash,
+            expires_at=expires_at,
+        )
+        expires_in = int((challenge["expires_at"] - challenge["created_at"]).total_seconds())
+        return LoginStartResponse(status="pending", login_id=challenge["id"], expires_in=expires_in)
 
 
 @router.get("/login-form")
@@ -308,178 +297,187 @@ async def login_form_submit(payload: dict, request: Request) -> Response:
 
 @router.get("/login/status", response_model=LoginStatusResponse)
 async def login_status(login_id: UUID) -> LoginStatusResponse:
-    pool = await db.connect()
-    challenge = await login_challenges.get_by_id(pool, login_id)
-    if challenge is None:
-        return LoginStatusResponse(status="denied", reason="not_found")
-    return LoginStatusResponse(status=challenge["status"], reason=challenge["denied_reason"])
+    # Challenges are always read on the primary; see README "Read replica".
+    async with db.unit_of_work() as conn:
+        challenge = await login_challenges.get_by_id(conn, login_id)
+        if challenge is None:
+            return LoginStatusResponse(status="denied", reason="not_found")
+        return LoginStatusResponse(status=challenge["status"], reason=challenge["denied_reason"])
 
 
 @router.get("/login/pending", response_model=LoginPendingResponse)
 async def login_pending(user_id: UUID) -> LoginPendingResponse:
-    pool = await db.connect()
-    challenge = await login_challenges.get_pending_for_user(pool, user_id)
-    if challenge is None:
-        return LoginPendingResponse(status="none")
-    expires_in = int((challenge["expires_at"] - challenge["created_at"]).total_seconds())
-    return LoginPendingResponse(
-        status="pending",
-        login_id=challenge["id"],
-        nonce=challenge["nonce"],
-        rp_id=challenge["rp_id"],
-        device_id=challenge["device_id"],
-        expires_in=expires_in,
-    )
+    # Challenges are always read on the primary; see README "Read replica".
+    async with db.unit_of_work() as conn:
+        challenge = await login_challenges.get_pending_for_user(conn, user_id)
+        if challenge is None:
+            return LoginPendingResponse(status="none")
+        expires_in = int((challenge["expires_at"] - challenge["created_at"]).total_seconds())
+        return LoginPendingResponse(
+            status="pending",
+            login_id=challenge["id"],
+            nonce=challenge["nonce"],
+            rp_id=challenge["rp_id"],
+            device_id=challenge["device_id"],
+            expires_in=expires_in,
+        )
 
 
-@router.post("/login/approve", response_model=LoginResponse)
-async def login_approve(payload: LoginApproveRequest, request: Request) -> LoginResponse:
-    pool = await db.connect()
-    challenge = await login_challenges.get_by_id(pool, payload.login_id)
-    if challenge is None or challenge["status"] != "pending":
+async def _deny_login(conn, login_id: UUID, reason: str) -> LoginResponse:
+    if not await login_challenges.mark_denied(conn, login_id, reason):
+        # A concurrent approve/deny already decided this challenge.
         return LoginResponse(status="denied", reason="not_pending")
-    if challenge["device_id"] != payload.device_id or challenge["rp_id"] != payload.rp_id:
-        await login_challenges.mark_denied(pool, payload.login_id, "mismatch")
-        return LoginResponse(status="denied", reason="mismatch")
-
-    rp = await relying_parties.get_by_rp_id(pool, payload.rp_id)
-    if rp is None:
-        await login_challenges.mark_denied(pool, payload.login_id, "rp_not_found")
-        return LoginResponse(status="denied", reason="rp_not_found")
+    return LoginResponse(status="denied", reason=reason)
 
-    device_key = await device_keys.get_by_device_and_rp(pool, payload.device_id, rp.id)
-    if device_key is None:
-        await login_challenges.mark_denied(pool, payload.login_id, "device_not_enrolled")
-        return LoginResponse(status="denied", reason="device_not_enrolled")
 
-    secret_row = await totp.get_secret(pool, challenge["user_id"], payload.rp_id)
-    if secret_row is None:
-        await login_challenges.mark_denied(pool, payload.login_id, "totp_not_registered")
-        return LoginResponse(status="denied", reason="totp_not_registered")
-
-    settings = request.app.state.settings
-    secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
-    if not verify_totp(secret, payload.otp):
-        await login_challenges.mark_denied(pool, payload.login_id, "invalid_otp")
-        return LoginResponse(status="denied", reason="invalid_otp")
-
-    expected_hash = hash_otp(payload.otp, settings.recovery_pepper)
-    if challenge["otp_hash"] != expected_hash:
-        await login_challenges.mark_denied(pool, payload.login_id, "otp_mismatch")
-        return LoginResponse(status="denied", reason="otp_mismatch")
-
-    proof_ok = verify_device_proof(
-        key_type=device_key.key_type,
-        public_key=device_key.public_key,
-        nonce=payload.nonce,
-        device_id=payload.device_id,
-        rp_id=payload.rp_id,
-        otp=payload.otp,
-        signature=payload.signature,
-    )
-    if not proof_ok:
-        await login_challenges.mark_denied(pool, payload.login_id, "invalid_device_proof")
-        return LoginResponse(status="denied", reason="invalid_device_proof")
+@router.post("/login/approve", response_model=LoginResponse)
+async def login_approve(payload: LoginApproveRequest, request: Request) -> LoginResponse:
+    async with db.unit_of_work() as conn:
+        context = await login_challenges.get_approval_context(
+            conn,
+            payload.login_id,
+            payload.device_id,
+            payload.rp_id,
+        )
+        if context is None or context["status"] != "pending":
+            return LoginResponse(status="denied", reason="not_pending")
+        if context["device_id"] != payload.device_id or context["rp_id"] != payload.rp_id:
+            return await _deny_login(conn, payload.login_id, "mismatch")
+        if context["rp_uuid"] is None:
+            return await _deny_login(conn, payload.login_id, "rp_not_found")
+        if context["public_key"] is None:
+            return await _deny_login(conn, payload.login_id, "device_not_enrolled")
+        if context["secret_encrypted"] is None:
+            return await _deny_login(conn, payload.login_id, "totp_not_registered")
+
+        settings = request.app.state.settings
+        verifier = totp_cache.verifier_for(
+            context["user_id"], payload.rp_id, context["secret_encrypted"], settings.master_key
+        )
+        if not verifier.verify(payload.otp):
+            return await _deny_login(conn, payload.login_id, "invalid_otp")
+
+        expected_hash = hash_otp(payload.otp, settings.recovery_pepper)
+        if context["otp_hash"] != expected_hash:
+            return await _deny_login(conn, payload.login_id, "otp_mismatch")
+
+        proof_ok = verify_device_proof(
+            key_type=context["key_type"],
+            public_key=context["public_key"],
+            nonce=payload.nonce,
+            device_id=payload.device_id,
+            rp_id=payload.rp_id,
+            otp=payload.otp,
+            signature=payload.signature,
+            verifier=key_cache.verifier_for(
+                payload.device_id, context["rp_uuid"], context["key_type"], context["public_key"]
+            ),
+        )
+        if not proof_ok:
+            return await _deny_login(conn, payload.login_id, "invalid_device_proof")
 
-    await login_challenges.mark_approved(pool, payload.login_id)
-    return LoginResponse(status="ok", reason=None)
+        if not await login_challenges.mark_approved(conn, payload.login_id):
+            return LoginResponse(status="denied", reason="not_pending")
+        return LoginResponse(status="ok", reason=None)
 
 
 @router.post("/login/deny", response_model=LoginResponse)
 async def login_deny(payload: LoginDenyRequest) -> LoginResponse:
-    pool = await db.connect()
-    challenge = await login_challenges.get_by_id(pool, payload.login_id)
-    if challenge is None:
-        return LoginResponse(status="denied", reason="not_found")
-    if challenge["status"] != "pending":
+    async with db.unit_of_work() as conn:
+        if await login_challenges.mark_denied(conn, payload.login_id, payload.reason):
+            return LoginResponse(status="denied", reason=payload.reason)
+        challenge = await login_challenges.get_by_id(conn, payload.login_id)
+        if challenge is None:
+            return LoginResponse(status="denied", reason="not_found")
         return LoginResponse(status=challenge["status"], reason=challenge["denied_reason"])
-    await login_challenges.mark_denied(pool, payload.login_id, payload.reason)
-    return LoginResponse(status="denied", reason=payload.reason)
 
 
 @router.post("/login/clear", response_model=LoginClearResponse)
 async def login_clear(payload: LoginClearRequest) -> LoginClearResponse:
-    pool = await db.connect()
-    cleared = await login_challenges.clear_pending_for_user(pool, payload.user_id)
-    return LoginClearResponse(status="ok", cleared=cleared)
+    async with db.unit_of_work() as conn:
+        cleared = await login_challenges.clear_pending_for_user(conn, payload.user_id)
+        return LoginClearResponse(status="ok", cleared=cleared)
 
 
 @router.post("/login/recover", response_model=LoginRecoveryResponse)
 async def login_recovery(payload: LoginRecoveryRequest, request: Request) -> LoginRecoveryResponse:
-    pool = await db.connect()
-    user = await users.get_by_email(pool, payload.email)
-    if user is None:
+    if email_filter.excluded(payload.email):
         return LoginRecoveryResponse(status="denied", reason="user_not_found")
-    settings = request.app.state.settings
-    ok = await verify_recovery_code(
-        pool=pool,
-        user_id=user.id,
-        code=payload.recovery_code,
-        recovery_pepper=settings.recovery_pepper,
-    )
-    if not ok:
-        return LoginRecoveryResponse(status="denied", reason="invalid_recovery_code")
-    return LoginRecoveryResponse(status="ok", reason=None)
+    async with db.unit_of_work() as conn:
+        generation = email_filter.generation()
+        user = await users.get_by_email(conn, payload.email)
+        if user is None:
+            email_filter.note_missing(payload.email, generation)
+            return LoginRecoveryResponse(status="denied", reason="user_not_found")
+        settings = request.app.state.settings
+        ok = await verify_recovery_code(
+            pool=conn,
+            user_id=user.id,
+            code=payload.recovery_code,
+            recovery_pepper=settings.recovery_pepper,
+        )
+        if not ok:
+            return LoginRecoveryResponse(status="denied", reason="invalid_recovery_code")
+        return LoginRecoveryResponse(status="ok", reason=None)
 
 
 @router.post("/zt/challenge", response_model=ChallengeResponse)
 async def zt_challenge(payload: ChallengeRequest) -> ChallengeResponse:
-    pool = await db.connect()
-    challenge = await issue_challenge(pool, payload.device_id, payload.rp_id)
-    ttl = int((challenge["expires_at"] - challenge["created_at"]).total_seconds())
-    return ChallengeResponse(nonce=challenge["nonce"], expires_in=ttl)
+    async with db.unit_of_work() as conn:
+        challenge = await issue_challenge(conn, payload.device_id, payload.rp_id)
+        ttl = int((challenge["expires_at"] - challenge["created_at"]).total_seconds())
+        return ChallengeResponse(nonce=challenge["nonce"], expires_in=ttl)
 
 
 @router.post("/zt/verify", response_model=ZtVerifyResponse)
 async def zt_verify(payload: ZtVerifyRequest, request: Request) -> ZtVerifyResponse:
-    pool = await db.connect()
-    started = monotonic()
-    if not await device_key_exists(pool, payload.device_id, payload.rp_id):
-        logger.info("zt_verify denied reason=device_not_enrolled")
-        return ZtVerifyResponse(status="denied", reason="device_not_enrolled")
-
-    secret_row = await totp.get_secret(pool, payload.user_id, payload.rp_id)
-    if secret_row is None:
-        logger.info("zt_verify denied reason=totp_not_registered")
-        return ZtVerifyResponse(status="denied", reason="totp_not_registered")
-
-    secret = decrypt_secret(secret_row["secret_encrypted"], request.app.state.settings.master_key)
-    if not verify_totp(secret, payload.otp):
-        logger.info("zt_verify denied reason=invalid_otp")
-        return ZtVerifyResponse(status="denied", reason="invalid_otp")
-
-    challenge = await challenges.get_valid_challenge(
-        pool,
-        payload.device_id,
-        payload.rp_id,
-        payload.device_proof.nonce,
-    )
-    if challenge is None:
-        logger.info("zt_verify denied reason=invalid_or_expired_nonce")
-        return ZtVerifyResponse(status="denied", reason="invalid_or_expired_nonce")
-
-    device_key = await get_device_key_for_rp(pool, payload.device_id, payload.rp_id)
-    if device_key is None:
-        logger.info("zt_verify denied reason=device_not_enrolled")
-        return ZtVerifyResponse(status="denied", reason="device_not_enrolled")
-
-    proof_ok = verify_device_proof(
-        key_type=device_key.key_type,
-        public_key=device_key.public_key,
-        nonce=payload.device_proof.nonce,
-        device_id=payload.device_id,
-        rp_id=payload.rp_id,
-        otp=payload.otp,
-        signature=payload.device_proof.signature,
-    )
-    if not proof_ok:
-        logger.info("zt_verify denied reason=invalid_device_proof")
-        return ZtVerifyResponse(status="denied", reason="invalid_device_proof")
+    async with db.unit_of_work() as conn:
+        started = monotonic()
+        device_key = await get_device_key_for_rp(conn, payload.device_id, payload.rp_id)
+        if device_key is None:
+            logger.info("zt_verify denied reason=device_not_enrolled")
+            return ZtVerifyResponse(status="denied", reason="device_not_enrolled")
+
+        secret_row = await totp.get_secret(conn, payload.user_id, payload.rp_id)
+        if secret_row is None:
+            logger.info("zt_verify denied reason=totp_not_registered")
+            return ZtVerifyResponse(status="denied", reason="totp_not_registered")
+
+        verifier = totp_cache.verifier_for(
+            payload.user_id, payload.rp_id, secret_row["secret_encrypted"], request.app.state.settings.master_key
+        )
+        if not verifier.verify(payload.otp):
+            logger.info("zt_verify denied reason=invalid_otp")
+            return ZtVerifyResponse(status="denied", reason="invalid_otp")
+
+        # The nonce is single-use from here on, even if the proof below fails.
+        challenge = await challenges.claim(
+            conn,
+            payload.device_id,
+            payload.rp_id,
+            payload.device_proof.nonce,
+        )
+        if challenge is None:
+            logger.info("zt_verify denied reason=invalid_or_expired_nonce")
+            return ZtVerifyResponse(status="denied", reason="invalid_or_expired_nonce")
+
+        proof_ok = verify_device_proof(
+            key_type=device_key.key_type,
+            public_key=device_key.public_key,
+            nonce=payload.device_proof.nonce,
+            device_id=payload.device_id,
+            rp_id=payload.rp_id,
+            otp=payload.otp,
+            signature=payload.device_proof.signature,
+            verifier=device_key.verifier,
+        )
+        if not proof_ok:
+            logger.info("zt_verify denied reason=invalid_device_proof")
+            return ZtVerifyResponse(status="denied", reason="invalid_device_proof")
 
-    await challenges.consume_challenge(pool, challenge["id"])
-    duration_ms = int((monotonic() - started) * 1000)
-    logger.info("zt_verify ok duration_ms=%s", duration_ms)
-    return ZtVerifyResponse(status="ok", reason=None)
+        duration_ms = int((monotonic() - started) * 1000)
+        logger.info("zt_verify ok duration_ms=%s", duration_ms)
+        return ZtVerifyResponse(status="ok", reason=None)
 
 
 @router.post("/zt/debug-proof")
@@ -488,40 +486,40 @@ async def zt_debug_proof(payload: ZtVerifyRequest, request: Request) -> dict:
     if settings.app_env != "development":
         raise HTTPException(status_code=404, detail="not found")
 
-    pool = await db.connect()
-    device_key = await get_device_key_for_rp(pool, payload.device_id, payload.rp_id)
-    if device_key is None:
-        raise HTTPException(status_code=404, detail="device key not found")
-
-    message = f"{payload.device_proof.nonce}|{payload.device_id}|{payload.rp_id}|{payload.otp}"
-    try:
-        signature_bytes = base64.b64decode(payload.device_proof.signature)
-        signature_len = len(signature_bytes)
-    except Exception:
-        signature_len = 0
-    try:
-        public_bytes = base64.b64decode(device_key.public_key)
-        public_len = len(public_bytes)
-    except Exception:
-        public_len = 0
-
-    signature_ok = verify_device_proof(
-        key_type=device_key.key_type,
-        public_key=device_key.public_key,
-        nonce=payload.device_proof.nonce,
-        device_id=payload.device_id,
-        rp_id=payload.rp_id,
-        otp=payload.otp,
-        signature=payload.device_proof.signature,
-    )
-    return {
-        "key_type": device_key.key_type,
-        "public_key_len": public_len,
-        "public_key_format": "raw" if public_len == 32 else "der",
-        "signature_len": signature_len,
-        "message": message,
-        "signature_valid": signature_ok,
-    }
+    async with db.unit_of_work(readonly=True, sticky=f"device:{payload.device_id}") as conn:
+        device_key = await get_device_key_for_rp(conn, payload.device_id, payload.rp_id)
+        if device_key is None:
+            raise HTTPException(status_code=404, detail="device key not found")
+
+        message = f"{payload.device_proof.nonce}|{payload.device_id}|{payload.rp_id}|{payload.otp}"
+        try:
+            signature_bytes = base64.b64decode(payload.device_proof.signature)
+            signature_len = len(signature_bytes)
+        except Exception:
+            signature_len = 0
+        try:
+            public_bytes = base64.b64decode(device_key.public_key)
+            public_len = len(public_bytes)
+        except Exception:
+            public_len = 0
+
+        signature_ok = verify_device_proof(
+            key_type=device_key.key_type,
+            public_key=device_key.public_key,
+            nonce=payload.device_proof.nonce,
+            device_id=payload.device_id,
+            rp_id=payload.rp_id,
+            otp=payload.otp,
+            signature=payload.device_proof.signature,
+        )
+        return {
+            "key_type": device_key.key_type,
+            "public_key_len": public_len,
+            "public_key_format": "raw" if public_len == 32 else "der",
+            "signature_len": signature_len,
+            "message": message,
+            "signature_valid": signature_ok,
+        }
 
 
 @router.post("/totp/register", response_model=TotpRegisterResponse)
@@ -529,29 +527,31 @@ async def totp_register(
     payload: TotpRegisterRequest,
     request: Request,
 ) -> TotpRegisterResponse:
-    pool = await db.connect()
-    user = await users.get_by_id(pool, payload.user_id)
-    if user is None:
-        raise HTTPException(status_code=404, detail="user not found")
-
-    settings = request.app.state.settings
-    try:
-        otpauth_uri, recovery_codes = await register_totp(
-            pool=pool,
-            user_id=payload.user_id,
-            rp_id=payload.rp_id,
-            account_name=payload.account_name,
-            issuer=payload.issuer,
-            master_key=settings.master_key,
-            recovery_pepper=settings.recovery_pepper,
+    async with db.unit_of_work() as conn:
+        user = await users.get_by_id(conn, payload.user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="user not found")
+
+        settings = request.app.state.settings
+        try:
+            otpauth_uri, recovery_codes = await register_totp(
+                pool=conn,
+                user_id=payload.user_id,
+                rp_id=payload.rp_id,
+                account_name=payload.account_name,
+                issuer=payload.issuer,
+                master_key=settings.master_key,
+                recovery_pepper=settings.recovery_pepper,
+            )
+        except UniqueViolationError:
+            raise HTTPException(status_code=409, detail="totp already registered")
+        totp_cache.invalidate(payload.user_id, payload.rp_id)
+        db.note_write(f"user:{payload.user_id}")
+
+        return TotpRegisterResponse(
+            otpauth_uri=otpauth_uri,
+            recovery_codes=recovery_codes,
         )
-    except UniqueViolationError:
-        raise HTTPException(status_code=409, detail="totp already registered")
-
-    return TotpRegisterResponse(
-        otpauth_uri=otpauth_uri,
-        recovery_codes=recovery_codes,
-    )
 
 
 @router.post("/totp/verify", response_model=TotpVerifyResponse)
@@ -559,22 +559,23 @@ async def totp_verify(
     payload: TotpVerifyRequest,
     request: Request,
 ) -> TotpVerifyResponse:
-    pool = await db.connect()
-    settings = request.app.state.settings
-    started = monotonic()
+    async with db.unit_of_work(readonly=True, sticky=f"user:{payload.user_id}") as conn:
+        settings = request.app.state.settings
+        started = monotonic()
 
-    secret_row = await totp.get_secret(pool, payload.user_id, payload.rp_id)
-    if secret_row is None:
-        raise HTTPException(status_code=404, detail="totp not registered")
+        secret_row = await totp.get_secret(conn, payload.user_id, payload.rp_id)
+        if secret_row is None:
+            raise HTTPException(status_code=404, detail="totp not registered")
 
-    secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
-    ok = verify_totp(secret, payload.otp)
-    if not ok:
-        logger.info("totp_verify denied reason=invalid_otp")
-        return TotpVerifyResponse(status="denied", reason="invalid_otp")
-    duration_ms = int((monotonic() - started) * 1000)
-    logger.info("totp_verify ok duration_ms=%s", duration_ms)
-    return TotpVerifyResponse(status="ok", reason=None)
+        verifier = totp_cache.verifier_for(
+            payload.user_id, payload.rp_id, secret_row["secret_encrypted"], settings.master_key
+        )
+        if not verifier.verify(payload.otp):
+            logger.info("totp_verify denied reason=invalid_otp")
+            return TotpVerifyResponse(status="denied", reason="invalid_otp")
+        duration_ms = int((monotonic() - started) * 1000)
+        logger.info("totp_verify ok duration_ms=%s", duration_ms)
+        return TotpVerifyResponse(status="ok", reason=None)
 
 
 @router.post("/totp/recovery/verify", response_model=RecoveryVerifyResponse)
@@ -582,36 +583,39 @@ async def totp_recovery_verify(
     payload: RecoveryVerifyRequest,
     request: Request,
 ) -> RecoveryVerifyResponse:
-    pool = await db.connect()
-    settings = request.app.state.settings
-    ok = await verify_recovery_code(
-        pool=pool,
-        user_id=payload.user_id,
-        code=payload.code,
-        recovery_pepper=settings.recovery_pepper,
-    )
-    if not ok:
-        logger.info("totp_recovery denied reason=invalid_code")
-        return RecoveryVerifyResponse(status="denied", reason="invalid_code")
-    logger.info("totp_recovery ok")
-    return RecoveryVerifyResponse(status="ok", reason=None)
+    async with db.unit_of_work() as conn:
+        settings = request.app.state.settings
+        ok = await verify_recovery_code(
+            pool=conn,
+            user_id=payload.user_id,
+            code=payload.code,
+            recovery_pepper=settings.recovery_pepper,
+        )
+        if not ok:
+            logger.info("totp_recovery denied reason=invalid_code")
+            return RecoveryVerifyResponse(status="denied", reason="invalid_code")
+        logger.info("totp_recovery ok")
+        return RecoveryVerifyResponse(status="ok", reason=None)
 
 
 @router.post("/zt/rotate-key", response_model=DeviceKeyRotateResponse)
 async def zt_rotate_key(payload: DeviceKeyRotateRequest) -> DeviceKeyRotateResponse:
-    pool = await db.connect()
-    rp = await relying_parties.get_by_rp_id(pool, payload.rp_id)
-    if rp is None:
-        return DeviceKeyRotateResponse(status="denied", reason="rp_not_found")
-    await device_keys.upsert_by_device_and_rp(
-        pool,
-        payload.device_id,
-        rp.id,
-        payload.key_type,
-        payload.public_key,
-    )
-    logger.info("zt_rotate_key ok device_id=%s rp_id=%s", payload.device_id, payload.rp_id)
-    return DeviceKeyRotateResponse(status="ok", reason=None)
+    async with db.unit_of_work() as conn:
+        rp = await rp_cache.get_by_rp_id(conn, payload.rp_id)
+        if rp is None:
+            return DeviceKeyRotateResponse(status="denied", reason="rp_not_found")
+        await device_keys.upsert_by_device_and_rp(
+            conn,
+            payload.device_id,
+            rp.id,
+            payload.key_type,
+            payload.public_key,
+        )
+        # Other workers drop their copy when the UPDATE's NOTIFY arrives.
+        key_cache.invalidate(payload.device_id, rp.id)
+        db.note_write(f"device:{payload.device_id}")
+        logger.info("zt_rotate_key ok device_id=%s rp_id=%s", payload.device_id, payload.rp_id)
+        return DeviceKeyRotateResponse(status="ok", reason=None)
 
 
 @router.get("/enroll/qr")
@@ -722,13 +726,13 @@ async def totp_debug_code(
     if settings.app_env != "development":
         raise HTTPException(status_code=404, detail="not found")
 
-    pool = await db.connect()
-    secret_row = await totp.get_secret(pool, user_id, rp_id)
-    if secret_row is None:
-        raise HTTPException(status_code=404, detail="totp not registered")
+    async with db.unit_of_work(readonly=True, sticky=f"user:{user_id}") as conn:
+        secret_row = await totp.get_secret(conn, user_id, rp_id)
+        if secret_row is None:
+            raise HTTPException(status_code=404, detail="totp not registered")
 
-    secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
-    return {"otp": current_totp(secret)}
+        secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
+        return {"otp": current_totp(secret)}
 
 
 @router.get("/totp/debug-state")
@@ -741,16 +745,16 @@ async def totp_debug_state(
     if settings.app_env != "development":
         raise HTTPException(status_code=404, detail="not found")
 
-    pool = await db.connect()
-    secret_row = await totp.get_secret(pool, user_id, rp_id)
-    if secret_row is None:
-        raise HTTPException(status_code=404, detail="totp not registered")
+    async with db.unit_of_work(readonly=True, sticky=f"user:{user_id}") as conn:
+        secret_row = await totp.get_secret(conn, user_id, rp_id)
+        if secret_row is None:
+            raise HTTPException(status_code=404, detail="totp not registered")
 
-    secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
-    return {
-        "otp": current_totp(secret),
-        "server_time": int(time.time()),
-    }
+        secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
+        return {
+            "otp": current_totp(secret),
+            "server_time": int(time.time()),
+        }
 
 
 @router.get("/totp/debug-secret")
@@ -763,34 +767,37 @@ async def totp_debug_secret(
     if settings.app_env != "development":
         raise HTTPException(status_code=404, detail="not found")
 
-    pool = await db.connect()
-    secret_row = await totp.get_secret(pool, user_id, rp_id)
-    if secret_row is None:
-        raise HTTPException(status_code=404, detail="totp not registered")
+    async with db.unit_of_work(readonly=True, sticky=f"user:{user_id}") as conn:
+        secret_row = await totp.get_secret(conn, user_id, rp_id)
+        if secret_row is None:
+            raise HTTPException(status_code=404, detail="totp not registered")
 
-    secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
-    return {"secret": secret}
+        secret = decrypt_secret(secret_row["secret_encrypted"], settings.master_key)
+        return {"secret": secret}
 
 
 @router.get("/relying-parties/{rp_uuid}", response_model=RelyingPartyOut)
 async def get_relying_party(rp_uuid: UUID) -> RelyingPartyOut:
-    pool = await db.connect()
-    rp = await relying_parties.get_by_id(pool, rp_uuid)
-    if rp is None:
-        raise HTTPException(status_code=404, detail="relying party not found")
-    return rp
+    async with db.unit_of_work(readonly=True, sticky=f"rp:{rp_uuid}") as conn:
+        rp = await rp_cache.get_by_id(conn, rp_uuid)
+        if rp is None:
+            raise HTTPException(status_code=404, detail="relying party not found")
+        return rp
 
 
 @router.post("/device-keys", response_model=DeviceKeyOut)
 async def create_device_key(payload: DeviceKeyCreate) -> DeviceKeyOut:
-    pool = await db.connect()
-    return await device_keys.create(pool, payload)
+    async with db.unit_of_work() as conn:
+        try:
+            return await device_keys.create(conn, payload)
+        except UniqueViolationError:
+            raise HTTPException(status_code=409, detail="device key already exists")
 
 
 @router.get("/device-keys/{key_id}", response_model=DeviceKeyOut)
 async def get_device_key(key_id: UUID) -> DeviceKeyOut:
-    pool = await db.connect()
-    key = await device_keys.get_by_id(pool, key_id)
-    if key is None:
-        raise HTTPException(status_code=404, detail="device key not found")
-    return key
+    async with db.unit_of_work(readonly=True) as conn:
+        key = await device_keys.get_by_id(conn, key_id)
+        if key is None:
+            raise HTTPException(status_code=404, detail="device key not found")
+        return key
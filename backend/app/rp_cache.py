@@ -0,0 +1,100 @@
+"""Read-through cache of relying parties, by ``rp_id`` and by UUID.
+
+The table is tiny and almost never changes, so each worker keeps what it
+has read. Entries are dropped when the invalidation listener reports a
+change to the row, and everything is dropped when the listener reconnects.
+While the listener is down (or on a non-Postgres storage backend) lookups go
+straight to the repository, so a missed change can never be served. The
+TTL bounds staleness should the listener itself misbehave.
+
+Misses are not cached: an unknown ``rp_id`` is looked up every time.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID
+
+from app import invalidation
+from app.cache import MISSING, TTLCache
+from app.config import Settings
+from app.models import RelyingPartyOut
+from app.repositories import relying_parties
+
+
+@dataclass(frozen=True)
+class RpCacheConfig:
+    max_size: int = 1024
+    ttl: float = 300.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "RpCacheConfig":
+        return cls(max_size=settings.rp_cache_size, ttl=settings.rp_cache_ttl)
+
+
+_by_rp_id = TTLCache(RpCacheConfig.max_size, RpCacheConfig.ttl)
+_by_id = TTLCache(RpCacheConfig.max_size, RpCacheConfig.ttl)
+_bypassed = 0
+
+
+def configure(config: RpCacheConfig) -> None:
+    global _by_rp_id, _by_id
+    _by_rp_id = TTLCache(config.max_size, config.ttl)
+    _by_id = TTLCache(config.max_size, config.ttl)
+
+
+def _remember(rp: RelyingPartyOut, generation: tuple[int, int]) -> None:
+    _by_rp_id.put(rp.rp_id, rp, generation[0])
+    _by_id.put(rp.id, rp, generation[1])
+
+
+async def get_by_rp_id(pool, rp_id: str) -> Optional[RelyingPartyOut]:
+    global _bypassed
+    if not invalidation.listening():
+        _bypassed += 1
+        return await relying_parties.get_by_rp_id(pool, rp_id)
+    cached = _by_rp_id.get(rp_id)
+    if cached is not MISSING:
+        return cached
+    generation = (_by_rp_id.generation, _by_id.generation)
+    rp = await relying_parties.get_by_rp_id(pool, rp_id)
+    if rp is not None:
+        _remember(rp, generation)
+    return rp
+
+
+async def get_by_id(pool, rp_uuid: UUID) -> Optional[RelyingPartyOut]:
+    global _bypassed
+    if not invalidation.listening():
+        _bypassed += 1
+        return await relying_parties.get_by_id(pool, rp_uuid)
+    cached = _by_id.get(rp_uuid)
+    if cached is not MISSING:
+        return cached
+    generation = (_by_rp_id.generation, _by_id.generation)
+    rp = await relying_parties.get_by_id(pool, rp_uuid)
+    if rp is not None:
+        _remember(rp, generation)
+    return rp
+
+
+def on_invalidate(event: Optional[dict]) -> None:
+    """``invalidation`` subscriber for the relying_parties table."""
+    if event is None:
+        _by_rp_id.clear()
+        _by_id.clear()
+        return
+    if event.get("op") == "INSERT":
+        # Nothing cached can describe a row that did not exist.
+        return
+    for rp_id in {event.get("key"), event.get("old_key")} - {None}:
+        _by_rp_id.pop(rp_id)
+    if event.get("id"):
+        _by_id.pop(UUID(event["id"]))
+
+
+def stats() -> dict:
+    return {
+        "by_rp_id": _by_rp_id.stats(),
+        "by_id": _by_id.stats(),
+        "bypassed": _bypassed,
+    }
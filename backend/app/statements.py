@@ -0,0 +1,208 @@
+"""Named SQL statements shared by every repository module.
+
+Each repository registers its SQL here at import time. New pool connections
+prepare the whole registry from the pool ``init`` callback, so the first
+request served by a fresh connection skips the parse/plan round trip.
+"""
+
+import logging
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import AsyncIterator, Dict, Optional
+
+import asyncpg
+from asyncpg.pool import PoolConnectionProxy
+from asyncpg.prepared_stmt import PreparedStatement
+
+from app.metrics import Histogram
+from app.storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+class StatementConnection(asyncpg.Connection):
+    """Connection class that keeps the registry's prepared statements."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared_statements: Dict[str, PreparedStatement] = {}
+
+
+class Statement:
+    def __init__(
+        self,
+        name: str,
+        sql: str,
+        readonly: bool = False,
+        sticky: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.sql = sql
+        # Read-only statements may be routed to the replica when run on a pool.
+        self.readonly = readonly
+        # Read-your-writes key kind; the first argument is the key value.
+        self.sticky = sticky
+        self.prepare_ms = Histogram()
+        self.execute_ms = Histogram()
+        self.errors = 0
+
+    async def prepare(self, conn: asyncpg.Connection) -> PreparedStatement:
+        started = monotonic()
+        prepared = await conn.prepare(self.sql)
+        self.prepare_ms.observe((monotonic() - started) * 1000)
+        conn.prepared_statements[self.name] = prepared
+        return prepared
+
+    async def _prepared(self, conn) -> Optional[PreparedStatement]:
+        cache = getattr(conn, "prepared_statements", None)
+        if cache is None:
+            # Plain connections (scripts, psql-style tooling) fall back to
+            # asyncpg's implicit statement cache.
+            return None
+        prepared = cache.get(self.name)
+        if prepared is None:
+            prepared = await self.prepare(conn)
+        return prepared
+
+    def _sticky_key(self, args: tuple) -> Optional[str]:
+        if self.sticky is None or not args:
+            return None
+        return f"{self.sticky}:{args[0]}"
+
+    async def _run(self, executor, method: str, args: tuple):
+        executor = _routes.get(self.name, executor)
+        if isinstance(executor, StorageBackend):
+            return await self._run_on_backend(executor, method, args)
+        if self.readonly and not _is_connection(executor):
+            route_read = getattr(executor, "route_read", None)
+            if route_read is not None:
+                executor = route_read(self._sticky_key(args))
+        async with _connection(executor) as conn:
+            started = monotonic()
+            try:
+                prepared = await self._prepared(conn)
+                if prepared is None:
+                    if method == "execute":
+                        return await conn.execute(self.sql, *args)
+                    return await getattr(conn, method)(self.sql, *args)
+                if method == "execute":
+                    await prepared.fetch(*args)
+                    return prepared.get_statusmsg()
+                return await getattr(prepared, method)(*args)
+            except (asyncpg.InvalidCachedStatementError, asyncpg.FeatureNotSupportedError):
+                # Schema changed under a prepared plan; re-prepare on next use.
+                getattr(conn, "prepared_statements", {}).pop(self.name, None)
+                self.errors += 1
+                raise
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.execute_ms.observe((monotonic() - started) * 1000)
+
+    async def _run_on_backend(self, backend: StorageBackend, method: str, args: tuple):
+        started = monotonic()
+        try:
+            return await backend.run(self.name, method, args)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.execute_ms.observe((monotonic() - started) * 1000)
+
+    async def fetch(self, executor, *args) -> list:
+        return await self._run(executor, "fetch", args)
+
+    async def fetchrow(self, executor, *args) -> Optional[asyncpg.Record]:
+        return await self._run(executor, "fetchrow", args)
+
+    async def fetchval(self, executor, *args):
+        return await self._run(executor, "fetchval", args)
+
+    async def execute(self, executor, *args) -> str:
+        return await self._run(executor, "execute", args)
+
+    def stats(self) -> dict:
+        return {
+            "prepare_ms": self.prepare_ms.snapshot(),
+            "execute_ms": self.execute_ms.snapshot(),
+            "errors": self.errors,
+        }
+
+
+_registry: Dict[str, Statement] = {}
+
+
+def register(
+    name: str,
+    sql: str,
+    readonly: bool = False,
+    sticky: Optional[str] = None,
+) -> Statement:
+    if name in _registry:
+        raise RuntimeError(f"statement {name} is already registered")
+    statement = Statement(name, sql, readonly=readonly, sticky=sticky)
+    _registry[name] = statement
+    return statement
+
+
+def all_statements() -> Dict[str, Statement]:
+    return dict(_registry)
+
+
+# Statement name -> backend that serves it whatever executor the caller passes.
+_routes: Dict[str, StorageBackend] = {}
+
+
+def route(backend: StorageBackend) -> None:
+    """Send every statement ``backend`` handles to it, even when run on a Postgres pool or connection.
+
+    For a store that takes over part of the schema, such as the Redis
+    challenge store. Statements it does not handle stay where they were.
+    """
+    for name in backend.statement_names():
+        if name not in _registry:
+            raise RuntimeError(f"{backend.name} handles unknown statement {name}")
+        _routes[name] = backend
+
+
+def routed(statement: Statement) -> bool:
+    return statement.name in _routes
+
+
+def _is_connection(executor) -> bool:
+    return isinstance(executor, (asyncpg.Connection, PoolConnectionProxy))
+
+
+@asynccontextmanager
+async def _connection(executor) -> AsyncIterator[asyncpg.Connection]:
+    if _is_connection(executor):
+        yield executor
+        return
+    async with executor.acquire() as conn:
+        yield conn
+
+
+async def prepare_connection(conn: asyncpg.Connection) -> None:
+    """Pool ``init`` callback: prepare every registered statement."""
+    await _prepare_all(conn, _registry.values())
+
+
+async def prepare_read_connection(conn: asyncpg.Connection) -> None:
+    """Replica pool ``init`` callback: only read-only statements run there."""
+    await _prepare_all(conn, [s for s in _registry.values() if s.readonly])
+
+
+async def _prepare_all(conn: asyncpg.Connection, to_prepare) -> None:
+    for statement in to_prepare:
+        try:
+            await statement.prepare(conn)
+        except asyncpg.PostgresError as exc:
+            # A missing migration must not take the whole pool down; the
+            # statement is prepared lazily (and fails loudly) on first use.
+            statement.errors += 1
+            logger.warning("prepare failed statement=%s error=%s", statement.name, exc)
+
+
+def stats() -> dict:
+    return {name: statement.stats() for name, statement in sorted(_registry.items())}
@@ -0,0 +1,4 @@
+from app.storage.base import StorageBackend, handles
+from app.storage.memory import MemoryBackend
+from app.storage.redis_store import RedisChallengeConfig, RedisChallengeStore
+from app.storage.sqlite import SqliteBackend, SqliteConfig
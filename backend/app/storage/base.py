@@ -0,0 +1,86 @@
+"""Storage backend interface for the statement registry.
+
+Repositories run every query through a registered :class:`app.statements.Statement`.
+When the executor handed to a repository function is a :class:`StorageBackend`
+instead of an asyncpg pool or connection, the statement is dispatched by
+name to the backend's handler for it. So routes, services and repositories
+are the same for every backend; only the handlers differ.
+
+A handler takes the statement's positional arguments and returns a list of
+row dicts, with keys matching the SQL's result columns. It may also return
+an int, the affected row count for ``execute``. Handlers raise the asyncpg
+exceptions Postgres would, such as ``UniqueViolationError``, so callers'
+error handling does not change.
+"""
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict
+
+
+def handles(name: str, readonly: bool = False) -> Callable:
+    """Mark a backend method as the handler for the statement ``name``.
+
+    ``readonly`` handlers never write, so backends may run them concurrently
+    with each other and with writes.
+    """
+
+    def decorate(func: Callable) -> Callable:
+        func.statement_name = name
+        func.readonly = readonly
+        return func
+
+    return decorate
+
+
+class StorageBackend:
+    name = "base"
+
+    def __init__(self) -> None:
+        self._handlers: Dict[str, Callable] = {}
+        for attr in dir(type(self)):
+            func = getattr(self, attr)
+            statement_name = getattr(func, "statement_name", None)
+            if statement_name is not None:
+                self._handlers[statement_name] = func
+
+    def supports(self, statement_name: str) -> bool:
+        return statement_name in self._handlers
+
+    def statement_names(self) -> list[str]:
+        return sorted(self._handlers)
+
+    async def run(self, statement_name: str, method: str, args: tuple):
+        handler = self._handlers.get(statement_name)
+        if handler is None:
+            raise NotImplementedError(f"{self.name} backend has no handler for statement {statement_name}")
+        result = await self._call(handler, args)
+        return _shape(method, result)
+
+    async def _call(self, handler: Callable, args: tuple):
+        return handler(*args)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator["StorageBackend"]:
+        # Mirrors InstrumentedPool.acquire so pool-shaped callers keep working.
+        yield self
+
+    async def close(self) -> None:
+        return None
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+def _shape(method: str, result):
+    if method == "execute":
+        # Callers only read the trailing row count of the command tag.
+        count = result if isinstance(result, int) else len(result)
+        return f"EXECUTE {count}"
+    rows = result if isinstance(result, list) else []
+    if method == "fetch":
+        return rows
+    if method == "fetchrow":
+        return rows[0] if rows else None
+    if method == "fetchval":
+        return next(iter(rows[0].values())) if rows else None
+    raise ValueError(f"unknown statement method {method}")
@@ -0,0 +1,601 @@
+"""In-memory storage backend.
+
+Every table is a dict keyed by primary key, plus secondary-index dicts for
+each lookup the repositories make, so every statement is O(1) or O(rows for
+one user) and never a scan. The exceptions are ``expire_batch`` and
+``archive_batch``, which are background jobs. The backend keeps the schema's
+semantics:
+
+- unique constraints and foreign keys raise the asyncpg errors Postgres would,
+- challenges past ``expires_at`` are never claimable or approvable,
+- login challenges only move out of ``pending``.
+
+Handlers are synchronous and run without yielding to the event loop, so each
+statement is atomic, as in Postgres. Transactions spanning several statements
+are not rolled back.
+
+Nothing is persisted. Use it for profiling the app without a database, not
+for deployments.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import asyncpg
+
+from app.storage.base import StorageBackend, handles
+
+# Expired device challenges are swept every this many inserts so the store
+# stays bounded without a background job.
+_SWEEP_EVERY = 1000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _unique(constraint: str) -> asyncpg.UniqueViolationError:
+    return asyncpg.UniqueViolationError(f'duplicate key value violates unique constraint "{constraint}"')
+
+
+def _foreign_key(constraint: str) -> asyncpg.ForeignKeyViolationError:
+    return asyncpg.ForeignKeyViolationError(
+        f'insert or update violates foreign key constraint "{constraint}"'
+    )
+
+
+class MemoryBackend(StorageBackend):
+    name = "memory"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.users: Dict[UUID, dict] = {}
+        self.users_by_email: Dict[str, UUID] = {}
+        self.devices: Dict[UUID, dict] = {}
+        self.devices_by_user: Dict[UUID, List[UUID]] = {}
+        self.relying_parties: Dict[UUID, dict] = {}
+        self.rps_by_rp_id: Dict[str, UUID] = {}
+        self.device_keys: Dict[UUID, dict] = {}
+        self.keys_by_device_rp: Dict[Tuple[UUID, UUID], UUID] = {}
+        self.totp_secrets: Dict[UUID, dict] = {}
+        self.secrets_by_user_rp: Dict[Tuple[UUID, str], UUID] = {}
+        self.secrets_by_user: Dict[UUID, List[UUID]] = {}
+        self.recovery_codes: Dict[UUID, dict] = {}
+        self.codes_by_user_hash: Dict[Tuple[UUID, str], List[UUID]] = {}
+        self.device_challenges: Dict[UUID, dict] = {}
+        self.challenges_by_nonce: Dict[Tuple[UUID, str, str], List[UUID]] = {}
+        self.login_challenges: Dict[UUID, dict] = {}
+        self.pending_by_user: Dict[UUID, Dict[UUID, None]] = {}
+        self._inserts_since_sweep = 0
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "rows": {
+                "users": len(self.users),
+                "devices": len(self.devices),
+                "relying_parties": len(self.relying_parties),
+                "device_keys": len(self.device_keys),
+                "totp_secrets": len(self.totp_secrets),
+                "recovery_codes": len(self.recovery_codes),
+                "device_challenges": len(self.device_challenges),
+                "login_challenges": len(self.login_challenges),
+            },
+        }
+
+    # -- users -------------------------------------------------------------
+
+    def _insert_user(self, user_id: UUID, email: str) -> dict:
+        if email in self.users_by_email:
+            raise _unique("users_email_key")
+        if user_id in self.users:
+            raise _unique("users_pkey")
+        row = {"id": user_id, "email": email, "created_at": _now()}
+        self.users[user_id] = row
+        self.users_by_email[email] = user_id
+        return row
+
+    def _delete_user(self, user_id: UUID) -> None:
+        row = self.users.pop(user_id)
+        del self.users_by_email[row["email"]]
+
+    @handles("users.create")
+    def users_create(self, user_id, email):
+        return [dict(self._insert_user(user_id, email))]
+
+    @handles("users.get_by_id")
+    def users_get_by_id(self, user_id):
+        row = self.users.get(user_id)
+        return [dict(row)] if row else []
+
+    @handles("users.get_by_email")
+    def users_get_by_email(self, email):
+        user_id = self.users_by_email.get(email)
+        return [dict(self.users[user_id])] if user_id else []
+
+    # -- devices -----------------------------------------------------------
+
+    def _insert_device(self, device_id, user_id, device_label, platform) -> dict:
+        if user_id not in self.users:
+            raise _foreign_key("devices_user_id_fkey")
+        if device_id in self.devices:
+            raise _unique("devices_pkey")
+        row = {
+            "id": device_id,
+            "user_id": user_id,
+            "device_label": device_label,
+            "platform": platform,
+            "created_at": _now(),
+        }
+        self.devices[device_id] = row
+        self.devices_by_user.setdefault(user_id, []).append(device_id)
+        return row
+
+    def _latest_device(self, user_id) -> Optional[dict]:
+        ids = self.devices_by_user.get(user_id)
+        if not ids:
+            return None
+        return max((self.devices[i] for i in ids), key=lambda d: d["created_at"])
+
+    def _delete_device(self, device_id: UUID) -> None:
+        row = self.devices.pop(device_id)
+        self.devices_by_user[row["user_id"]].remove(device_id)
+
+    @handles("devices.create")
+    def devices_create(self, device_id, user_id, device_label, platform):
+        return [dict(self._insert_device(device_id, user_id, device_label, platform))]
+
+    @handles("devices.get_by_id")
+    def devices_get_by_id(self, device_id):
+        row = self.devices.get(device_id)
+        return [dict(row)] if row else []
+
+    @handles("devices.get_latest_for_user")
+    def devices_get_latest_for_user(self, user_id):
+        row = self._latest_device(user_id)
+        return [dict(row)] if row else []
+
+    # -- relying parties ---------------------------------------------------
+
+    def _insert_rp(self, rp_uuid, rp_id, display_name) -> dict:
+        if rp_id in self.rps_by_rp_id:
+            raise _unique("relying_parties_rp_id_key")
+        if rp_uuid in self.relying_parties:
+            raise _unique("relying_parties_pkey")
+        row = {"id": rp_uuid, "rp_id": rp_id, "display_name": display_name, "created_at": _now()}
+        self.relying_parties[rp_uuid] = row
+        self.rps_by_rp_id[rp_id] = rp_uuid
+        return row
+
+    def _delete_rp(self, rp_uuid: UUID) -> None:
+        row = self.relying_parties.pop(rp_uuid)
+        del self.rps_by_rp_id[row["rp_id"]]
+
+    @handles("relying_parties.create")
+    def relying_parties_create(self, rp_uuid, rp_id, display_name):
+        return [dict(self._insert_rp(rp_uuid, rp_id, display_name))]
+
+    @handles("relying_parties.get_by_id")
+    def relying_parties_get_by_id(self, rp_uuid):
+        row = self.relying_parties.get(rp_uuid)
+        return [dict(row)] if row else []
+
+    @handles("relying_parties.get_by_rp_id")
+    def relying_parties_get_by_rp_id(self, rp_id):
+        rp_uuid = self.rps_by_rp_id.get(rp_id)
+        return [dict(self.relying_parties[rp_uuid])] if rp_uuid else []
+
+    # -- device keys -------------------------------------------------------
+
+    def _check_key_refs(self, device_id, rp_uuid) -> None:
+        if device_id not in self.devices:
+            raise _foreign_key("device_keys_device_id_fkey")
+        if rp_uuid not in self.relying_parties:
+            raise _foreign_key("device_keys_rp_id_fkey")
+
+    def _insert_key(self, key_id, device_id, rp_uuid, key_type, public_key) -> dict:
+        self._check_key_refs(device_id, rp_uuid)
+        if (device_id, rp_uuid) in self.keys_by_device_rp:
+            raise _unique("device_keys_device_id_rp_id_key")
+        if key_id in self.device_keys:
+            raise _unique("device_keys_pkey")
+        row = {
+            "id": key_id,
+            "device_id": device_id,
+            "rp_id": rp_uuid,
+            "key_type": key_type,
+            "public_key": public_key,
+            "created_at": _now(),
+        }
+        self.device_keys[key_id] = row
+        self.keys_by_device_rp[(device_id, rp_uuid)] = key_id
+        return row
+
+    def _upsert_key(self, key_id, device_id, rp_uuid, key_type, public_key) -> dict:
+        existing = self.keys_by_device_rp.get((device_id, rp_uuid))
+        if existing is None:
+            return self._insert_key(key_id, device_id, rp_uuid, key_type, public_key)
+        row = self.device_keys[existing]
+        row["key_type"] = key_type
+        row["public_key"] = public_key
+        return row
+
+    @handles("device_keys.create")
+    def device_keys_create(self, key_id, device_id, rp_uuid, key_type, public_key):
+        return [dict(self._insert_key(key_id, device_id, rp_uuid, key_type, public_key))]
+
+    @handles("device_keys.get_by_id")
+    def device_keys_get_by_id(self, key_id):
+        row = self.device_keys.get(key_id)
+        return [dict(row)] if row else []
+
+    @handles("device_keys.get_by_device_and_rp")
+    def device_keys_get_by_device_and_rp(self, device_id, rp_uuid):
+        key_id = self.keys_by_device_rp.get((device_id, rp_uuid))
+        return [dict(self.device_keys[key_id])] if key_id else []
+
+    @handles("device_keys.get_by_device_and_rp_id")
+    def device_keys_get_by_device_and_rp_id(self, device_id, rp_id):
+        rp_uuid = self.rps_by_rp_id.get(rp_id)
+        if rp_uuid is None:
+            return []
+        return self.device_keys_get_by_device_and_rp(device_id, rp_uuid)
+
+    @handles("device_keys.upsert")
+    def device_keys_upsert(self, key_id, device_id, rp_uuid, key_type, public_key):
+        return [dict(self._upsert_key(key_id, device_id, rp_uuid, key_type, public_key))]
+
+    @handles("device_keys.upsert_many")
+    def device_keys_upsert_many(self, key_ids, device_ids, rp_uuids, key_types, public_keys):
+        # Validate everything first so a bad entry leaves no partial write.
+        for device_id, rp_uuid in zip(device_ids, rp_uuids):
+            self._check_key_refs(device_id, rp_uuid)
+        return [
+            dict(self._upsert_key(*entry))
+            for entry in zip(key_ids, device_ids, rp_uuids, key_types, public_keys)
+        ]
+
+    # -- enrollment --------------------------------------------------------
+
+    @handles("enrollments.enroll")
+    def enrollments_enroll(
+        self,
+        user_id,
+        email,
+        rp_uuid,
+        rp_id,
+        rp_display_name,
+        device_id,
+        device_label,
+        platform,
+        key_id,
+        key_type,
+        public_key,
+    ):
+        existing_user = self.users_by_email.get(email)
+        existing_rp = self.rps_by_rp_id.get(rp_id)
+        user = self.users[existing_user] if existing_user else None
+        rp = self.relying_parties[existing_rp] if existing_rp else None
+        undo = []
+        try:
+            if user is None:
+                user = self._insert_user(user_id, email)
+                undo.append(lambda: self._delete_user(user_id))
+            if rp is None:
+                rp = self._insert_rp(rp_uuid, rp_id, rp_display_name)
+                undo.append(lambda: self._delete_rp(rp_uuid))
+            device = self._insert_device(device_id, user["id"], device_label, platform)
+            undo.append(lambda: self._delete_device(device_id))
+            key = self._insert_key(key_id, device["id"], rp["id"], key_type, public_key)
+        except Exception:
+            # One statement in Postgres: undo the rows this call created.
+            for step in reversed(undo):
+                step()
+            raise
+        return [
+            {
+                "user_id": user["id"],
+                "email": user["email"],
+                "user_created_at": user["created_at"],
+                "device_id": device["id"],
+                "device_label": device["device_label"],
+                "platform": device["platform"],
+                "device_created_at": device["created_at"],
+                "rp_uuid": rp["id"],
+                "rp_id": rp["rp_id"],
+                "display_name": rp["display_name"],
+                "rp_created_at": rp["created_at"],
+                "key_id": key["id"],
+                "key_type": key["key_type"],
+                "public_key": key["public_key"],
+                "key_created_at": key["created_at"],
+            }
+        ]
+
+    # -- totp --------------------------------------------------------------
+
+    def _insert_secret(self, secret_id, user_id, rp_id, secret_encrypted) -> dict:
+        if user_id not in self.users:
+            raise _foreign_key("totp_secrets_user_id_fkey")
+        if (user_id, rp_id) in self.secrets_by_user_rp:
+            raise _unique("totp_secrets_user_id_rp_id_key")
+        row = {
+            "id": secret_id,
+            "user_id": user_id,
+            "rp_id": rp_id,
+            "secret_encrypted": secret_encrypted,
+            "created_at": _now(),
+        }
+        self.totp_secrets[secret_id] = row
+        self.secrets_by_user_rp[(user_id, rp_id)] = secret_id
+        self.secrets_by_user.setdefault(user_id, []).append(secret_id)
+        return row
+
+    def _insert_code(self, code_id, user_id, code_hash) -> None:
+        if user_id not in self.users:
+            raise _foreign_key("recovery_codes_user_id_fkey")
+        self.recovery_codes[code_id] = {
+            "id": code_id,
+            "user_id": user_id,
+            "code_hash": code_hash,
+            "created_at": _now(),
+            "used_at": None,
+        }
+        self.codes_by_user_hash.setdefault((user_id, code_hash), []).append(code_id)
+
+    def _latest_secret(self, user_id) -> Optional[dict]:
+        ids = self.secrets_by_user.get(user_id)
+        if not ids:
+            return None
+        return max((self.totp_secrets[i] for i in ids), key=lambda s: s["created_at"])
+
+    @handles("totp.insert_secret")
+    def totp_insert_secret(self, secret_id, user_id, rp_id, secret_encrypted):
+        return [dict(self._insert_secret(secret_id, user_id, rp_id, secret_encrypted))]
+
+    @handles("totp.register")
+    def totp_register(self, secret_id, user_id, rp_id, secret_encrypted, code_ids, code_hashes):
+        row = self._insert_secret(secret_id, user_id, rp_id, secret_encrypted)
+        for code_id, code_hash in zip(code_ids, code_hashes):
+            self._insert_code(code_id, user_id, code_hash)
+        return [dict(row)]
+
+    @handles("totp.get_secret")
+    def totp_get_secret(self, user_id, rp_id):
+        secret_id = self.secrets_by_user_rp.get((user_id, rp_id))
+        return [dict(self.totp_secrets[secret_id])] if secret_id else []
+
+    @handles("totp.get_latest_secret_for_user")
+    def totp_get_latest_secret_for_user(self, user_id):
+        row = self._latest_secret(user_id)
+        return [dict(row)] if row else []
+
+    @handles("totp.insert_recovery_code")
+    def totp_insert_recovery_code(self, code_id, user_id, code_hash):
+        self._insert_code(code_id, user_id, code_hash)
+        return 1
+
+    @handles("totp.get_unused_recovery_code")
+    def totp_get_unused_recovery_code(self, user_id, code_hash):
+        for code_id in self.codes_by_user_hash.get((user_id, code_hash), ()):
+            row = self.recovery_codes[code_id]
+            if row["used_at"] is None:
+                return [dict(row)]
+        return []
+
+    @handles("totp.consume_recovery_code")
+    def totp_consume_recovery_code(self, code_id):
+        row = self.recovery_codes.get(code_id)
+        if row is None:
+            return 0
+        row["used_at"] = _now()
+        return 1
+
+    # -- device challenges -------------------------------------------------
+
+    def _sweep(self) -> None:
+        self._inserts_since_sweep += 1
+        if self._inserts_since_sweep < _SWEEP_EVERY:
+            return
+        self._inserts_since_sweep = 0
+        now = _now()
+        for challenge_id in [i for i, c in self.device_challenges.items() if c["expires_at"] <= now]:
+            self._remove_challenge(challenge_id)
+        self.login_challenges_expire_batch(len(self.login_challenges))
+
+    def _remove_challenge(self, challenge_id) -> dict:
+        row = self.device_challenges.pop(challenge_id)
+        key = (row["device_id"], row["rp_id"], row["nonce"])
+        ids = self.challenges_by_nonce[key]
+        ids.remove(challenge_id)
+        if not ids:
+            del self.challenges_by_nonce[key]
+        return row
+
+    @handles("challenges.insert_challenge")
+    def challenges_insert_challenge(self, challenge_id, device_id, rp_id, nonce, expires_at):
+        if device_id not in self.devices:
+            raise _foreign_key("device_challenges_device_id_fkey")
+        self._sweep()
+        row = {
+            "id": challenge_id,
+            "device_id": device_id,
+            "rp_id": rp_id,
+            "nonce": nonce,
+            "expires_at": expires_at,
+            "created_at": _now(),
+        }
+        self.device_challenges[challenge_id] = row
+        self.challenges_by_nonce.setdefault((device_id, rp_id, nonce), []).append(challenge_id)
+        return [dict(row)]
+
+    @handles("challenges.claim")
+    def challenges_claim(self, device_id, rp_id, nonce):
+        now = _now()
+        ids = self.challenges_by_nonce.get((device_id, rp_id, nonce), ())
+        live = [i for i in ids if self.device_challenges[i]["expires_at"] > now]
+        return [self._remove_challenge(i) for i in live]
+
+    # -- login challenges --------------------------------------------------
+
+    @staticmethod
+    def _expired(row: dict, now: datetime) -> bool:
+        return row["status"] == "pending" and row["expires_at"] <= now
+
+    def _effective(self, row: dict) -> dict:
+        # Same view as the SQL: pending past expiry reads as denied/expired.
+        out = dict(row)
+        if self._expired(row, _now()):
+            out["status"] = "denied"
+            out["denied_reason"] = "expired"
+        return out
+
+    def _decide(self, challenge_id, **changes) -> bool:
+        row = self.login_challenges.get(challenge_id)
+        if row is None or row["status"] != "pending":
+            return False
+        row.update(changes)
+        self.pending_by_user.get(row["user_id"], {}).pop(challenge_id, None)
+        return True
+
+    @handles("login_challenges.insert")
+    def login_challenges_insert(self, challenge_id, user_id, device_id, rp_id, nonce, otp_hash, expires_at):
+        if user_id not in self.users:
+            raise _foreign_key("login_challenges_user_id_fkey")
+        if device_id not in self.devices:
+            raise _foreign_key("login_challenges_device_id_fkey")
+        self._sweep()
+        row = {
+            "id": challenge_id,
+            "user_id": user_id,
+            "device_id": device_id,
+            "rp_id": rp_id,
+            "nonce": nonce,
+            "otp_hash": otp_hash,
+            "status": "pending",
+            "created_at": _now(),
+            "expires_at": expires_at,
+            "approved_at": None,
+            "denied_reason": None,
+        }
+        self.login_challenges[challenge_id] = row
+        self.pending_by_user.setdefault(user_id, {})[challenge_id] = None
+        return [dict(row)]
+
+    @handles("login_challenges.get_by_id")
+    def login_challenges_get_by_id(self, challenge_id, created_from, created_to):
+        row = self.login_challenges.get(challenge_id)
+        return [self._effective(row)] if row else []
+
+    @handles("login_challenges.get_pending_for_user")
+    def login_challenges_get_pending_for_user(self, user_id):
+        now = _now()
+        live = [
+            self.login_challenges[i]
+            for i in self.pending_by_user.get(user_id, ())
+            if self.login_challenges[i]["expires_at"] > now
+        ]
+        if not live:
+            return []
+        return [dict(max(live, key=lambda c: c["created_at"]))]
+
+    @handles("login_challenges.mark_approved")
+    def login_challenges_mark_approved(self, challenge_id, window):
+        row = self.login_challenges.get(challenge_id)
+        if row is None or self._expired(row, _now()):
+            return []
+        if not self._decide(challenge_id, status="approved", approved_at=_now()):
+            return []
+        return [{"id": challenge_id}]
+
+    @handles("login_challenges.mark_denied")
+    def login_challenges_mark_denied(self, challenge_id, reason, created_from, created_to):
+        if not self._decide(challenge_id, status="denied", denied_reason=reason):
+            return []
+        return [{"id": challenge_id}]
+
+    @handles("login_challenges.expire_batch")
+    def login_challenges_expire_batch(self, limit):
+        now = _now()
+        expired = sorted(
+            (
+                row
+                for pending in self.pending_by_user.values()
+                for row in (self.login_challenges[i] for i in pending)
+                if row["expires_at"] <= now
+            ),
+            key=lambda c: c["expires_at"],
+        )[:limit]
+        for row in expired:
+            self._decide(row["id"], status="denied", denied_reason="expired")
+        return len(expired)
+
+    @handles("login_challenges.archive_batch")
+    def login_challenges_archive_batch(self, before, after_created_at, after_id, limit):
+        cursor = (after_created_at, after_id)
+        batch = sorted(
+            (
+                row
+                for row in self.login_challenges.values()
+                if row["status"] != "pending"
+                and row["created_at"] < before
+                and (row["created_at"], row["id"]) > cursor
+            ),
+            key=lambda c: (c["created_at"], c["id"]),
+        )[:limit]
+        for row in batch:
+            del self.login_challenges[row["id"]]
+        return [dict(row) for row in batch]
+
+    @handles("login_challenges.clear_pending_for_user")
+    def login_challenges_clear_pending_for_user(self, user_id):
+        pending = list(self.pending_by_user.get(user_id, ()))
+        for challenge_id in pending:
+            self._decide(challenge_id, status="denied", denied_reason="user_cleared")
+        return len(pending)
+
+    @handles("login_challenges.resolve_login_start")
+    def login_challenges_resolve_login_start(self, email):
+        user_id = self.users_by_email.get(email)
+        if user_id is None:
+            return []
+        device = self._latest_device(user_id)
+        secret = self._latest_secret(user_id)
+        rp_uuid = self.rps_by_rp_id.get(secret["rp_id"]) if secret else None
+        key_id = self.keys_by_device_rp.get((device["id"], rp_uuid)) if device and rp_uuid else None
+        return [
+            {
+                "user_id": user_id,
+                "device_id": device["id"] if device else None,
+                "rp_id": secret["rp_id"] if secret else None,
+                "secret_encrypted": secret["secret_encrypted"] if secret else None,
+                "rp_uuid": rp_uuid,
+                "device_key_id": key_id,
+            }
+        ]
+
+    @handles("login_challenges.get_approval_context")
+    def login_challenges_get_approval_context(self, challenge_id, device_id, rp_id, created_from, created_to):
+        row = self.login_challenges.get(challenge_id)
+        if row is None:
+            return []
+        challenge = self._effective(row)
+        rp_uuid = self.rps_by_rp_id.get(rp_id)
+        key_id = self.keys_by_device_rp.get((device_id, rp_uuid)) if rp_uuid else None
+        key = self.device_keys[key_id] if key_id else None
+        secret_id = self.secrets_by_user_rp.get((challenge["user_id"], rp_id))
+        return [
+            {
+                "id": challenge["id"],
+                "user_id": challenge["user_id"],
+                "device_id": challenge["device_id"],
+                "rp_id": challenge["rp_id"],
+                "otp_hash": challenge["otp_hash"],
+                "status": challenge["status"],
+                "rp_uuid": rp_uuid,
+                "key_type": key["key_type"] if key else None,
+                "public_key": key["public_key"] if key else None,
+                "secret_encrypted": self.totp_secrets[secret_id]["secret_encrypted"] if secret_id else None,
+            }
+        ]
@@ -0,0 +1,298 @@
+"""Redis store for device and login challenges.
+
+Challenges live for two minutes and are written once or twice, so on
+Postgres they turn into WAL, dead tuples and vacuum work on the primary. With
+``CHALLENGE_STORE=redis`` the statements that only touch challenge rows are
+routed here through :func:`app.statements.route`. Everything else, including
+the user/device/key lookups around them, stays on Postgres.
+
+Keys, under ``key_prefix``:
+
+- ``dc:{device_id}:{rp_id}:{nonce}`` holds a device challenge as JSON and
+  expires at its ``expires_at``. A claim is a single ``GETDEL``, so a nonce is
+  consumed at most once.
+- ``lc:{id}`` holds a login challenge as a hash. It expires
+  ``login_retention`` seconds after ``expires_at``, so ``/login/status`` can
+  still report the outcome for a while.
+- ``lc:user:{user_id}`` is a sorted set of the user's challenge ids, scored by
+  ``expires_at``. Entries are pruned once they expire.
+
+Approve and deny are Lua scripts that check and change the status in one
+step, like the pending-only ``UPDATE``s. No reaper is needed: an expired
+pending challenge reads as ``denied/expired``, and Redis drops the key later.
+Redis keeps no history, so nothing reaches the archive.
+
+Unlike Postgres, Redis does not check that the device or user exists. A
+challenge change is also not part of the request's database transaction.
+Timestamps come from the application clock.
+"""
+
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
+from uuid import UUID
+
+from app.config import Settings
+from app.storage.base import StorageBackend, handles
+
+# Both transitions leave 'pending' only; approval also needs the challenge unexpired.
+_TRANSITION = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'pending' then
+    return 0
+end
+if ARGV[1] == 'approved' then
+    if tonumber(redis.call('HGET', KEYS[1], 'expires_at')) <= tonumber(ARGV[3]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'status', 'approved', 'approved_at', ARGV[3])
+else
+    redis.call('HSET', KEYS[1], 'status', 'denied', 'denied_reason', ARGV[2])
+end
+return 1
+"""
+
+
+@dataclass(frozen=True)
+class RedisChallengeConfig:
+    url: str
+    key_prefix: str = "zt:"
+    # How long a decided or expired login challenge stays readable.
+    login_retention: float = 3600.0
+    max_connections: int = 20
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "RedisChallengeConfig":
+        return cls(
+            url=settings.redis_url,
+            login_retention=settings.redis_login_challenge_retention,
+            max_connections=settings.redis_max_connections,
+        )
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _us(value: datetime) -> int:
+    return round(value.timestamp() * 1_000_000)
+
+
+def _from_us(raw) -> datetime:
+    return datetime.fromtimestamp(int(raw) / 1_000_000, timezone.utc)
+
+
+def _encode_login(row: dict) -> dict:
+    encoded = {}
+    for field, value in row.items():
+        if value is None:
+            continue
+        encoded[field] = _us(value) if isinstance(value, datetime) else str(value)
+    return encoded
+
+
+def _decode_login(raw: dict) -> dict:
+    return {
+        "id": UUID(raw["id"]),
+        "user_id": UUID(raw["user_id"]),
+        "device_id": UUID(raw["device_id"]),
+        "rp_id": raw["rp_id"],
+        "nonce": raw["nonce"],
+        "otp_hash": raw["otp_hash"],
+        "status": raw["status"],
+        "created_at": _from_us(raw["created_at"]),
+        "expires_at": _from_us(raw["expires_at"]),
+        "approved_at": _from_us(raw["approved_at"]) if "approved_at" in raw else None,
+        "denied_reason": raw.get("denied_reason"),
+    }
+
+
+class RedisChallengeStore(StorageBackend):
+    name = "redis"
+
+    def __init__(self, config: RedisChallengeConfig) -> None:
+        super().__init__()
+        self._config = config
+        self._redis = None
+        self._transition = None
+
+    async def open(self) -> None:
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CHALLENGE_STORE=redis needs the redis package")
+        self._redis = redis.Redis.from_url(
+            self._config.url,
+            decode_responses=True,
+            max_connections=self._config.max_connections,
+        )
+        # Fail at startup, not on the first login.
+        await self._redis.ping()
+        self._transition = self._redis.register_script(_TRANSITION)
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _call(self, handler, args: tuple):
+        return await handler(*args)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "connected": self._redis is not None,
+            "max_connections": self._config.max_connections,
+            "login_retention": self._config.login_retention,
+        }
+
+    def _device_key(self, device_id: UUID, rp_id: str, nonce: str) -> str:
+        return f"{self._config.key_prefix}dc:{device_id}:{rp_id}:{nonce}"
+
+    def _login_key(self, challenge_id) -> str:
+        return f"{self._config.key_prefix}lc:{challenge_id}"
+
+    def _user_key(self, user_id: UUID) -> str:
+        return f"{self._config.key_prefix}lc:user:{user_id}"
+
+    # -- device challenges ---------------------------------------------------
+
+    @handles("challenges.insert_challenge")
+    async def challenges_insert_challenge(self, challenge_id, device_id, rp_id, nonce, expires_at):
+        row = {
+            "id": challenge_id,
+            "device_id": device_id,
+            "rp_id": rp_id,
+            "nonce": nonce,
+            "expires_at": expires_at,
+            "created_at": _now(),
+        }
+        value = json.dumps(
+            {"id": str(challenge_id), "expires_at": _us(expires_at), "created_at": _us(row["created_at"])}
+        )
+        await self._redis.set(
+            self._device_key(device_id, rp_id, nonce),
+            value,
+            pxat=_us(expires_at) // 1000,
+        )
+        return [row]
+
+    @handles("challenges.claim")
+    async def challenges_claim(self, device_id, rp_id, nonce):
+        raw = await self._redis.getdel(self._device_key(device_id, rp_id, nonce))
+        if raw is None:
+            return []
+        stored = json.loads(raw)
+        expires_at = _from_us(stored["expires_at"])
+        # Key expiry is lazy to the millisecond; the row check is exact.
+        if expires_at <= _now():
+            return []
+        return [
+            {
+                "id": UUID(stored["id"]),
+                "device_id": device_id,
+                "rp_id": rp_id,
+                "nonce": nonce,
+                "expires_at": expires_at,
+                "created_at": _from_us(stored["created_at"]),
+            }
+        ]
+
+    # -- login challenges ----------------------------------------------------
+
+    async def _load_logins(self, challenge_ids: List[str]) -> List[dict]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for challenge_id in challenge_ids:
+                pipe.hgetall(self._login_key(challenge_id))
+            stored = await pipe.execute()
+        return [_decode_login(raw) for raw in stored if raw]
+
+    async def _decide(self, pipe, challenge_id, status: str, reason: Optional[str]):
+        return await self._transition(
+            keys=[self._login_key(challenge_id)],
+            args=[status, reason or "", _us(_now())],
+            client=pipe,
+        )
+
+    @handles("login_challenges.insert")
+    async def login_challenges_insert(self, challenge_id, user_id, device_id, rp_id, nonce, otp_hash, expires_at):
+        row = {
+            "id": challenge_id,
+            "user_id": user_id,
+            "device_id": device_id,
+            "rp_id": rp_id,
+            "nonce": nonce,
+            "otp_hash": otp_hash,
+            "status": "pending",
+            "created_at": _now(),
+            "expires_at": expires_at,
+            "approved_at": None,
+            "denied_reason": None,
+        }
+        key = self._login_key(challenge_id)
+        user_key = self._user_key(user_id)
+        drop_at = (_us(expires_at) + round(self._config.login_retention * 1_000_000)) // 1000
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=_encode_login(row))
+            pipe.pexpireat(key, drop_at)
+            pipe.zadd(user_key, {str(challenge_id): _us(expires_at)})
+            pipe.pexpireat(user_key, drop_at)
+            await pipe.execute()
+        return [row]
+
+    @handles("login_challenges.get_by_id", readonly=True)
+    async def login_challenges_get_by_id(self, challenge_id, created_from, created_to):
+        raw = await self._redis.hgetall(self._login_key(challenge_id))
+        if not raw:
+            return []
+        row = _decode_login(raw)
+        if row["status"] == "pending" and row["expires_at"] <= _now():
+            row["status"], row["denied_reason"] = "denied", "expired"
+        return [row]
+
+    @handles("login_challenges.get_pending_for_user", readonly=True)
+    async def login_challenges_get_pending_for_user(self, user_id):
+        now = _now()
+        user_key = self._user_key(user_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(user_key, "-inf", _us(now))
+            pipe.zrange(user_key, 0, -1)
+            _, challenge_ids = await pipe.execute()
+        pending = [
+            row
+            for row in await self._load_logins(challenge_ids)
+            if row["status"] == "pending" and row["expires_at"] > now
+        ]
+        pending.sort(key=lambda row: row["created_at"], reverse=True)
+        return pending[:1]
+
+    @handles("login_challenges.mark_approved")
+    async def login_challenges_mark_approved(self, challenge_id, window):
+        changed = await self._decide(self._redis, challenge_id, "approved", None)
+        return [{"id": challenge_id}] if changed else []
+
+    @handles("login_challenges.mark_denied")
+    async def login_challenges_mark_denied(self, challenge_id, reason, created_from, created_to):
+        changed = await self._decide(self._redis, challenge_id, "denied", reason)
+        return [{"id": challenge_id}] if changed else []
+
+    @handles("login_challenges.clear_pending_for_user")
+    async def login_challenges_clear_pending_for_user(self, user_id):
+        # Expired-but-pending challenges count too, as in the SQL.
+        challenge_ids = await self._redis.zrange(self._user_key(user_id), 0, -1)
+        if not challenge_ids:
+            return 0
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for challenge_id in challenge_ids:
+                await self._decide(pipe, challenge_id, "denied", "user_cleared")
+            changed = await pipe.execute()
+        return sum(changed)
+
+    @handles("login_challenges.expire_batch")
+    async def login_challenges_expire_batch(self, limit):
+        # Expiry is computed on read; there is nothing for the reaper to do.
+        return 0
+
+    @handles("login_challenges.archive_batch")
+    async def login_challenges_archive_batch(self, before, after_created_at, after_id, limit):
+        return []
@@ -0,0 +1,732 @@
+"""SQLite storage backend for single-node deployments.
+
+The database runs in WAL mode, so readers never block the writer or each
+other. Connections are per thread:
+
+- Reads run on a small thread pool. Each thread has its own connection, and
+  any number of them can read at once.
+- Writes go through one writer thread, because SQLite allows one writer at a
+  time anyway. The writer drains whatever writes are queued, up to
+  ``write_batch_size``, and commits them as one transaction. Under load the
+  cost of a commit (and its WAL sync) is shared by the whole batch.
+
+Each write runs in its own SAVEPOINT inside the batch. A failing write rolls
+back alone and raises the asyncpg error Postgres would, and the others still
+commit. A write's caller resumes only after the batch has committed.
+
+The writer also does the reaper's job: every ``sweep_interval`` seconds it
+deletes expired device challenges, marks expired pending login challenges
+``denied/expired`` and deletes login challenges older than the retention.
+
+The schema is ``db/sqlite/schema.sql``.
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from time import monotonic
+from typing import Callable, List, Optional
+from uuid import UUID
+
+import asyncpg
+
+from app.config import Settings
+from app.metrics import Histogram
+from app.storage.base import StorageBackend, handles
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = Path(__file__).resolve().parents[2] / "db" / "sqlite" / "schema.sql"
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _adapt_timestamp(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime(_TIMESTAMP_FORMAT)
+
+
+def _convert_timestamp(raw: bytes) -> datetime:
+    return datetime.strptime(raw.decode("ascii"), _TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+
+
+sqlite3.register_adapter(UUID, str)
+sqlite3.register_adapter(datetime, _adapt_timestamp)
+sqlite3.register_converter("UUID", lambda raw: UUID(raw.decode("ascii")))
+sqlite3.register_converter("TIMESTAMPTZ", _convert_timestamp)
+
+
+@dataclass(frozen=True)
+class SqliteConfig:
+    path: str = "zt_totp.sqlite3"
+    read_connections: int = 4
+    # Most writes committed together; one WAL sync covers the whole batch.
+    write_batch_size: int = 128
+    # NORMAL is durable across application crashes in WAL mode; an OS crash
+    # can lose the last commits. FULL syncs on every commit.
+    synchronous: str = "NORMAL"
+    busy_timeout: float = 5.0
+    sweep_interval: float = 15.0
+    login_challenge_retention_days: int = 30
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "SqliteConfig":
+        return cls(
+            path=settings.sqlite_path,
+            read_connections=settings.sqlite_read_connections,
+            write_batch_size=settings.sqlite_write_batch_size,
+            sweep_interval=settings.reaper_interval,
+            login_challenge_retention_days=settings.login_challenge_retention_days,
+        )
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _dict_row(cursor: sqlite3.Cursor, row: tuple) -> dict:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _rows(conn: sqlite3.Connection, sql: str, params=()) -> List[dict]:
+    return conn.execute(sql, params).fetchall()
+
+
+def _count(conn: sqlite3.Connection, sql: str, params=()) -> int:
+    return conn.execute(sql, params).rowcount
+
+
+def _translate(exc: sqlite3.Error) -> Exception:
+    message = str(exc)
+    if isinstance(exc, sqlite3.IntegrityError):
+        if message.startswith("UNIQUE") or message.startswith("PRIMARY KEY"):
+            return asyncpg.UniqueViolationError(message)
+        if message.startswith("FOREIGN KEY"):
+            return asyncpg.ForeignKeyViolationError(message)
+        if message.startswith("NOT NULL"):
+            return asyncpg.NotNullViolationError(message)
+    return exc
+
+
+_USER = "id, email, created_at"
+_DEVICE = "id, user_id, device_label, platform, created_at"
+_RP = "id, rp_id, display_name, created_at"
+_KEY = "id, device_id, rp_id, key_type, public_key, created_at"
+_SECRET = "id, user_id, rp_id, secret_encrypted, created_at"
+_CHALLENGE = "id, device_id, rp_id, nonce, expires_at, created_at"
+_LOGIN = (
+    "id, user_id, device_id, rp_id, nonce, otp_hash, status, created_at, expires_at, approved_at, denied_reason"
+)
+
+
+class SqliteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, config: Optional[SqliteConfig] = None) -> None:
+        super().__init__()
+        self.config = config or SqliteConfig()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self._writes: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._last_sweep = monotonic()
+        self._reads = 0
+        self._writes_committed = 0
+        self._write_errors = 0
+        self._batches = 0
+        self._sweeps = 0
+        self._batch_ms = Histogram()
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.config.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # Transactions are opened explicitly by the writer.
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.row_factory = _dict_row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.config.busy_timeout * 1000)}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute(f"PRAGMA synchronous = {self.config.synchronous}")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _reader_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+        return conn
+
+    async def open(self) -> None:
+        """Create the schema and start the reader pool and writer thread."""
+        await asyncio.to_thread(self._create_schema)
+        self._readers = ThreadPoolExecutor(
+            max_workers=self.config.read_connections, thread_name_prefix="sqlite-read"
+        )
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-write", daemon=True)
+        self._writer.start()
+        logger.info("sqlite storage opened path=%s", self.config.path)
+
+    def _create_schema(self) -> None:
+        conn = self._connect()
+        # WAL is a property of the database file; setting it once is enough.
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA_PATH.read_text(encoding="utf-8"))
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writes.put(None)
+            await asyncio.to_thread(self._writer.join)
+            self._writer = None
+        if self._readers is not None:
+            self._readers.shutdown(wait=True)
+            self._readers = None
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    # -- dispatch ----------------------------------------------------------
+
+    async def _call(self, handler: Callable, args: tuple):
+        if self._writer is None:
+            raise RuntimeError("sqlite storage is not open")
+        loop = asyncio.get_running_loop()
+        if getattr(handler, "readonly", False):
+            self._reads += 1
+            return await loop.run_in_executor(self._readers, self._read, handler, args)
+        future = loop.create_future()
+        self._writes.put((handler, args, future, loop))
+        return await future
+
+    def _read(self, handler: Callable, args: tuple):
+        try:
+            return handler(self._reader_connection(), *args)
+        except sqlite3.Error as exc:
+            raise _translate(exc) from exc
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            try:
+                job = self._writes.get(timeout=self.config.sweep_interval)
+            except queue.Empty:
+                self._sweep(conn)
+                continue
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.config.write_batch_size:
+                try:
+                    job = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._commit(conn, batch)
+            if monotonic() - self._last_sweep >= self.config.sweep_interval:
+                self._sweep(conn)
+
+    def _commit(self, conn: sqlite3.Connection, batch: list) -> None:
+        started = monotonic()
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for handler, args, future, loop in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    result = handler(conn, *args)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    error = _translate(exc) if isinstance(exc, sqlite3.Error) else exc
+                    outcomes.append((future, loop, None, error))
+                    continue
+                conn.execute("RELEASE write")
+                outcomes.append((future, loop, result, None))
+            conn.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            outcomes = [(future, loop, None, _translate(exc)) for _, _, future, loop in batch]
+        self._batches += 1
+        self._batch_ms.observe((monotonic() - started) * 1000)
+        for future, loop, result, error in outcomes:
+            if error is None:
+                self._writes_committed += 1
+            else:
+                self._write_errors += 1
+            loop.call_soon_threadsafe(_settle, future, result, error)
+
+    def _sweep(self, conn: sqlite3.Connection) -> None:
+        self._last_sweep = monotonic()
+        now = _now()
+        cutoff = now - timedelta(days=self.config.login_challenge_retention_days)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM device_challenges WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "UPDATE login_challenges SET status = 'denied', denied_reason = 'expired' "
+                "WHERE status = 'pending' AND expires_at <= ?",
+                (now,),
+            )
+            conn.execute("DELETE FROM login_challenges WHERE created_at < ?", (cutoff,))
+            conn.execute("COMMIT")
+            self._sweeps += 1
+        except sqlite3.Error as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.warning("sqlite sweep failed error=%s", exc)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "path": self.config.path,
+            "reads": self._reads,
+            "writes": self._writes_committed,
+            "write_errors": self._write_errors,
+            "write_batches": self._batches,
+            "mean_batch_size": round((self._writes_committed + self._write_errors) / self._batches, 2)
+            if self._batches
+            else 0.0,
+            "queued_writes": self._writes.qsize(),
+            "sweeps": self._sweeps,
+            "batch_ms": self._batch_ms.snapshot(),
+        }
+
+    # -- users -------------------------------------------------------------
+
+    @handles("users.create")
+    def users_create(self, conn, user_id, email):
+        return _rows(
+            conn,
+            f"INSERT INTO users ({_USER}) VALUES (?, ?, ?) RETURNING {_USER}",
+            (user_id, email, _now()),
+        )
+
+    @handles("users.get_by_id", readonly=True)
+    def users_get_by_id(self, conn, user_id):
+        return _rows(conn, f"SELECT {_USER} FROM users WHERE id = ?", (user_id,))
+
+    @handles("users.get_by_email", readonly=True)
+    def users_get_by_email(self, conn, email):
+        return _rows(conn, f"SELECT {_USER} FROM users WHERE email = ?", (email,))
+
+    # -- devices -----------------------------------------------------------
+
+    @handles("devices.create")
+    def devices_create(self, conn, device_id, user_id, device_label, platform):
+        return _rows(
+            conn,
+            f"INSERT INTO devices ({_DEVICE}) VALUES (?, ?, ?, ?, ?) RETURNING {_DEVICE}",
+            (device_id, user_id, device_label, platform, _now()),
+        )
+
+    @handles("devices.get_by_id", readonly=True)
+    def devices_get_by_id(self, conn, device_id):
+        return _rows(conn, f"SELECT {_DEVICE} FROM devices WHERE id = ?", (device_id,))
+
+    @handles("devices.get_latest_for_user", readonly=True)
+    def devices_get_latest_for_user(self, conn, user_id):
+        return _rows(
+            conn,
+            f"SELECT {_DEVICE} FROM devices WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
+            (user_id,),
+        )
+
+    # -- relying parties ---------------------------------------------------
+
+    @handles("relying_parties.create")
+    def relying_parties_create(self, conn, rp_uuid, rp_id, display_name):
+        return _rows(
+            conn,
+            f"INSERT INTO relying_parties ({_RP}) VALUES (?, ?, ?, ?) RETURNING {_RP}",
+            (rp_uuid, rp_id, display_name, _now()),
+        )
+
+    @handles("relying_parties.get_by_id", readonly=True)
+    def relying_parties_get_by_id(self, conn, rp_uuid):
+        return _rows(conn, f"SELECT {_RP} FROM relying_parties WHERE id = ?", (rp_uuid,))
+
+    @handles("relying_parties.get_by_rp_id", readonly=True)
+    def relying_parties_get_by_rp_id(self, conn, rp_id):
+        return _rows(conn, f"SELECT {_RP} FROM relying_parties WHERE rp_id = ?", (rp_id,))
+
+    # -- device keys -------------------------------------------------------
+
+    @handles("device_keys.create")
+    def device_keys_create(self, conn, key_id, device_id, rp_uuid, key_type, public_key):
+        return _rows(
+            conn,
+            f"INSERT INTO device_keys ({_KEY}) VALUES (?, ?, ?, ?, ?, ?) RETURNING {_KEY}",
+            (key_id, device_id, rp_uuid, key_type, public_key, _now()),
+        )
+
+    @handles("device_keys.get_by_id", readonly=True)
+    def device_keys_get_by_id(self, conn, key_id):
+        return _rows(conn, f"SELECT {_KEY} FROM device_keys WHERE id = ?", (key_id,))
+
+    @handles("device_keys.get_by_device_and_rp", readonly=True)
+    def device_keys_get_by_device_and_rp(self, conn, device_id, rp_uuid):
+        return _rows(conn, f"SELECT {_KEY} FROM device_keys WHERE device_id = ? AND rp_id = ?", (device_id, rp_uuid))
+
+    @handles("device_keys.get_by_device_and_rp_id", readonly=True)
+    def device_keys_get_by_device_and_rp_id(self, conn, device_id, rp_id):
+        return _rows(
+            conn,
+            """
+            SELECT k.id, k.device_id, k.rp_id, k.key_type, k.public_key, k.created_at
+            FROM device_keys k
+            JOIN relying_parties rp ON rp.id = k.rp_id
+            WHERE k.device_id = ? AND rp.rp_id = ?
+            LIMIT 1
+            """,
+            (device_id, rp_id),
+        )
+
+    def _upsert_key(self, conn, key_id, device_id, rp_uuid, key_type, public_key) -> List[dict]:
+        return _rows(
+            conn,
+            f"""
+            INSERT INTO device_keys ({_KEY}) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (device_id, rp_id)
+            DO UPDATE SET key_type = excluded.key_type, public_key = excluded.public_key
+            RETURNING {_KEY}
+            """,
+            (key_id, device_id, rp_uuid, key_type, public_key, _now()),
+        )
+
+    @handles("device_keys.upsert")
+    def device_keys_upsert(self, conn, key_id, device_id, rp_uuid, key_type, public_key):
+        return self._upsert_key(conn, key_id, device_id, rp_uuid, key_type, public_key)
+
+    @handles("device_keys.upsert_many")
+    def device_keys_upsert_many(self, conn, key_ids, device_ids, rp_uuids, key_types, public_keys):
+        rows = []
+        for entry in zip(key_ids, device_ids, rp_uuids, key_types, public_keys):
+            rows.extend(self._upsert_key(conn, *entry))
+        return rows
+
+    # -- enrollment --------------------------------------------------------
+
+    @handles("enrollments.enroll")
+    def enrollments_enroll(
+        self,
+        conn,
+        user_id,
+        email,
+        rp_uuid,
+        rp_id,
+        rp_display_name,
+        device_id,
+        device_label,
+        platform,
+        key_id,
+        key_type,
+        public_key,
+    ):
+        # The writer's savepoint makes these statements one atomic unit.
+        now = _now()
+        conn.execute(
+            "INSERT INTO users (id, email, created_at) VALUES (?, ?, ?) ON CONFLICT (email) DO NOTHING",
+            (user_id, email, now),
+        )
+        (user,) = _rows(conn, f"SELECT {_USER} FROM users WHERE email = ?", (email,))
+        conn.execute(
+            f"INSERT INTO relying_parties ({_RP}) VALUES (?, ?, ?, ?) ON CONFLICT (rp_id) DO NOTHING",
+            (rp_uuid, rp_id, rp_display_name, now),
+        )
+        (rp,) = _rows(conn, f"SELECT {_RP} FROM relying_parties WHERE rp_id = ?", (rp_id,))
+        (device,) = self.devices_create(conn, device_id, user["id"], device_label, platform)
+        (key,) = self.device_keys_create(conn, key_id, device["id"], rp["id"], key_type, public_key)
+        return [
+            {
+                "user_id": user["id"],
+                "email": user["email"],
+                "user_created_at": user["created_at"],
+                "device_id": device["id"],
+                "device_label": device["device_label"],
+                "platform": device["platform"],
+                "device_created_at": device["created_at"],
+                "rp_uuid": rp["id"],
+                "rp_id": rp["rp_id"],
+                "display_name": rp["display_name"],
+                "rp_created_at": rp["created_at"],
+                "key_id": key["id"],
+                "key_type": key["key_type"],
+                "public_key": key["public_key"],
+                "key_created_at": key["created_at"],
+            }
+        ]
+
+    # -- totp --------------------------------------------------------------
+
+    @handles("totp.insert_secret")
+    def totp_insert_secret(self, conn, secret_id, user_id, rp_id, secret_encrypted):
+        return _rows(
+            conn,
+            f"INSERT INTO totp_secrets ({_SECRET}) VALUES (?, ?, ?, ?, ?) RETURNING {_SECRET}",
+            (secret_id, user_id, rp_id, secret_encrypted, _now()),
+        )
+
+    @handles("totp.register")
+    def totp_register(self, conn, secret_id, user_id, rp_id, secret_encrypted, code_ids, code_hashes):
+        rows = self.totp_insert_secret(conn, secret_id, user_id, rp_id, secret_encrypted)
+        now = _now()
+        conn.executemany(
+            "INSERT INTO recovery_codes (id, user_id, code_hash, created_at) VALUES (?, ?, ?, ?)",
+            [(code_id, user_id, code_hash, now) for code_id, code_hash in zip(code_ids, code_hashes)],
+        )
+        return rows
+
+    @handles("totp.get_secret", readonly=True)
+    def totp_get_secret(self, conn, user_id, rp_id):
+        return _rows(conn, f"SELECT {_SECRET} FROM totp_secrets WHERE user_id = ? AND rp_id = ?", (user_id, rp_id))
+
+    @handles("totp.get_latest_secret_for_user", readonly=True)
+    def totp_get_latest_secret_for_user(self, conn, user_id):
+        return _rows(
+            conn,
+            f"SELECT {_SECRET} FROM totp_secrets WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
+            (user_id,),
+        )
+
+    @handles("totp.insert_recovery_code")
+    def totp_insert_recovery_code(self, conn, code_id, user_id, code_hash):
+        return _count(
+            conn,
+            "INSERT INTO recovery_codes (id, user_id, code_hash, created_at) VALUES (?, ?, ?, ?)",
+            (code_id, user_id, code_hash, _now()),
+        )
+
+    @handles("totp.get_unused_recovery_code", readonly=True)
+    def totp_get_unused_recovery_code(self, conn, user_id, code_hash):
+        return _rows(
+            conn,
+            """
+            SELECT id, user_id, code_hash, created_at, used_at
+            FROM recovery_codes
+            WHERE user_id = ? AND code_hash = ? AND used_at IS NULL
+            LIMIT 1
+            """,
+            (user_id, code_hash),
+        )
+
+    @handles("totp.consume_recovery_code")
+    def totp_consume_recovery_code(self, conn, code_id):
+        return _count(conn, "UPDATE recovery_codes SET used_at = ? WHERE id = ?", (_now(), code_id))
+
+    # -- device challenges -------------------------------------------------
+
+    @handles("challenges.insert_challenge")
+    def challenges_insert_challenge(self, conn, challenge_id, device_id, rp_id, nonce, expires_at):
+        return _rows(
+            conn,
+            f"INSERT INTO device_challenges ({_CHALLENGE}) VALUES (?, ?, ?, ?, ?, ?) RETURNING {_CHALLENGE}",
+            (challenge_id, device_id, rp_id, nonce, expires_at, _now()),
+        )
+
+    @handles("challenges.claim")
+    def challenges_claim(self, conn, device_id, rp_id, nonce):
+        return _rows(
+            conn,
+            f"""
+            DELETE FROM device_challenges
+            WHERE device_id = ? AND rp_id = ? AND nonce = ? AND expires_at > ?
+            RETURNING {_CHALLENGE}
+            """,
+            (device_id, rp_id, nonce, _now()),
+        )
+
+    # -- login challenges --------------------------------------------------
+
+    @handles("login_challenges.insert")
+    def login_challenges_insert(self, conn, challenge_id, user_id, device_id, rp_id, nonce, otp_hash, expires_at):
+        return _rows(
+            conn,
+            f"""
+            INSERT INTO login_challenges (id, user_id, device_id, rp_id, nonce, otp_hash, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING {_LOGIN}
+            """,
+            (challenge_id, user_id, device_id, rp_id, nonce, otp_hash, _now(), expires_at),
+        )
+
+    @handles("login_challenges.get_by_id", readonly=True)
+    def login_challenges_get_by_id(self, conn, challenge_id, created_from, created_to):
+        return _rows(
+            conn,
+            """
+            SELECT id, user_id, device_id, rp_id, nonce, otp_hash,
+                   CASE WHEN status = 'pending' AND expires_at <= ?2 THEN 'denied' ELSE status END AS status,
+                   created_at, expires_at, approved_at,
+                   CASE WHEN status = 'pending' AND expires_at <= ?2 THEN 'expired' ELSE denied_reason END AS denied_reason
+            FROM login_challenges
+            WHERE id = ?1
+            """,
+            (challenge_id, _now()),
+        )
+
+    @handles("login_challenges.get_pending_for_user", readonly=True)
+    def login_challenges_get_pending_for_user(self, conn, user_id):
+        return _rows(
+            conn,
+            f"""
+            SELECT {_LOGIN}
+            FROM login_challenges
+            WHERE user_id = ? AND status = 'pending' AND expires_at > ?
+            ORDER BY created_at DESC
+            LIMIT 1
+            """,
+            (user_id, _now()),
+        )
+
+    @handles("login_challenges.mark_approved")
+    def login_challenges_mark_approved(self, conn, challenge_id, window):
+        now = _now()
+        return _rows(
+            conn,
+            """
+            UPDATE login_challenges
+            SET status = 'approved', approved_at = ?2
+            WHERE id = ?1 AND status = 'pending' AND expires_at > ?2
+            RETURNING id
+            """,
+            (challenge_id, now),
+        )
+
+    @handles("login_challenges.mark_denied")
+    def login_challenges_mark_denied(self, conn, challenge_id, reason, created_from, created_to):
+        return _rows(
+            conn,
+            """
+            UPDATE login_challenges
+            SET status = 'denied', denied_reason = ?
+            WHERE id = ? AND status = 'pending'
+            RETURNING id
+            """,
+            (reason, challenge_id),
+        )
+
+    @handles("login_challenges.expire_batch")
+    def login_challenges_expire_batch(self, conn, limit):
+        return _count(
+            conn,
+            """
+            UPDATE login_challenges
+            SET status = 'denied', denied_reason = 'expired'
+            WHERE id IN (
+                SELECT id FROM login_challenges
+                WHERE status = 'pending' AND expires_at <= ?
+                ORDER BY expires_at
+                LIMIT ?
+            )
+            """,
+            (_now(), limit),
+        )
+
+    @handles("login_challenges.archive_batch")
+    def login_challenges_archive_batch(self, conn, before, after_created_at, after_id, limit):
+        return _rows(
+            conn,
+            f"""
+            DELETE FROM login_challenges
+            WHERE id IN (
+                SELECT id FROM login_challenges
+                WHERE status <> 'pending'
+                  AND created_at < ?1
+                  AND (created_at, id) > (?2, ?3)
+                ORDER BY created_at, id
+                LIMIT ?4
+            )
+            RETURNING {_LOGIN}
+            """,
+            (before, after_created_at, after_id, limit),
+        )
+
+    @handles("login_challenges.clear_pending_for_user")
+    def login_challenges_clear_pending_for_user(self, conn, user_id):
+        return _count(
+            conn,
+            """
+            UPDATE login_challenges
+            SET status = 'denied', denied_reason = 'user_cleared'
+            WHERE user_id = ? AND status = 'pending'
+            """,
+            (user_id,),
+        )
+
+    @handles("login_challenges.resolve_login_start", readonly=True)
+    def login_challenges_resolve_login_start(self, conn, email):
+        # Correlated subqueries pick the latest device and secret, standing in
+        # for the Postgres LATERAL joins; the outer joins keep column types.
+        return _rows(
+            conn,
+            """
+            SELECT u.id AS user_id,
+                   d.id AS device_id,
+                   s.rp_id,
+                   s.secret_encrypted,
+                   rp.id AS rp_uuid,
+                   k.id AS device_key_id
+            FROM users u
+            LEFT JOIN devices d ON d.id = (
+                SELECT id FROM devices WHERE user_id = u.id ORDER BY created_at DESC LIMIT 1
+            )
+            LEFT JOIN totp_secrets s ON s.id = (
+                SELECT id FROM totp_secrets WHERE user_id = u.id ORDER BY created_at DESC LIMIT 1
+            )
+            LEFT JOIN relying_parties rp ON rp.rp_id = s.rp_id
+            LEFT JOIN device_keys k ON k.device_id = d.id AND k.rp_id = rp.id
+            WHERE u.email = ?
+            """,
+            (email,),
+        )
+
+    @handles("login_challenges.get_approval_context", readonly=True)
+    def login_challenges_get_approval_context(
+        self, conn, challenge_id, device_id, rp_id, created_from, created_to
+    ):
+        return _rows(
+            conn,
+            """
+            SELECT c.id, c.user_id, c.device_id, c.rp_id, c.otp_hash,
+                   CASE WHEN c.status = 'pending' AND c.expires_at <= ?4 THEN 'denied' ELSE c.status END AS status,
+                   rp.id AS rp_uuid,
+                   k.key_type,
+                   k.public_key,
+                   s.secret_encrypted
+            FROM login_challenges c
+            LEFT JOIN relying_parties rp ON rp.rp_id = ?3
+            LEFT JOIN device_keys k ON k.device_id = ?2 AND k.rp_id = rp.id
+            LEFT JOIN totp_secrets s ON s.user_id = c.user_id AND s.rp_id = ?3
+            WHERE c.id = ?1
+            """,
+            (challenge_id, device_id, rp_id, _now()),
+        )
+
+
+def _settle(future: asyncio.Future, result, error: Optional[Exception]) -> None:
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
@@ -0,0 +1,58 @@
+"""Per-worker LRU of ready-to-use TOTP verifiers, keyed by ``(user_id, rp_id)``.
+
+Every verification path already reads ``secret_encrypted`` in its own
+query, so a hit skips the Fernet decrypt, the base32 decode and the HMAC key
+setup, but not the read. An entry is only reused while the stored ciphertext
+is identical to the one it was built from. Fernet tokens are freshly
+randomised on every encryption, so any change to the secret is a miss even
+without an explicit invalidation. Registration drops the entry anyway.
+
+Entries hold the keyed HMAC, not the secret text. The debug endpoints never
+go through this module.
+"""
+
+from dataclasses import dataclass
+from uuid import UUID
+
+from app.cache import MISSING, TTLCache
+from app.config import Settings
+from app.totp_service import TotpVerifier, decrypt_secret
+
+
+@dataclass(frozen=True)
+class TotpCacheConfig:
+    max_size: int = 10000
+    ttl: float = 120.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "TotpCacheConfig":
+        return cls(max_size=settings.totp_cache_size, ttl=settings.totp_cache_ttl)
+
+
+_cache = TTLCache(TotpCacheConfig.max_size, TotpCacheConfig.ttl)
+_decrypts = 0
+
+
+def configure(config: TotpCacheConfig) -> None:
+    global _cache
+    _cache = TTLCache(config.max_size, config.ttl)
+
+
+def verifier_for(user_id: UUID, rp_id: str, secret_encrypted: str, master_key: str) -> TotpVerifier:
+    """Verifier for the secret the caller just read, built only if the cached one is for other ciphertext."""
+    global _decrypts
+    cached = _cache.get((user_id, rp_id))
+    if cached is not MISSING and cached[0] == secret_encrypted:
+        return cached[1]
+    _decrypts += 1
+    verifier = TotpVerifier(decrypt_secret(secret_encrypted, master_key))
+    _cache.put((user_id, rp_id), (secret_encrypted, verifier))
+    return verifier
+
+
+def invalidate(user_id: UUID, rp_id: str) -> None:
+    _cache.pop((user_id, rp_id))
+
+
+def stats() -> dict:
+    return {**_cache.stats(), "decrypts": _decrypts}
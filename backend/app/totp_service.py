@@ -1,8 +1,13 @@
+import hashlib
+import hmac
 import secrets
-from typing import List
+import struct
+import time
+from typing import List, Optional
 from uuid import UUID
 
 import pyotp
+from pyotp.utils import strings_equal
 
 from app.crypto_utils import fernet_from_key, hash_recovery_code
 from app.repositories import totp
@@ -45,21 +50,50 @@ async def register_totp(
     secret = pyotp.random_base32()
     secret_encrypted = encrypt_secret(secret, master_key)
 
-    await totp.insert_secret(pool, user_id, rp_id, secret_encrypted)
-
     recovery_codes = generate_recovery_codes()
-    for code in recovery_codes:
-        code_hash = hash_recovery_code(code, recovery_pepper)
-        await totp.insert_recovery_code(pool, user_id, code_hash)
+    code_hashes = [hash_recovery_code(code, recovery_pepper) for code in recovery_codes]
+    await totp.register(pool, user_id, rp_id, secret_encrypted, code_hashes)
 
     otpauth_uri = build_otpauth_uri(secret, account_name, issuer)
     return otpauth_uri, recovery_codes
 
 
+class TotpVerifier:
+    """RFC 6238 check (SHA-1, 6 digits, 30 s) with the secret decoded and keyed into HMAC once.
+
+    Gives the same answers as ``pyotp.TOTP(secret).verify``, which decodes the
+    base32 secret and sets up a fresh HMAC for every code it tries.
+    """
+
+    __slots__ = ("_mac",)
+
+    digits = 6
+    interval = 30
+
+    def __init__(self, secret: str) -> None:
+        self._mac = hmac.new(pyotp.TOTP(secret).byte_secret(), digestmod=hashlib.sha1)
+
+    def at(self, counter: int) -> str:
+        mac = self._mac.copy()
+        mac.update(struct.pack(">Q", counter))
+        digest = mac.digest()
+        offset = digest[-1] & 0xF
+        code = struct.unpack(">I", digest[offset : offset + 4])[0] & 0x7FFFFFFF
+        return str(code % 10**self.digits).zfill(self.digits)
+
+    def verify(self, otp: str, valid_window: int = 2, for_time: Optional[float] = None) -> bool:
+        counter = int((time.time() if for_time is None else for_time) / self.interval)
+        otp = str(otp)
+        return any(
+            strings_equal(otp, self.at(counter + i))
+            for i in range(-valid_window, valid_window + 1)
+            if counter + i >= 0
+        )
+
+
 def verify_totp(secret: str, otp: str) -> bool:
     # Allow small clock drift between device and server.
-    totp_obj = pyotp.TOTP(secret)
-    return bool(totp_obj.verify(otp, valid_window=2))
+    return TotpVerifier(secret).verify(otp, valid_window=2)
 
 
 def current_totp(secret: str) -> str:
@@ -2,12 +2,14 @@ import secrets
 from datetime import datetime, timedelta, timezone
 from uuid import UUID
 
+from app import key_cache
 from app.crypto_utils import (
     build_device_proof_message,
     verify_ed25519_signature,
     verify_p256_signature,
+    verify_with_public_key,
 )
-from app.repositories import challenges, device_keys, relying_parties
+from app.repositories import challenges
 
 DEFAULT_TTL_SECONDS = 300
 
@@ -21,7 +23,6 @@ def expires_at(ttl_seconds: int = DEFAULT_TTL_SECONDS) -> datetime:
 
 
 async def issue_challenge(pool, device_id: UUID, rp_id: str) -> dict:
-    await challenges.prune_expired(pool)
     nonce = generate_nonce()
     challenge = await challenges.insert_challenge(
         pool=pool,
@@ -33,19 +34,8 @@ async def issue_challenge(pool, device_id: UUID, rp_id: str) -> dict:
     return challenge
 
 
-async def device_key_exists(pool, device_id: UUID, rp_id: str) -> bool:
-    rp = await relying_parties.get_by_rp_id(pool, rp_id)
-    if rp is None:
-        return False
-    row = await device_keys.get_by_device_and_rp(pool, device_id, rp.id)
-    return row is not None
-
-
-async def get_device_key(pool, device_id: UUID, rp_id: str):
-    rp = await relying_parties.get_by_rp_id(pool, rp_id)
-    if rp is None:
-        return None
-    return await device_keys.get_by_device_and_rp(pool, device_id, rp.id)
+async def get_device_key(pool, device_id: UUID, rp_id: str) -> key_cache.DeviceKey | None:
+    return await key_cache.get(pool, device_id, rp_id)
 
 
 def verify_device_proof(
@@ -57,13 +47,17 @@ def verify_device_proof(
     rp_id: str,
     otp: str,
     signature: str,
+    verifier=None,
 ) -> bool:
+    """Check the device's signature; ``verifier`` is the pre-parsed ``public_key``, if the caller has it."""
     message = build_device_proof_message(
         nonce=nonce,
         device_id=str(device_id),
         rp_id=rp_id,
         otp=otp,
     )
+    if verifier is not None:
+        return verify_with_public_key(verifier, message, signature)
     if key_type == "ed25519":
         return verify_ed25519_signature(public_key, message, signature)
     if key_type == "p256":
@@ -4,3 +4,11 @@
 \i db/migrations/003_challenges.sql
 \i db/migrations/004_login_challenges.sql
 \i db/migrations/005_login_otp_hash.sql
+\i db/migrations/006_hot_path_indexes.sql
+\i db/migrations/007_partition_challenges.sql
+\i db/migrations/008_login_challenge_archive_index.sql
+\i db/migrations/009_device_keys_unique.sql
+\i db/migrations/010_invalidation_triggers.sql
+\i db/migrations/011_device_key_invalidation.sql
+\i db/migrations/012_user_insert_invalidation.sql
+\i db/migrations/013_totp_secrets_index_slim.sql
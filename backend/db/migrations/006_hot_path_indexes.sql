@@ -0,0 +1,45 @@
+-- Indexes for the repository hot paths.
+-- Built CONCURRENTLY so they can be applied to a live database without
+-- blocking writes. CONCURRENTLY cannot run inside a transaction block, so
+-- apply this file with plain `psql -f` (not `-1` / `--single-transaction`).
+-- A build that fails part-way leaves an INVALID index that IF NOT EXISTS
+-- would skip; drop it (DROP INDEX CONCURRENTLY ...) and rerun the file.
+
+-- login_challenges.get_pending_for_user / clear_pending_for_user
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_login_challenges_pending_user
+    ON login_challenges (user_id, created_at DESC)
+    WHERE status = 'pending';
+
+-- login_challenges.prune_expired
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_login_challenges_pending_expiry
+    ON login_challenges (expires_at)
+    WHERE status = 'pending';
+
+-- totp.get_unused_recovery_code
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recovery_codes_unused
+    ON recovery_codes (user_id, code_hash)
+    WHERE used_at IS NULL;
+
+-- devices.get_latest_for_user and the device lateral in resolve_login_start
+-- (index-only for the latter).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_devices_user_latest
+    ON devices (user_id, created_at DESC)
+    INCLUDE (id);
+
+-- device_keys.get_by_device_and_rp(_id) and the key laterals in
+-- resolve_login_start / get_approval_context.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_device_keys_device_rp
+    ON device_keys (device_id, rp_id);
+
+-- totp.get_latest_secret_for_user and the secret lateral in
+-- resolve_login_start. Lookups by (user_id, rp_id) use the UNIQUE index.
+-- secret_encrypted is read from the heap: both lookups fetch a single row,
+-- and the Fernet token would make every index entry several times larger.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_totp_secrets_user_latest
+    ON totp_secrets (user_id, created_at DESC)
+    INCLUDE (rp_id);
+
+-- challenges.prune_expired. challenges.claim is served by
+-- idx_device_challenges_lookup (device_id, rp_id, expires_at).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_device_challenges_expiry
+    ON device_challenges (expires_at);
@@ -0,0 +1,112 @@
+-- Range-partition the challenge tables by created_at, one partition per UTC day.
+-- Existing rows become <table>_legacy, covering everything before tomorrow.
+-- app.partitions creates the daily partitions ahead of time and detaches and
+-- drops those past retention, so expiry is a metadata operation.
+-- There is deliberately no DEFAULT partition: creating a new partition would
+-- have to scan it. Run partition maintenance before the premade days run out.
+-- Each block is one transaction. While it builds the (id, created_at) primary
+-- key on the legacy rows, it holds an ACCESS EXCLUSIVE lock on the table.
+-- Apply it in a quiet period if the tables are large. Re-running is a no-op.
+
+DO $$
+DECLARE
+    legacy_until TIMESTAMPTZ := (date_trunc('day', NOW() AT TIME ZONE 'UTC') + INTERVAL '1 day') AT TIME ZONE 'UTC';
+    day TIMESTAMPTZ;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'device_challenges'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE device_challenges RENAME TO device_challenges_legacy;
+    -- A partition must carry the parent's (id, created_at) key, and a table
+    -- can have only one primary key, so the old (id) key is replaced.
+    ALTER TABLE device_challenges_legacy DROP CONSTRAINT device_challenges_pkey;
+    ALTER TABLE device_challenges_legacy ADD CONSTRAINT device_challenges_legacy_pkey PRIMARY KEY (id, created_at);
+    ALTER INDEX IF EXISTS idx_device_challenges_lookup RENAME TO idx_device_challenges_legacy_lookup;
+    ALTER INDEX IF EXISTS idx_device_challenges_expiry RENAME TO idx_device_challenges_legacy_expiry;
+
+    CREATE TABLE device_challenges (
+        id UUID NOT NULL,
+        device_id UUID NOT NULL REFERENCES devices(id) ON DELETE CASCADE,
+        rp_id TEXT NOT NULL,
+        nonce TEXT NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    -- Matching indexes on the legacy partition, its new primary key included,
+    -- are attached rather than rebuilt.
+    CREATE INDEX idx_device_challenges_lookup ON device_challenges (device_id, rp_id, expires_at);
+    CREATE INDEX idx_device_challenges_expiry ON device_challenges (expires_at);
+
+    EXECUTE format(
+        'ALTER TABLE device_challenges ATTACH PARTITION device_challenges_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+        legacy_until
+    );
+    FOR i IN 0..6 LOOP
+        day := legacy_until + i * INTERVAL '1 day';
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF device_challenges FOR VALUES FROM (%L) TO (%L)',
+            'device_challenges_p' || to_char(day AT TIME ZONE 'UTC', 'YYYYMMDD'),
+            day,
+            day + INTERVAL '1 day'
+        );
+    END LOOP;
+END $$;
+
+DO $$
+DECLARE
+    legacy_until TIMESTAMPTZ := (date_trunc('day', NOW() AT TIME ZONE 'UTC') + INTERVAL '1 day') AT TIME ZONE 'UTC';
+    day TIMESTAMPTZ;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'login_challenges'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE login_challenges RENAME TO login_challenges_legacy;
+    -- A partition must carry the parent's (id, created_at) key, and a table
+    -- can have only one primary key, so the old (id) key is replaced.
+    ALTER TABLE login_challenges_legacy DROP CONSTRAINT login_challenges_pkey;
+    ALTER TABLE login_challenges_legacy ADD CONSTRAINT login_challenges_legacy_pkey PRIMARY KEY (id, created_at);
+    ALTER INDEX IF EXISTS idx_login_challenges_pending_user RENAME TO idx_login_challenges_legacy_pending_user;
+    ALTER INDEX IF EXISTS idx_login_challenges_pending_expiry RENAME TO idx_login_challenges_legacy_pending_expiry;
+
+    -- otp_hash stays nullable: 005 added it without NOT NULL on older
+    -- databases, and a partition may not be looser than its parent.
+    CREATE TABLE login_challenges (
+        id UUID NOT NULL,
+        user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        device_id UUID NOT NULL REFERENCES devices(id) ON DELETE CASCADE,
+        rp_id TEXT NOT NULL,
+        nonce TEXT NOT NULL,
+        otp_hash TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        expires_at TIMESTAMPTZ NOT NULL,
+        approved_at TIMESTAMPTZ,
+        denied_reason TEXT,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    CREATE INDEX idx_login_challenges_pending_user
+        ON login_challenges (user_id, created_at DESC)
+        WHERE status = 'pending';
+    CREATE INDEX idx_login_challenges_pending_expiry
+        ON login_challenges (expires_at)
+        WHERE status = 'pending';
+
+    EXECUTE format(
+        'ALTER TABLE login_challenges ATTACH PARTITION login_challenges_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+        legacy_until
+    );
+    FOR i IN 0..6 LOOP
+        day := legacy_until + i * INTERVAL '1 day';
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF login_challenges FOR VALUES FROM (%L) TO (%L)',
+            'login_challenges_p' || to_char(day AT TIME ZONE 'UTC', 'YYYYMMDD'),
+            day,
+            day + INTERVAL '1 day'
+        );
+    END LOOP;
+END $$;
@@ -0,0 +1,39 @@
+-- Index for the login challenge archiver's keyset scan over terminal rows in
+-- (created_at, id) order.
+-- CREATE INDEX CONCURRENTLY does not work on a partitioned table. So the
+-- parent index is created ON ONLY the parent, which is instant; it stays
+-- invalid until every partition has a matching index attached. The legacy
+-- partition holds the bulk of the rows and is indexed concurrently. Daily
+-- partitions are small and are indexed in place. Partitions created later
+-- inherit the index automatically. Apply without --single-transaction.
+
+CREATE INDEX IF NOT EXISTS idx_login_challenges_terminal
+    ON ONLY login_challenges (created_at, id)
+    WHERE status <> 'pending';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_login_challenges_legacy_terminal
+    ON login_challenges_legacy (created_at, id)
+    WHERE status <> 'pending';
+
+DO $$
+DECLARE
+    part RECORD;
+    index_name TEXT;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'login_challenges'::regclass
+    LOOP
+        index_name := 'idx_' || part.relname || '_terminal';
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %I (created_at, id) WHERE status <> ''pending''',
+            index_name,
+            part.relname
+        );
+        IF NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = index_name::regclass) THEN
+            EXECUTE format('ALTER INDEX idx_login_challenges_terminal ATTACH PARTITION %I', index_name);
+        END IF;
+    END LOOP;
+END $$;
@@ -0,0 +1,30 @@
+-- One key per (device_id, rp_id), enforced by a unique constraint so rotation
+-- can use INSERT ... ON CONFLICT.
+-- Older duplicates left by racing SELECT-then-INSERT rotations are deleted,
+-- keeping the newest key. The index is built CONCURRENTLY and then promoted
+-- to a constraint, which only needs a brief lock. Apply without
+-- --single-transaction. If a rotation races the build and it fails, drop the
+-- invalid index and rerun this file.
+
+DELETE FROM device_keys k
+USING device_keys newer
+WHERE newer.device_id = k.device_id
+  AND newer.rp_id = k.rp_id
+  AND (newer.created_at, newer.id) > (k.created_at, k.id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS device_keys_device_id_rp_id_key
+    ON device_keys (device_id, rp_id);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'device_keys'::regclass AND conname = 'device_keys_device_id_rp_id_key'
+    ) THEN
+        ALTER TABLE device_keys
+            ADD CONSTRAINT device_keys_device_id_rp_id_key UNIQUE USING INDEX device_keys_device_id_rp_id_key;
+    END IF;
+END $$;
+
+-- The constraint's index serves every (device_id, rp_id) lookup 006 indexed.
+DROP INDEX CONCURRENTLY IF EXISTS idx_device_keys_device_rp;
@@ -0,0 +1,37 @@
+-- Cache invalidation events for app/invalidation.py.
+-- Each worker LISTENs on zt_invalidate and drops cached rows it is told
+-- about. The trigger argument names the table's lookup column, which is sent
+-- as "key" (and "old_key" on UPDATE, in case the key itself changed).
+-- pg_notify is transactional: listeners only hear about committed changes.
+
+CREATE OR REPLACE FUNCTION zt_notify_invalidation() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    new_row JSONB := CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE to_jsonb(NEW) END;
+    old_row JSONB := CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE to_jsonb(OLD) END;
+BEGIN
+    PERFORM pg_notify(
+        'zt_invalidate',
+        json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'id', COALESCE(new_row, old_row) ->> 'id',
+            'key', COALESCE(new_row, old_row) ->> TG_ARGV[0],
+            'old_key', old_row ->> TG_ARGV[0]
+        )::text
+    );
+    RETURN NULL;
+END;
+$$;
+
+-- The WHEN clause keeps updates that change nothing silent.
+DROP TRIGGER IF EXISTS relying_parties_invalidate ON relying_parties;
+CREATE TRIGGER relying_parties_invalidate
+    AFTER INSERT OR DELETE ON relying_parties
+    FOR EACH ROW EXECUTE FUNCTION zt_notify_invalidation('rp_id');
+
+DROP TRIGGER IF EXISTS relying_parties_invalidate_update ON relying_parties;
+CREATE TRIGGER relying_parties_invalidate_update
+    AFTER UPDATE ON relying_parties
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION zt_notify_invalidation('rp_id');
@@ -0,0 +1,41 @@
+-- Invalidation events for the per-worker device-key cache (app/key_cache.py).
+-- zt_notify_invalidation() now also sends any further trigger arguments as
+-- "extra": {column: value}. Device keys are cached per (device_id, rp_id), so
+-- their trigger sends device_id as "key" and rp_id in "extra". Deleting a
+-- device or RP cascades to device_keys, whose row triggers fire as well.
+
+CREATE OR REPLACE FUNCTION zt_notify_invalidation() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    new_row JSONB := CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE to_jsonb(NEW) END;
+    old_row JSONB := CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE to_jsonb(OLD) END;
+BEGIN
+    PERFORM pg_notify(
+        'zt_invalidate',
+        json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'id', COALESCE(new_row, old_row) ->> 'id',
+            'key', COALESCE(new_row, old_row) ->> TG_ARGV[0],
+            'old_key', old_row ->> TG_ARGV[0],
+            'extra', (
+                SELECT json_object_agg(arg, COALESCE(new_row, old_row) ->> arg)
+                FROM unnest(TG_ARGV[1:]) AS arg
+            )
+        )::text
+    );
+    RETURN NULL;
+END;
+$$;
+
+-- Rotation to an identical key is an UPDATE that changes nothing; stay silent.
+DROP TRIGGER IF EXISTS device_keys_invalidate ON device_keys;
+CREATE TRIGGER device_keys_invalidate
+    AFTER DELETE ON device_keys
+    FOR EACH ROW EXECUTE FUNCTION zt_notify_invalidation('device_id', 'rp_id');
+
+DROP TRIGGER IF EXISTS device_keys_invalidate_update ON device_keys;
+CREATE TRIGGER device_keys_invalidate_update
+    AFTER UPDATE ON device_keys
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION zt_notify_invalidation('device_id', 'rp_id');
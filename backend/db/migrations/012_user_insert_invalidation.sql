@@ -0,0 +1,47 @@
+-- Events for the per-worker email filter (app/email_filter.py).
+-- New users are announced once per statement: a single-row insert sends the
+-- email as "key", and a bulk insert (the seeder's COPY, say) sends one event
+-- without a key, on which workers rebuild instead of receiving a
+-- notification per row. Enrollment inserts with ON CONFLICT DO NOTHING and
+-- reuses an existing user without updating it. The statement trigger still
+-- fires then, but with an empty transition table, so re-enrolling stays
+-- silent. Updates notify only through users_invalidate_update below, and only
+-- when a real UPDATE changes the email.
+
+CREATE OR REPLACE FUNCTION zt_notify_users_inserted() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    inserted_count BIGINT;
+    only_email TEXT;
+BEGIN
+    SELECT count(*), min(email) INTO inserted_count, only_email FROM inserted;
+    IF inserted_count = 0 THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify(
+        'zt_invalidate',
+        json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'id', NULL,
+            'key', CASE WHEN inserted_count = 1 THEN only_email END,
+            'old_key', NULL,
+            'rows', inserted_count
+        )::text
+    );
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS users_invalidate_insert ON users;
+CREATE TRIGGER users_invalidate_insert
+    AFTER INSERT ON users
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT EXECUTE FUNCTION zt_notify_users_inserted();
+
+-- An email changed in place is a new email as far as the filter is concerned.
+DROP TRIGGER IF EXISTS users_invalidate_update ON users;
+CREATE TRIGGER users_invalidate_update
+    AFTER UPDATE ON users
+    FOR EACH ROW WHEN (OLD.email IS DISTINCT FROM NEW.email)
+    EXECUTE FUNCTION zt_notify_invalidation('email');
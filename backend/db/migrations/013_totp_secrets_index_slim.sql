@@ -0,0 +1,15 @@
+-- Rebuild idx_totp_secrets_user_latest without secret_encrypted in its
+-- INCLUDE list, for databases that applied the original 006. See 006 for why
+-- it is left out.
+-- The replacement is built CONCURRENTLY before the old index is dropped, so
+-- lookups stay indexed throughout. Apply without --single-transaction.
+-- Re-running rebuilds the index again, which is harmless. If the build fails,
+-- drop idx_totp_secrets_user_latest_new and rerun this file.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_totp_secrets_user_latest_new
+    ON totp_secrets (user_id, created_at DESC)
+    INCLUDE (rp_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_totp_secrets_user_latest;
+
+ALTER INDEX idx_totp_secrets_user_latest_new RENAME TO idx_totp_secrets_user_latest;
@@ -0,0 +1,89 @@
+-- SQLite schema for STORAGE_BACKEND=sqlite, equivalent to db/migrations 001-009.
+-- Applied by app/storage/sqlite.py on startup; every statement is idempotent.
+-- UUID and TIMESTAMPTZ are declared types the backend converts to uuid.UUID
+-- and UTC datetimes. Timestamps are stored as fixed-width UTC text, so they
+-- compare and sort chronologically. Challenge tables are not partitioned;
+-- the backend sweeps expired and old rows instead.
+
+CREATE TABLE IF NOT EXISTS users (
+    id UUID PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS devices (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    device_label TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS relying_parties (
+    id UUID PRIMARY KEY,
+    rp_id TEXT UNIQUE NOT NULL,
+    display_name TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS device_keys (
+    id UUID PRIMARY KEY,
+    device_id UUID NOT NULL REFERENCES devices(id) ON DELETE CASCADE,
+    rp_id UUID NOT NULL REFERENCES relying_parties(id) ON DELETE CASCADE,
+    key_type TEXT NOT NULL,
+    public_key TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL,
+    UNIQUE (device_id, rp_id)
+);
+
+CREATE TABLE IF NOT EXISTS totp_secrets (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    rp_id TEXT NOT NULL,
+    secret_encrypted TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL,
+    UNIQUE (user_id, rp_id)
+);
+
+CREATE TABLE IF NOT EXISTS recovery_codes (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    code_hash TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL,
+    used_at TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS device_challenges (
+    id UUID PRIMARY KEY,
+    device_id UUID NOT NULL REFERENCES devices(id) ON DELETE CASCADE,
+    rp_id TEXT NOT NULL,
+    nonce TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS login_challenges (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    device_id UUID NOT NULL REFERENCES devices(id) ON DELETE CASCADE,
+    rp_id TEXT NOT NULL,
+    nonce TEXT NOT NULL,
+    otp_hash TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    approved_at TIMESTAMPTZ,
+    denied_reason TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_devices_user_latest ON devices (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_totp_secrets_user_latest ON totp_secrets (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_recovery_codes_unused ON recovery_codes (user_id, code_hash) WHERE used_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_device_challenges_lookup ON device_challenges (device_id, rp_id, expires_at);
+CREATE INDEX IF NOT EXISTS idx_device_challenges_expiry ON device_challenges (expires_at);
+CREATE INDEX IF NOT EXISTS idx_login_challenges_pending_user
+    ON login_challenges (user_id, created_at DESC) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_login_challenges_pending_expiry
+    ON login_challenges (expires_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_login_challenges_terminal
+    ON login_challenges (created_at, id) WHERE status <> 'pending';
@@ -0,0 +1,46 @@
+"""Move terminal login challenges older than ARCHIVE_AFTER_DAYS to archive files.
+
+Usage (reads DATABASE_URL and ARCHIVE_* settings from the environment):
+
+    python scripts/archive_login_challenges.py [--pause 0.05] [--max-batches 100]
+
+Prints run statistics (rows, batches, compressed bytes, rows/s) as JSON.
+Schedule it daily, before partition maintenance drops the days it covers.
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import archive, db  # noqa: E402
+from app.config import load_settings  # noqa: E402
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = load_settings()
+    config = dataclasses.replace(
+        archive.ArchiveConfig.from_settings(settings),
+        pause=args.pause,
+        max_batches=args.max_batches,
+    )
+    db.initialize(settings.database_url, db.PoolConfig(min_size=1, max_size=1))
+    try:
+        pool = await db.connect()
+        summary = await archive.archive_login_challenges(pool, config)
+    finally:
+        await db.close()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
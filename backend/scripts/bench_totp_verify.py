@@ -0,0 +1,87 @@
+"""CPU cost of one TOTP verification, with and without the verifier cache.
+
+Usage:
+
+    python scripts/bench_totp_verify.py --users 1000 --rounds 20000
+
+Runs in-process, without a database: each round picks one of ``--users``
+encrypted secrets and verifies the current code, the way the routes do
+after their read. Three variants are timed:
+
+- ``uncached``: the path before the cache, ``decrypt_secret`` plus
+  ``verify_totp`` with a new ``Fernet`` and a new ``pyotp.TOTP`` per call.
+- ``cold``: ``totp_cache.verifier_for`` on a cache too small to hit, so
+  the cost of a miss.
+- ``cached``: ``totp_cache.verifier_for`` once every secret is cached.
+
+Codes are checked at the far edge of the drift window, so every variant
+computes all five HMACs.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from time import perf_counter
+from uuid import uuid4
+
+import pyotp
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import crypto_utils, totp_cache  # noqa: E402
+from app.totp_service import decrypt_secret, encrypt_secret, verify_totp  # noqa: E402
+
+
+def _uncached(user_id, rp_id, secret_encrypted, master_key, otp) -> bool:
+    # fernet_from_key is memoised now; clear it to measure the old cost.
+    crypto_utils.fernet_from_key.cache_clear()
+    return verify_totp(decrypt_secret(secret_encrypted, master_key), otp)
+
+
+def _via_cache(user_id, rp_id, secret_encrypted, master_key, otp) -> bool:
+    return totp_cache.verifier_for(user_id, rp_id, secret_encrypted, master_key).verify(otp)
+
+
+def _time(label: str, check, accounts, master_key, rounds: int) -> float:
+    started = perf_counter()
+    for i in range(rounds):
+        user_id, secret_encrypted, otp = accounts[i % len(accounts)]
+        if not check(user_id, "bench.example.com", secret_encrypted, master_key, otp):
+            raise SystemExit(f"{label}: verification failed")
+    per_call = (perf_counter() - started) / rounds
+    print(f"{label:<9} {per_call * 1e6:>9.1f} us/verify {1 / per_call:>10.0f} verify/s")
+    return per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    master_key = Fernet.generate_key().decode("utf-8")
+    accounts = []
+    for _ in range(args.users):
+        secret = pyotp.random_base32()
+        # Two steps back: valid, but only found on the last try of the window.
+        otp = pyotp.TOTP(secret).at(time.time() - 60)
+        accounts.append((uuid4(), encrypt_secret(secret, master_key), otp))
+
+    uncached = _time("uncached", _uncached, accounts, master_key, args.rounds)
+
+    totp_cache.configure(totp_cache.TotpCacheConfig(max_size=0))
+    cold = _time("cold", _via_cache, accounts, master_key, args.rounds)
+
+    totp_cache.configure(totp_cache.TotpCacheConfig(max_size=args.users, ttl=0))
+    for user_id, secret_encrypted, otp in accounts:
+        _via_cache(user_id, "bench.example.com", secret_encrypted, master_key, otp)
+    cached = _time("cached", _via_cache, accounts, master_key, args.rounds)
+
+    print(f"miss vs uncached: {uncached / cold:.1f}x, hit vs uncached: {uncached / cached:.1f}x")
+    print(totp_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
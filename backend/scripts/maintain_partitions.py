@@ -0,0 +1,34 @@
+"""Create upcoming challenge partitions and drop expired ones.
+
+Usage (reads DATABASE_URL and the retention settings from the environment):
+
+    python scripts/maintain_partitions.py
+
+The API also runs this on startup. Schedule it at least daily (cron, a k8s
+CronJob, ...) so premade partitions never run out on long-lived deployments.
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db, partitions  # noqa: E402
+from app.config import load_settings  # noqa: E402
+
+
+async def main() -> None:
+    settings = load_settings()
+    db.initialize(settings.database_url, db.PoolConfig(min_size=1, max_size=1))
+    try:
+        pool = await db.connect()
+        summary = await partitions.maintain(pool, partitions.PartitionPolicy.from_settings(settings))
+    finally:
+        await db.close()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
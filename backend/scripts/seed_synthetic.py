@@ -0,0 +1,211 @@
+"""Seed millions of enrolled users with binary COPY, for load testing.
+
+Usage (MASTER_KEY / RECOVERY_PEPPER must match the server under test):
+
+    python scripts/seed_synthetic.py --users 2000000 --manifest seed-manifest.jsonl
+
+Unless ``--skip-schema`` is given, pending ``db/migrations`` are applied
+first (see ``app.migrations``). Each user gets:
+
+- a device,
+- a real Ed25519 or P-256 device key for one of ``--rps`` relying parties,
+- a Fernet-encrypted TOTP secret, and
+- eight recovery codes.
+
+Worker processes generate the keys, ciphertexts and hashes in chunks. The
+main process streams every chunk into Postgres with
+``copy_records_to_table``, which uses the binary COPY protocol, over
+``--connections`` parallel connections. It writes one transaction per
+chunk, so an interrupted run leaves whole users only.
+
+The manifest is JSON lines: one per user, with the email, ids, key type,
+base64 private key (raw for Ed25519, PKCS#8 DER for P-256), base32 TOTP
+secret and plaintext recovery codes. It is what load generators need to log
+in as these users. Treat it as a secret; it is created with mode 0600.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from time import monotonic
+
+import asyncpg
+import pyotp
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import migrations  # noqa: E402
+from app.config import load_settings  # noqa: E402
+from app.crypto_utils import fernet_from_key, hash_recovery_code  # noqa: E402
+from app.ids import uuid7  # noqa: E402
+from app.totp_service import generate_recovery_codes  # noqa: E402
+
+# Parent tables first so foreign keys hold inside each chunk's transaction.
+_COLUMNS = {
+    "users": ("id", "email", "created_at"),
+    "devices": ("id", "user_id", "device_label", "platform", "created_at"),
+    "device_keys": ("id", "device_id", "rp_id", "key_type", "public_key", "created_at"),
+    "totp_secrets": ("id", "user_id", "rp_id", "secret_encrypted", "created_at"),
+    "recovery_codes": ("id", "user_id", "code_hash", "created_at", "used_at"),
+}
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _device_key(key_type: str) -> tuple[str, str]:
+    """Return (public_key, private_key) in the formats enrollment and the load generators use."""
+    if key_type == "p256":
+        private = ec.generate_private_key(ec.SECP256R1())
+        public = private.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        private_bytes = private.private_bytes(
+            serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        return _b64(public), _b64(private_bytes)
+    private = Ed25519PrivateKey.generate()
+    public = private.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    private_bytes = private.private_bytes(
+        serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+    )
+    return _b64(public), _b64(private_bytes)
+
+
+def _generate_chunk(task: dict) -> tuple[dict, list[dict]]:
+    """Worker process: build COPY records and manifest entries for one chunk of users."""
+    fernet = fernet_from_key(task["master_key"])
+    rng = random.Random(task["start"])
+    now = datetime.now(timezone.utc)
+    records = {table: [] for table in _COLUMNS}
+    manifest = []
+    for i in range(task["start"], task["start"] + task["count"]):
+        user_id, device_id = uuid7(), uuid7()
+        email = f"load{i}@{task['domain']}"
+        rp_uuid, rp_id = task["rps"][i % len(task["rps"])]
+        key_type = "p256" if rng.random() < task["p256_share"] else "ed25519"
+        public_key, private_key = _device_key(key_type)
+        secret = pyotp.random_base32()
+        secret_encrypted = fernet.encrypt(secret.encode("utf-8")).decode("utf-8")
+        codes = generate_recovery_codes()
+
+        records["users"].append((user_id, email, now))
+        records["devices"].append((device_id, user_id, "load device", "android", now))
+        records["device_keys"].append((uuid7(), device_id, rp_uuid, key_type, public_key, now))
+        records["totp_secrets"].append((uuid7(), user_id, rp_id, secret_encrypted, now))
+        records["recovery_codes"].extend(
+            (uuid7(), user_id, hash_recovery_code(code, task["pepper"]), now, None) for code in codes
+        )
+        manifest.append(
+            {
+                "email": email,
+                "user_id": str(user_id),
+                "device_id": str(device_id),
+                "rp_id": rp_id,
+                "key_type": key_type,
+                "private_key": private_key,
+                "totp_secret": secret,
+                "recovery_codes": codes,
+            }
+        )
+    return records, manifest
+
+
+async def _ensure_rps(conn: asyncpg.Connection, count: int, domain: str) -> list[tuple]:
+    rp_ids = [f"rp{n}.{domain}" for n in range(1, count + 1)]
+    await conn.executemany(
+        "INSERT INTO relying_parties (id, rp_id, display_name) VALUES ($1, $2, $3) ON CONFLICT (rp_id) DO NOTHING",
+        [(uuid7(), rp_id, f"Load RP {n}") for n, rp_id in enumerate(rp_ids, start=1)],
+    )
+    rows = await conn.fetch("SELECT id, rp_id FROM relying_parties WHERE rp_id = ANY($1::text[])", rp_ids)
+    return [(row["id"], row["rp_id"]) for row in rows]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", help="defaults to DATABASE_URL")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--start-index", type=int, default=0, help="first N in load<N>@domain; lets runs append")
+    parser.add_argument("--rps", type=int, default=100)
+    parser.add_argument("--domain", default="load.test")
+    parser.add_argument("--p256-share", type=float, default=0.5)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--manifest", default="seed-manifest.jsonl")
+    parser.add_argument("--skip-schema", action="store_true")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    dsn = args.dsn or settings.database_url
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        if not args.skip_schema:
+            applied = await migrations.apply(conn)
+            print(f"migrations applied: {', '.join(applied) or 'none pending'}")
+        rps = await _ensure_rps(conn, args.rps, args.domain)
+    finally:
+        await conn.close()
+
+    tasks = [
+        {
+            "start": start,
+            "count": min(args.chunk_size, args.start_index + args.users - start),
+            "rps": rps,
+            "domain": args.domain,
+            "p256_share": args.p256_share,
+            "master_key": settings.master_key,
+            "pepper": settings.recovery_pepper,
+        }
+        for start in range(args.start_index, args.start_index + args.users, args.chunk_size)
+    ]
+
+    pool = await asyncpg.create_pool(dsn, min_size=args.connections, max_size=args.connections)
+    loop = asyncio.get_running_loop()
+    # Bounds chunks held in memory: enough to keep workers and COPYs busy.
+    in_flight = asyncio.Semaphore(args.workers + args.connections)
+    seeded = 0
+    started = monotonic()
+    fd = os.open(args.manifest, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor, os.fdopen(fd, "a") as manifest:
+
+            async def run(task: dict) -> None:
+                nonlocal seeded
+                async with in_flight:
+                    records, entries = await loop.run_in_executor(executor, _generate_chunk, task)
+                    async with pool.acquire() as copy_conn:
+                        async with copy_conn.transaction():
+                            for table, columns in _COLUMNS.items():
+                                await copy_conn.copy_records_to_table(
+                                    table, records=records[table], columns=columns
+                                )
+                    manifest.writelines(json.dumps(entry) + "\n" for entry in entries)
+                    seeded += task["count"]
+                    elapsed = monotonic() - started
+                    print(f"seeded {seeded}/{args.users} users ({seeded / elapsed:.0f}/s)", flush=True)
+
+            await asyncio.gather(*(run(task) for task in tasks))
+        async with pool.acquire() as analyze_conn:
+            await analyze_conn.execute("ANALYZE")
+    finally:
+        await pool.close()
+
+    elapsed = monotonic() - started
+    print(f"done: {seeded} users in {elapsed:.1f}s ({seeded / elapsed:.0f}/s), manifest {args.manifest}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())